@@ -0,0 +1,22 @@
+import sys
+
+import scraper_schedule_of_classes.conflicts as conflicts
+
+
+if __name__ == "__main__":
+
+    snapshot_path = "quarter.snapshot"
+    conflict_index_path = "quarter.conflicts.npz"
+
+    argv = sys.argv
+    if len(argv) < 3:
+        print(f"Snapshot or output path not specified. Using {snapshot_path} "
+            f"and {conflict_index_path}")
+    else:
+        snapshot_path = argv[1]
+        conflict_index_path = argv[2]
+
+    indexes = conflicts.write_conflict_index(snapshot_path, conflict_index_path)
+    for quarter_code, index in indexes.items():
+        path = conflicts.conflict_index_path(conflict_index_path, quarter_code, len(indexes))
+        print(f"{quarter_code}: {index.num_options} options, conflict index written to {path}")
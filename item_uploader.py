@@ -1,16 +1,33 @@
 import concurrent.futures
 import json
+import multiprocessing
+import os
 import pickle
+import sys
+import time
 import traceback
 
 
 from itemadapter import ItemAdapter
 
 
+from scraper_schedule_of_classes import utils
 from scraper_schedule_of_classes.db.db import DataAccess
+from scraper_schedule_of_classes.db.seat_changes import SeatChangeTracker, make_publisher
+from scraper_schedule_of_classes.itemfeed import is_item_feed, read_item_feed, \
+    read_index, read_blocks, subject_blocks
 
 
-def loadall(fn):
+def loadall(fn, subject_codes=None):
+    """
+    Items of a pickle feed, or of an indexed item feed (ITEM_FEED_PATH).
+    Only the items of subject_codes are read from an item feed, if given.
+    """
+    if is_item_feed(fn):
+        return read_item_feed(fn, subject_codes)
+    if subject_codes is not None:
+        raise ValueError(f"{fn} is not an item feed, it can't be read by subject")
+
     items = []
     with open(fn, 'rb') as items_f:
         while True:
@@ -21,43 +38,305 @@ def loadall(fn):
     return items
 
 
-# Single thread item saver.
-def save_items(items):
+# Items saved in one transaction, at most, and milliseconds a transaction
+# stays open before it is committed.
+GROUP_COMMIT_ITEMS = 500
+GROUP_COMMIT_MS = 1000
+
+
+def item_key(item):
+    return " ".join(str(item.get(field)) for field in
+        ("quarter_code", "subj_code", "number", "section_group_code"))
 
+
+# Single thread item saver.
+def save_items(items, commit_items=GROUP_COMMIT_ITEMS, commit_ms=GROUP_COMMIT_MS):
+    """
+    Save items, committing every commit_items items or commit_ms
+    milliseconds. Each item is inserted under a savepoint, so one that
+    fails is rolled back alone, and the rest of its transaction is still
+    committed. Items that failed are tried again once the others are
+    committed, each in its own transaction. Returns the items that failed
+    again, as (item key, error, traceback).
+    """
     conn = DataAccess.get_conn()
+    failed_items = []
+
+    # Items in the open transaction, and when it began.
+    num_uncommitted = 0
+    transaction_start = time.monotonic()
 
     for item in items:
+        DataAccess.savepoint(conn, "item", release=num_uncommitted > 0)
+        try:
+            DataAccess.insert_section_group_all_info(conn, ItemAdapter(item))
+        except Exception:
+            DataAccess.rollback_to_savepoint(conn, "item")
+            failed_items.append(item)
+
+        num_uncommitted += 1
+        if (num_uncommitted >= commit_items or
+                (time.monotonic() - transaction_start) * 1000 >= commit_ms):
+            conn.commit()
+            num_uncommitted = 0
+            transaction_start = time.monotonic()
+
+    conn.commit()
+
+    # An item may only have failed because another connection was inserting
+    # its course or course offering: the insert waits for that transaction,
+    # then doesn't see its row. Committed by now, it's found on a new try.
+    failures = []
+    for item in failed_items:
         try:
             with conn:
                 DataAccess.insert_section_group_all_info(conn, ItemAdapter(item))
         except Exception as e:
-            print(f'could not insert:')
-            print(item)
-            print(e)
-            traceback.print_exc()
-    
+            failures.append((item_key(item), str(e), traceback.format_exc()))
+
     DataAccess.put_conn(conn)
+    return failures
 
 
-if __name__ == '__main__':
-    items = loadall('items.pickle')
+def course_key(item):
+    return (str(item.get("subj_code")), str(item.get("number")))
 
-    conn = DataAccess.get_conn()
-    with conn:
-        DataAccess.reset_for_scrape(conn)
-    DataAccess.put_conn(conn)
-    
-    chunk_size = int(len(items) / 20)
+
+def course_chunks(items, num_chunks):
+    """
+    items sorted by course and cut into about num_chunks chunks of about
+    the same size, only between courses, so that no two chunks insert the
+    same course.
+    """
+    items = sorted(items, key=lambda item: course_key(item) + (str(item.get("quarter_code")), ))
+    chunk_size = max(1, -(-len(items) // num_chunks))
+    chunks = []
+    chunk = []
+    for item in items:
+        if len(chunk) >= chunk_size and course_key(item) != course_key(chunk[-1]):
+            chunks.append(chunk)
+            chunk = []
+        chunk.append(item)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def upload_items(items, num_threads=20, commit_items=GROUP_COMMIT_ITEMS,
+        commit_ms=GROUP_COMMIT_MS):
+    """
+    Save items in num_threads threads, each with its own connection and
+    an even share of the items, whole courses. Returns the items that
+    failed, like save_items.
+    """
     futures = []
-    i = 0
-    with concurrent.futures.ThreadPoolExecutor(20) as exec:
+    failures = []
+    with concurrent.futures.ThreadPoolExecutor(num_threads) as exec:
         # Dispatch all threads
-        while i < len(items):
-            chunk = items[i:i+chunk_size]
-            new_future = exec.submit(save_items, chunk)
+        for chunk in course_chunks(items, num_threads):
+            new_future = exec.submit(save_items, chunk, commit_items, commit_ms)
             futures.append(new_future)
-            i += chunk_size
         for i, future in enumerate(concurrent.futures.as_completed(futures)):
-            future.result()
+            failures.extend(future.result())
+    return failures
+
+
+def feed_work_units(blocks):
+    """
+    The blocks of an item feed grouped by subject, the work units of
+    upload_feed. Largest subjects first, so the last units handed out are
+    small ones.
+    """
+    units = {}
+    for block in blocks:
+        units.setdefault((block["quarter_code"], block["subj_code"]), []).append(block)
+    return sorted(units.values(), key=lambda unit: -sum(block["length"] for block in unit))
+
+
+def seat_item(item):
+    """
+    The part of an item SeatChangeTracker.observe reads.
+    """
+    return {
+        "quarter_code": item.get("quarter_code"),
+        "subj_code": item.get("subj_code"),
+        "number": item.get("number"),
+        "section_group_code": item.get("section_group_code"),
+        "section_meetings": [
+            {"number": meeting.get("number"), "seats_avail": meeting.get("seats_avail")}
+            for meeting in item.get("section_meetings") or []
+        ],
+    }
+
+
+def upload_unit(feed_path, blocks, commit_items, commit_ms):
+    """
+    Worker process of upload_feed: decode one work unit of the feed and
+    save its items on the process's own connection. Returns the number of
+    items, the items that failed and the seat items of the unit.
+    """
+    items = read_blocks(feed_path, blocks)
+    failures = save_items(items, commit_items, commit_ms)
+    return len(items), failures, [seat_item(item) for item in items]
+
+
+def upload_feed(feed_path, blocks, num_processes=None, commit_items=GROUP_COMMIT_ITEMS,
+        commit_ms=GROUP_COMMIT_MS, seat_changes=None):
+    """
+    Save the items of the given blocks of an item feed with num_processes
+    worker processes (one per cpu by default), one subject at a time.
+    Workers read and decode their subjects from the feed themselves, and
+    have their own connection.
+
+    Progress is printed as subjects are done. A subject whose worker fails
+    (can't read the feed, loses its connection) is one failure, keyed by
+    the subject, and the other subjects go on. Seat changes are observed
+    by seat_changes, if given. Returns the number of items uploaded and
+    the failures, like save_items.
+    """
+    units = feed_work_units(blocks)
+    total_items = sum(block["num_items"] for block in blocks)
+    num_processes = min(num_processes or os.cpu_count(), max(1, len(units)))
+
+    num_done = 0
+    num_uploaded = 0
+    failures = []
+    start = time.monotonic()
+    # Workers are spawned, not forked: a forked worker would share the
+    # connections of the parent's pool, opened when DataAccess is imported.
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(num_processes, mp_context=context) as exec:
+        futures = {
+            exec.submit(upload_unit, feed_path, unit, commit_items, commit_ms): unit
+            for unit in units
+        }
+        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            unit = futures[future]
+            num_done += sum(block["num_items"] for block in unit)
+            try:
+                unit_items, unit_failures, seat_items = future.result()
+            except Exception as e:
+                failures.append((f"{unit[0]['quarter_code']} {unit[0]['subj_code']}",
+                    str(e), traceback.format_exc()))
+            else:
+                num_uploaded += unit_items - len(unit_failures)
+                failures.extend(unit_failures)
+                if seat_changes is not None:
+                    for item in seat_items:
+                        seat_changes.observe(item)
+
+            elapsed = time.monotonic() - start
+            print(f"[{i + 1}/{len(units)} subjects] {num_done}/{total_items} items, "
+                f"{num_done - num_uploaded} failed, {num_done / max(elapsed, 1e-9):.0f} items/s")
+    return num_uploaded, failures
+
+
+def shard_subject_codes(conn, quarter_codes, shard):
+    """
+    Subjects of a shard, given like to run_courses_spider.py: "i/N", from
+    the plan of the quarters in the database, or a comma separated list of
+    subjects.
+    """
+    if "/" in shard:
+        if not quarter_codes:
+            return []
+        # The plan of a crawl of several quarters is saved for each.
+        return utils.read_shard_plan(conn, min(quarter_codes), shard)
+    return [code.strip() for code in shard.split(",") if code.strip()]
+
+
+def reset_subjects(conn, quarter_codes, subject_codes):
+    """
+    Reset only the given subjects, those of a shard or those uploaded
+    again, so shards uploaded separately don't erase each other. All of
+    them, not just the ones with items: a subject that has none anymore
+    must not keep the rows of the last upload.
+    """
+    for quarter_code in quarter_codes:
+        DataAccess.reset_subjects_for_scrape(conn, quarter_code, subject_codes)
+
+
+if __name__ == '__main__':
+    # item_uploader.py [items file] [--partial=<shard>] [--subjects=CSE,MATH]
+    #     [--processes[=N]] [--commit-items=N] [--commit-ms=T]
+    # The items file is items.pickle, or an item feed (ITEM_FEED_PATH).
+    # --partial=<shard>: the file is one shard of a quarter, "i/N" or a list
+    # of subjects like given to run_courses_spider.py. Only clear the
+    # subjects of the shard.
+    # --subjects: upload only these subjects of an item feed, again, and
+    # only clear them.
+    # --processes: upload an item feed with N worker processes (one per
+    # cpu by default) instead of threads, a subject at a time.
+    # --commit-items, --commit-ms: commit every N items or T milliseconds,
+    # --commit-items=1 for a transaction per item.
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = dict(arg[2:].partition("=")[::2] for arg in sys.argv[1:] if arg.startswith("--"))
+    subject_codes = options["subjects"].split(",") if options.get("subjects") else None
+    if "partial" in options and not options["partial"]:
+        sys.exit("--partial needs the shard: --partial=i/N or --partial=CSE,MATH")
+    commit_items = int(options.get("commit-items") or GROUP_COMMIT_ITEMS)
+    commit_ms = float(options.get("commit-ms") or GROUP_COMMIT_MS)
+    use_processes = "processes" in options
+    num_processes = int(options.get("processes") or 0) or None
+    items_fn = args[0] if args else 'items.pickle'
+
+    if use_processes:
+        # Items are only decoded by the workers. Blocks have the quarter
+        # and subject codes, like items, for resetting.
+        items = read_index(items_fn)
+        if subject_codes is not None:
+            items = subject_blocks(items, subject_codes)
+    else:
+        items = loadall(items_fn, subject_codes)
+
+    # Quarters of the whole file, even those with no items of the subjects
+    # being reset.
+    if is_item_feed(items_fn):
+        quarter_codes = {block["quarter_code"] for block in read_index(items_fn)}
+    else:
+        quarter_codes = {item.get("quarter_code") for item in items}
+
+    # Seat changes against the last upload, published once this one is in.
+    seat_changes = SeatChangeTracker(make_publisher())
+    conn = DataAccess.get_conn()
+    with conn:
+        seat_changes.load(conn, quarter_codes)
+
+    # Subjects to clear before the upload, or all of them.
+    reset_subject_codes = subject_codes
+    if reset_subject_codes is None and options.get("partial"):
+        with conn:
+            reset_subject_codes = shard_subject_codes(conn, quarter_codes, options["partial"])
+
+    with conn:
+        if reset_subject_codes is not None:
+            reset_subjects(conn, quarter_codes, reset_subject_codes)
+        else:
+            DataAccess.reset_for_scrape(conn)
+    DataAccess.put_conn(conn)
+
+    if use_processes:
+        num_items = sum(block["num_items"] for block in items)
+        num_uploaded, failures = upload_feed(items_fn, items, num_processes,
+            commit_items, commit_ms, seat_changes)
+    else:
+        for item in items:
+            seat_changes.observe(item)
+        num_items = len(items)
+        failures = upload_items(items, commit_items=commit_items, commit_ms=commit_ms)
+        num_uploaded = num_items - len(failures)
+
+    for (key, error, trace) in failures:
+        print(f"could not insert {key}: {error}")
+        print(trace)
+    print(f"{num_uploaded} of {num_items} items uploaded")
+
+    # Readers caching schedules see the upload is done.
+    conn = DataAccess.get_conn()
+    with conn:
+        num_changes = seat_changes.flush(conn)
+        DataAccess.bump_upload_generation(conn)
+    DataAccess.put_conn(conn)
+    print(f"{num_changes} seat changes published")
 
     DataAccess.close()
\ No newline at end of file
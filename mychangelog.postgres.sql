@@ -87,3 +87,140 @@ create table if not exists dated_meeting (
 	date_ varchar(10)
 );
 -- rollback drop table if exists dated_meeting;
+
+-- changeset GerardLlanes:AddEncodedDaysTimesToMeeting
+-- days_mask: bit 0 Monday ... bit 5 Saturday, bit 6 Sunday.
+-- start_minute/end_minute: minutes since midnight.
+-- Two meetings conflict when (a.days_mask & b.days_mask) <> 0
+-- and a.start_minute < b.end_minute and b.start_minute < a.end_minute.
+alter table meeting
+add column days_mask smallint not null default 0,
+add column start_minute smallint,
+add column end_minute smallint;
+
+update meeting set
+	days_mask =
+		(case when days like '%M%' then 1 else 0 end) |
+		(case when days like '%Tu%' then 2 else 0 end) |
+		(case when days like '%W%' then 4 else 0 end) |
+		(case when days like '%Th%' then 8 else 0 end) |
+		(case when days like '%F%' then 16 else 0 end) |
+		(case when days ~ 'S(a|[^u]|$)' then 32 else 0 end) |
+		(case when days like '%Su%' then 64 else 0 end),
+	start_minute = extract(hour from start_time) * 60 + extract(minute from start_time),
+	end_minute = extract(hour from end_time) * 60 + extract(minute from end_time);
+-- rollback alter table meeting drop column days_mask, drop column start_minute, drop column end_minute;
+
+-- changeset GerardLlanes:CreateSubjectCrawlStatsTable
+create table if not exists subject_crawl_stats (
+	id serial primary key,
+	subject_id integer not null unique references subject (id),
+	num_pages integer not null,
+	duration_secs real,
+	updated_at timestamp not null default now()
+);
+-- rollback drop table if exists subject_crawl_stats;
+
+-- changeset GerardLlanes:CreateUploadGenerationTable
+-- Single row, bumped after every upload so cached schedules can be invalidated.
+create table if not exists upload_generation (
+	id smallint primary key default 1 check (id = 1),
+	generation bigint not null default 0,
+	updated_at timestamp not null default now()
+);
+insert into upload_generation (id) values (1) on conflict do nothing;
+-- rollback drop table if exists upload_generation;
+
+-- changeset GerardLlanes:AddMeetingForeignKeyIndexes
+-- For reading section groups with all their meetings.
+create index if not exists meeting_section_group_id_idx on meeting (section_group_id);
+create index if not exists section_meeting_meeting_id_idx on section_meeting (meeting_id);
+create index if not exists general_meeting_meeting_id_idx on general_meeting (meeting_id);
+create index if not exists dated_meeting_meeting_id_idx on dated_meeting (meeting_id);
+-- rollback drop index if exists meeting_section_group_id_idx, section_meeting_meeting_id_idx, general_meeting_meeting_id_idx, dated_meeting_meeting_id_idx;
+
+-- changeset GerardLlanes:CreateSectionGroupSearchTable
+-- Search document per section group: "<subject> <number> <title> <instructor>",
+-- lowercased, words separated by single spaces (DataAccess.search_document).
+-- Trigram index for word similarity, and a prefix index on the course code.
+create extension if not exists pg_trgm;
+
+create table if not exists section_group_search (
+	section_group_id integer primary key references section_group (id),
+	quarter_id integer not null references quarter (id),
+	course_code varchar(16) not null,
+	document text not null
+);
+create index if not exists section_group_search_document_idx
+	on section_group_search using gin (document gin_trgm_ops);
+create index if not exists section_group_search_course_code_idx
+	on section_group_search (quarter_id, course_code text_pattern_ops);
+
+insert into section_group_search (section_group_id, quarter_id, course_code, document)
+select section_group.id, course_offering.quarter_id,
+	trim(regexp_replace(lower(subject.code || ' ' || course.number_), '[^0-9a-z]+', ' ', 'g')),
+	trim(regexp_replace(lower(concat_ws(' ', subject.code, course.number_, course.title,
+		section_group.instructor)), '[^0-9a-z]+', ' ', 'g'))
+from section_group
+join course_offering on course_offering.id = section_group.course_offering_id
+join course on course.id = course_offering.course_id
+join subject on subject.id = course.subject_id
+on conflict (section_group_id) do nothing;
+-- rollback drop table if exists section_group_search;
+
+-- changeset GerardLlanes:CreateSectionSeatsTable
+-- Last known seats of every section meeting, kept across resets so uploads
+-- can publish seat changes (db/seat_changes.py).
+create table if not exists section_seats (
+	quarter_code char(4) not null,
+	subject_code varchar(4) not null,
+	course_number varchar(8) not null,
+	section_number char(3) not null,
+	seats_available integer,
+	updated_at timestamp not null default now(),
+	primary key (quarter_code, subject_code, course_number, section_number)
+);
+-- rollback drop table if exists section_seats;
+
+-- changeset GerardLlanes:CreateSeatHistoryTable
+-- Seats of every section meeting over time, in chunks of points packed as
+-- deltas (db/seat_history.py). Times are unix seconds. Chunks are looked up
+-- by section and first time, and scanned by time with the brin index.
+create table if not exists seat_history (
+	quarter_code char(4) not null,
+	subject_code varchar(4) not null,
+	course_number varchar(8) not null,
+	section_number char(3) not null,
+	first_time bigint not null,
+	last_time bigint not null,
+	last_seats integer,
+	num_points integer not null,
+	points bytea not null,
+	primary key (quarter_code, subject_code, course_number, section_number, first_time)
+);
+create index if not exists seat_history_last_time_idx on seat_history using brin (last_time);
+-- rollback drop table if exists seat_history;
+
+-- changeset GerardLlanes:AddScrapeTimes
+-- A quarter is scraped over the rows of its previous scrape: section groups
+-- are stamped when scraped, and once the scrape is complete the ones older
+-- than its start are deleted.
+alter table quarter
+add column scrape_started_at timestamp;
+alter table section_group
+add column scraped_at timestamp not null default now();
+-- rollback alter table quarter drop column scrape_started_at; alter table section_group drop column scraped_at;
+
+-- changeset GerardLlanes:CreateShardPlanTable
+-- Subjects of every shard of a sharded crawl into num_shards shards, split
+-- once (run_courses_spider.py --plan-shards=N) for all the workers,
+-- wherever they run.
+create table if not exists shard_plan (
+	quarter_code char(4) not null,
+	num_shards integer not null,
+	shard_index integer not null,
+	subject_codes varchar(4)[] not null,
+	created_at timestamp not null default now(),
+	primary key (quarter_code, num_shards, shard_index)
+);
+-- rollback drop table if exists shard_plan;
@@ -0,0 +1,99 @@
+import sys
+import traceback
+
+from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem
+
+from scraper_schedule_of_classes.db.db import DataAccess
+from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+from scraper_schedule_of_classes.quarantine import read_quarantine, write_quarantine, \
+    row_tags, REASON_DROPPED
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+
+
+class QuarantineCollector:
+    """
+    Stands in for QuarantineExtension while parsing again: keeps the
+    groups that still fail.
+    """
+
+    def __init__(self):
+        self.groups = []
+
+    def add(self, group, reason, error=None):
+        self.groups.append(dict(group, reason=reason,
+            error=str(error) if error is not None else None))
+
+
+def reparse_group(spider, cleaner, group):
+    """
+    Parse a quarantined group with the current parser. Returns the item
+    ready for upload, if any, and the group to keep quarantined if it
+    still fails.
+    """
+    collector = QuarantineCollector()
+    spider.quarantine = collector
+    item = spider.build_item_from_group(row_tags(group["rows"]), group["subject_code"],
+        group["quarter_code"], group.get("page_num"))
+    still_failing = collector.groups[0] if collector.groups else None
+    if item is None:
+        return None, still_failing
+
+    try:
+        item = cleaner.process_item(item, spider)
+    except DropItem as e:
+        return None, dict(group, reason=REASON_DROPPED, error=str(e))
+    return item, still_failing
+
+
+if __name__ == '__main__':
+    # reparse_quarantine.py [quarantine file] [--dry-run]
+    # Parse the quarantined row groups again (see quarantine.py), upload
+    # the items that now parse, and keep only the groups that still fail.
+    # --dry-run: only report, nothing is uploaded or removed.
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    dry_run = "--dry-run" in sys.argv[1:]
+    quarantine_fn = args[0] if args else 'quarantine.jsonl.gz'
+
+    groups = read_quarantine(quarantine_fn)
+    if not groups:
+        print(f"nothing quarantined in {quarantine_fn}")
+        sys.exit(0)
+
+    spider = SubjectCoursesSpider(groups[0]["quarter_code"], subject_codes=[])
+    cleaner = CourseCleanerPipeline()
+
+    conn = DataAccess.get_conn()
+    remaining = []
+    num_uploaded = 0
+    for group in groups:
+        item, still_failing = reparse_group(spider, cleaner, group)
+        if still_failing is not None:
+            remaining.append(still_failing)
+        if item is None or dry_run:
+            continue
+
+        # Replace whatever part of the section group made it in before.
+        try:
+            with conn:
+                DataAccess.replace_section_group_all_info(conn, ItemAdapter(item))
+            num_uploaded += 1
+        except Exception as e:
+            print(f'could not insert:')
+            print(item)
+            print(e)
+            traceback.print_exc()
+            if still_failing is None:
+                remaining.append(group)
+
+    if num_uploaded:
+        # Readers caching schedules see the new section groups.
+        with conn:
+            DataAccess.bump_upload_generation(conn)
+    DataAccess.put_conn(conn)
+    DataAccess.close()
+
+    print(f"{len(groups) - len(remaining)} of {len(groups)} quarantined groups now parse, "
+        f"{num_uploaded} uploaded, {len(remaining)} still quarantined")
+    if not dry_run:
+        write_quarantine(quarantine_fn, remaining)
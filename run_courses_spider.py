@@ -3,6 +3,7 @@ import sys
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 
+from scraper_schedule_of_classes import utils
 from scraper_schedule_of_classes.db.db import DataAccess
 from scraper_schedule_of_classes.spiders.subjects_spider import SubjectsSpider
 from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
@@ -10,19 +11,76 @@ from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCo
 settings = get_project_settings().copy()
 settings.set("LOG_FILE", "courses_spider_out")
 
-process = CrawlerProcess(settings)
+
+def plan_shards(quarter_codes, num_shards):
+    """
+    Split all subjects between num_shards workers, by the page counts of
+    the previous crawl, and save the split in the database for the
+    workers, and item_uploader.py, to read.
+    """
+    conn = DataAccess.get_conn()
+    with conn:
+        subject_codes = DataAccess.get_all_subjects(conn)
+        page_counts = DataAccess.get_subject_page_counts(conn)
+        shards = utils.shard_subjects(subject_codes, page_counts, num_shards)
+        for quarter_code in quarter_codes:
+            DataAccess.save_shard_plan(conn, quarter_code, shards)
+    DataAccess.put_conn(conn)
+
+    for shard_index, shard in enumerate(shards):
+        print(f"shard {shard_index}/{num_shards}: {','.join(shard)}")
 
 
 if __name__ == "__main__":
     
+    # run_courses_spider.py [quarter] [shard]
+    # run_courses_spider.py [quarter] --plan-shards=N
+    # Several quarters can be crawled together: "SP21,FA21"
     quarter_code = "SP21"
+    # Either "i/N" (shard i of N), or a comma separated list of subjects.
+    # "i/N" shards are split once, beforehand, with --plan-shards=N, and
+    # the plan is kept in the database for workers on any machine. Workers
+    # that can't reach it get the subject list of their shard, printed by
+    # --plan-shards.
+    shard = None
 
-    argv = sys.argv
+    options = dict(arg[2:].partition("=")[::2] for arg in sys.argv[1:] if arg.startswith("--"))
+    argv = [arg for arg in sys.argv if not arg.startswith("--")]
     if len(argv) < 2:
         print("No quarter specified. Getting course info for "
             f"{quarter_code}")
     else: 
         quarter_code = argv[1]
+    if len(argv) >= 3:
+        shard = argv[2]
+
+    if options.get("plan-shards"):
+        plan_shards([code.strip() for code in quarter_code.split(",") if code.strip()],
+            int(options["plan-shards"]))
+        DataAccess.close()
+        sys.exit(0)
+
+    spider_kwargs = dict(quarter_code = quarter_code)
+    if shard:
+        if "/" in shard:
+            spider_kwargs["shard"] = shard
+            shard_name = shard.replace("/", "of")
+        else:
+            spider_kwargs["subject_codes"] = shard
+            shard_name = shard.replace(",", "-")
+
+        # One items file per shard, uploaded with
+        # item_uploader.py <items file> --partial=<shard>.
+        settings.set("LOG_FILE", f"courses_spider_out.{shard_name}")
+        settings.set("FEEDS", {
+            f"items.{shard_name}.pickle": {
+                "format": "pickle",
+                "overwrite": True
+            }
+        })
+        if settings.get("ITEM_FEED_PATH"):
+            settings.set("ITEM_FEED_PATH", f"items.{shard_name}.feed")
 
-    process.crawl(SubjectCoursesSpider, quarter_code = quarter_code)
-    process.start()
\ No newline at end of file
+    process = CrawlerProcess(settings)
+    process.crawl(SubjectCoursesSpider, **spider_kwargs)
+    process.start()
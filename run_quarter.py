@@ -0,0 +1,114 @@
+import sys
+
+from scrapy import signals
+from scrapy.crawler import CrawlerRunner
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from twisted.internet import defer, reactor
+
+from scraper_schedule_of_classes.checkpoint import load_resumable
+from scraper_schedule_of_classes.db.db import DataAccess
+from scraper_schedule_of_classes.spiders.subjects_spider import SubjectsSpider
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+import scraper_schedule_of_classes.errors as errors
+
+# Subjects, courses and upload in a single process: the subject list is
+# handed to the courses spider in memory, and course items are inserted
+# as they are scraped instead of going through items.pickle.
+settings = get_project_settings().copy()
+settings.set("LOG_FILE", "quarter_out")
+settings.set("FEEDS", {})
+settings.set("DATABASE_UPLOAD", True)
+
+
+@defer.inlineCallbacks
+def crawl_quarters(runner, quarter_codes, quarter_names):
+
+    # The previous run ran out of time: its items are already in the
+    # database, only crawl what's left.
+    checkpoint = load_resumable(settings.get("CRAWL_CHECKPOINT_PATH"))
+    if checkpoint is not None:
+        yield crawl_courses(runner, quarter_codes, checkpoint.subject_codes)
+        return
+
+    # Insert the quarters. The previous scrape stays readable while this
+    # one is written over it, and is only cleared of what this one didn't
+    # find once it is complete.
+    conn = DataAccess.get_conn()
+    with conn:
+        for quarter_code, quarter_name in zip(quarter_codes, quarter_names):
+            DataAccess.insert_quarter(conn, quarter_code, quarter_name)
+            DataAccess.start_scrape(conn, quarter_code)
+    DataAccess.put_conn(conn)
+
+    # Subjects first, of every quarter. Keep the codes the subject
+    # pipeline saved.
+    subject_codes = []
+    def subjects_scraped(item, response, spider):
+        for code in item.get("subject_codes", []):
+            if code not in subject_codes:
+                subject_codes.append(code)
+
+    for quarter_code in quarter_codes:
+        subjects_crawler = runner.create_crawler(SubjectsSpider)
+        subjects_crawler.signals.connect(subjects_scraped, signal=signals.item_scraped)
+        yield runner.crawl(subjects_crawler, quarter_code = quarter_code)
+
+    if not subject_codes:
+        raise errors.MissingSubjectError(f"No subjects found for {', '.join(quarter_codes)}.")
+    yield crawl_courses(runner, quarter_codes, subject_codes)
+
+
+@defer.inlineCallbacks
+def crawl_courses(runner, quarter_codes, subject_codes):
+    courses_crawler = runner.create_crawler(SubjectCoursesSpider)
+    yield runner.crawl(courses_crawler, quarter_code = ",".join(quarter_codes),
+        subject_codes = subject_codes)
+
+    # Not when out of time or with pages missing: the next run resumes.
+    if courses_crawler.spider.checkpoint.finished:
+        conn = DataAccess.get_conn()
+        with conn:
+            for quarter_code in quarter_codes:
+                DataAccess.end_scrape(conn, quarter_code, subject_codes)
+        DataAccess.put_conn(conn)
+
+
+if __name__ == "__main__":
+
+    # Several quarters can be crawled together, with as many names:
+    # run_quarter.py SP21,FA21 "Spring 2021,Fall 2021"
+    quarter_code = "SP21"
+    quarter_name = "Spring 2021"
+
+    argv = sys.argv
+    if len(argv) < 3:
+        print(f"Either quarter code or name not specified. Running "
+            f"{quarter_code}-{quarter_name}")
+    else:
+        quarter_code = argv[1]
+        quarter_name = argv[2]
+
+    quarter_codes = [code.strip() for code in quarter_code.split(",") if code.strip()]
+    quarter_names = [name.strip() for name in quarter_name.split(",")]
+    if len(quarter_names) != len(quarter_codes):
+        sys.exit(f"{len(quarter_codes)} quarter codes but {len(quarter_names)} quarter names")
+
+    # Optional time budget in seconds. The crawl stops before it runs out,
+    # and running the same command again continues where it stopped.
+    settings.set("CRAWL_CHECKPOINT_PATH", f"crawl_checkpoint.{'-'.join(quarter_codes)}.json")
+    if len(argv) >= 4:
+        settings.set("CRAWL_TIME_BUDGET", float(argv[3]))
+
+    configure_logging(settings)
+    runner = CrawlerRunner(settings)
+
+    d = crawl_quarters(runner, quarter_codes, quarter_names)
+    failures = []
+    d.addErrback(failures.append)
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
+
+    DataAccess.close()
+    if failures:
+        failures[0].raiseException()
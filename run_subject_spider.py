@@ -29,4 +29,6 @@ if __name__ == "__main__":
 
     # Need to get all the subjects first.
     process.crawl(SubjectsSpider, quarter_code = quarter_code)
-    process.start()
\ No newline at end of file
+    process.start()
+
+    DataAccess.close()
\ No newline at end of file
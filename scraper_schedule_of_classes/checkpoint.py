@@ -0,0 +1,245 @@
+"""
+Continuation checkpoint of a courses crawl, so a crawl cut short by a time
+limit can be resumed by the next invocation, fetching only what's left.
+
+For every quarter and subject the checkpoint keeps the page count (once the
+first page was parsed), the pages done and the pages pending. A page is done
+once its callback finished, i.e. all its items were handed to the pipelines.
+Subjects without a page count still need their first page.
+
+The checkpoint is saved periodically, so a resumed crawl fetches again the
+pages done since the last save, and a first page whose parse didn't finish.
+Their items are inserted again: the database pipeline replaces section
+groups rather than adding to them.
+
+Stored as json, written atomically.
+"""
+import json
+import os
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+import scraper_schedule_of_classes.errors as errors
+
+
+CHECKPOINT_VERSION = 1
+
+# Close reason when the time budget runs out.
+TIME_BUDGET_REASON = "time_budget"
+
+
+class CrawlCheckpoint:
+
+    def __init__(self, quarter_codes, subject_codes):
+        self.quarter_codes = list(quarter_codes)
+        self.subject_codes = list(subject_codes)
+        # (quarter_code, subject_code) -> number of pages
+        self.num_pages = {}
+        # (quarter_code, subject_code) -> set of page numbers
+        self.pages_done = {}
+        self.items_persisted = 0
+        self.finished = False
+
+
+    def set_num_pages(self, quarter_code, subject_code, num_pages):
+        self.num_pages[(quarter_code, subject_code)] = num_pages
+
+
+    def page_done(self, quarter_code, subject_code, page_num):
+        self.pages_done.setdefault((quarter_code, subject_code), set()).add(page_num)
+
+
+    def pending_pages(self, quarter_code, subject_code):
+        """
+        Pages of a subject left to crawl, or None when its page count is
+        unknown, i.e. its first page is needed.
+        """
+        num_pages = self.num_pages.get((quarter_code, subject_code))
+        if num_pages is None:
+            return None
+        done = self.pages_done.get((quarter_code, subject_code), set())
+        return [page for page in range(1, num_pages + 1) if page not in done]
+
+
+    def num_pending(self):
+        """
+        (known pending pages, subjects still needing their first page)
+        """
+        num_pages = 0
+        num_subjects = 0
+        for quarter_code in self.quarter_codes:
+            for subject_code in self.subject_codes:
+                pending = self.pending_pages(quarter_code, subject_code)
+                if pending is None:
+                    num_subjects += 1
+                else:
+                    num_pages += len(pending)
+        return num_pages, num_subjects
+
+
+    def is_complete(self):
+        return self.num_pending() == (0, 0)
+
+
+    def matches(self, quarter_codes, subject_codes):
+        """
+        Whether this checkpoint is of a crawl of these quarters and subjects.
+        """
+        return (self.quarter_codes == list(quarter_codes)
+            and set(self.subject_codes) == set(subject_codes))
+
+
+    def to_dict(self):
+        quarters = {}
+        for (quarter_code, subject_code), num_pages in sorted(self.num_pages.items()):
+            quarters.setdefault(quarter_code, {})[subject_code] = {
+                "num_pages": num_pages,
+                "done": sorted(self.pages_done.get((quarter_code, subject_code), ())),
+                "pending": self.pending_pages(quarter_code, subject_code),
+            }
+        num_pending_pages, num_pending_subjects = self.num_pending()
+        return {
+            "version": CHECKPOINT_VERSION,
+            "saved_at": time.time(),
+            "finished": self.finished,
+            "quarter_codes": self.quarter_codes,
+            "subject_codes": self.subject_codes,
+            "items_persisted": self.items_persisted,
+            "pages_done": sum(len(pages) for pages in self.pages_done.values()),
+            "pages_pending": num_pending_pages,
+            "subjects_not_started": num_pending_subjects,
+            "quarters": quarters,
+        }
+
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise errors.CheckpointError(f"checkpoint version {data.get('version')}, "
+                f"expected {CHECKPOINT_VERSION}")
+
+        checkpoint = cls(data["quarter_codes"], data["subject_codes"])
+        checkpoint.items_persisted = data["items_persisted"]
+        checkpoint.finished = data["finished"]
+        for quarter_code, subjects in data["quarters"].items():
+            for subject_code, pages in subjects.items():
+                checkpoint.set_num_pages(quarter_code, subject_code, pages["num_pages"])
+                for page_num in pages["done"]:
+                    checkpoint.page_done(quarter_code, subject_code, page_num)
+        return checkpoint
+
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(tmp_path, path)
+
+
+    @classmethod
+    def load(cls, path):
+        """
+        The checkpoint at path, or None if there is none.
+        """
+        if not path or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise errors.CheckpointError(f"{path} is not a checkpoint: {e}")
+        return cls.from_dict(data)
+
+
+def load_resumable(path):
+    """
+    The checkpoint at path if it is of an unfinished crawl, otherwise None.
+    """
+    checkpoint = CrawlCheckpoint.load(path)
+    if checkpoint is None or checkpoint.finished:
+        return None
+    return checkpoint
+
+
+class CrawlCheckpointExtension:
+    """
+    Saves the checkpoint of the courses spider to CRAWL_CHECKPOINT_PATH
+    every CRAWL_CHECKPOINT_INTERVAL seconds and when the spider closes.
+    With CRAWL_TIME_BUDGET, closes the spider CRAWL_SHUTDOWN_MARGIN seconds
+    before the budget runs out, leaving time for in flight pages and items
+    to finish and the checkpoint to be written.
+    Only enabled when CRAWL_CHECKPOINT_PATH is set.
+    """
+
+    def __init__(self, crawler, path, time_budget, interval, shutdown_margin):
+        self.crawler = crawler
+        self.path = path
+        self.time_budget = time_budget
+        self.interval = interval
+        self.shutdown_margin = shutdown_margin
+        self.save_loop = None
+        self.deadline_call = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.get("CRAWL_CHECKPOINT_PATH"):
+            raise NotConfigured("CRAWL_CHECKPOINT_PATH not set")
+
+        ext = cls(crawler, settings.get("CRAWL_CHECKPOINT_PATH"),
+            settings.getfloat("CRAWL_TIME_BUDGET"),
+            settings.getfloat("CRAWL_CHECKPOINT_INTERVAL"),
+            settings.getfloat("CRAWL_SHUTDOWN_MARGIN"))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        return ext
+
+    def spider_opened(self, spider):
+        # Only the courses spider keeps a checkpoint.
+        if getattr(spider, "checkpoint", None) is None:
+            return
+
+        if self.interval:
+            self.save_loop = task.LoopingCall(self.save, spider)
+            self.save_loop.start(self.interval, now=False)
+
+        if self.time_budget:
+            from twisted.internet import reactor
+            delay = max(0, self.time_budget - self.shutdown_margin)
+            self.deadline_call = reactor.callLater(delay, self.deadline_reached, spider)
+
+    def deadline_reached(self, spider):
+        self.deadline_call = None
+        spider.logger.info(f"time budget of {self.time_budget:g}s almost spent, "
+            f"closing and saving checkpoint to {self.path}")
+        self.crawler.engine.close_spider(spider, TIME_BUDGET_REASON)
+
+    def item_scraped(self, item, response, spider):
+        # item_scraped is sent once the item went through every pipeline.
+        checkpoint = getattr(spider, "checkpoint", None)
+        if checkpoint is not None:
+            checkpoint.items_persisted += 1
+
+    def save(self, spider):
+        spider.checkpoint.save(self.path)
+
+    def spider_closed(self, spider, reason):
+        checkpoint = getattr(spider, "checkpoint", None)
+        if checkpoint is None:
+            return
+
+        if self.save_loop is not None and self.save_loop.running:
+            self.save_loop.stop()
+        if self.deadline_call is not None and self.deadline_call.active():
+            self.deadline_call.cancel()
+
+        checkpoint.finished = reason == "finished" and checkpoint.is_complete()
+        self.save(spider)
+        num_pending_pages, num_pending_subjects = checkpoint.num_pending()
+        spider.logger.info(f"checkpoint saved to {self.path} ({reason}): "
+            f"{checkpoint.items_persisted} items persisted, {num_pending_pages} pages "
+            f"and {num_pending_subjects} subjects pending")
@@ -0,0 +1,229 @@
+"""
+Precomputed time conflicts between the schedulable options of a quarter.
+
+An option is one section meeting of a section group together with the
+group's essential general meetings, i.e. what a student actually signs up
+for. Dated meetings (finals, midterms) are ignored. Two options conflict
+when any of their meetings share a day and overlap in time.
+
+The index is built from a quarter snapshot (see snapshot.py) and stored
+as a packed bitset, one row of bits per option. Options of different
+quarters never conflict, so a snapshot of several quarters gets one index
+per quarter.
+"""
+import os
+
+import numpy as np
+
+import scraper_schedule_of_classes.snapshot as snapshot
+
+
+CONFLICT_INDEX_VERSION = 2
+
+# Number of options whose conflicts are computed at once. Bounds the size
+# of the pairwise comparison arrays.
+OPTIONS_BLOCK_SIZE = 128
+
+
+def snapshot_quarters(quarter_snapshot):
+    """
+    {quarter code: indexes of its section group records} of a snapshot.
+    """
+    quarter_strings = quarter_snapshot.section_groups["quarter_code"]
+    return {
+        quarter_snapshot.string(int(quarter_string)):
+            np.nonzero(quarter_strings == quarter_string)[0]
+        for quarter_string in np.unique(quarter_strings)
+    }
+
+
+def build_options(section_groups, meetings, section_group_indexes=None):
+    """
+    Returns (option_section_group, option_meeting, rows), where the first
+    two give, for every option, its section group and section meeting
+    record indexes, and rows are the (option, meeting) pairs making up
+    each option, sorted by option.
+    Only the section groups at section_group_indexes have options, all of
+    them by default.
+    """
+    option_section_group = []
+    option_meeting = []
+    row_options = []
+    row_meetings = []
+
+    categories = meetings["category"]
+    essential = meetings["essential"]
+    if section_group_indexes is None:
+        section_group_indexes = range(len(section_groups))
+    for section_group in section_group_indexes:
+        record = section_groups[section_group]
+        first = int(record["first_meeting"])
+        group_meetings = range(first, first + int(record["num_meetings"]))
+        essential_meetings = [
+            m for m in group_meetings
+            if categories[m] == snapshot.CATEGORY_GENERAL and essential[m]
+        ]
+
+        for m in group_meetings:
+            if categories[m] != snapshot.CATEGORY_SECTION:
+                continue
+            option = len(option_meeting)
+            option_section_group.append(section_group)
+            option_meeting.append(m)
+            for option_member in [m] + essential_meetings:
+                row_options.append(option)
+                row_meetings.append(option_member)
+
+    rows = (np.array(row_options, dtype=np.int64), np.array(row_meetings, dtype=np.int64))
+    return (np.array(option_section_group, dtype=np.uint32),
+        np.array(option_meeting, dtype=np.uint32), rows)
+
+
+def compute_conflict_bits(num_options, row_options, days, start, end,
+        block_size=OPTIONS_BLOCK_SIZE):
+    """
+    Packed conflict bitset of shape (num_options, ceil(num_options / 8)).
+    row_options must be sorted. days/start/end are per row, and rows
+    without a time must already be left out.
+    """
+    bits = np.zeros((num_options, (num_options + 7) // 8), dtype=np.uint8)
+    block_starts = np.searchsorted(row_options,
+        np.arange(0, num_options + block_size, block_size))
+
+    for block, option_start in enumerate(range(0, num_options, block_size)):
+        lo, hi = block_starts[block], block_starts[block + 1]
+        if lo == hi:
+            continue
+
+        overlap = (
+            ((days[lo:hi, None] & days[None, :]) != 0) &
+            (start[lo:hi, None] < end[None, :]) &
+            (start[None, :] < end[lo:hi, None])
+        )
+        block_rows, other_rows = np.nonzero(overlap)
+
+        option_end = min(option_start + block_size, num_options)
+        block_conflicts = np.zeros((option_end - option_start, num_options), dtype=bool)
+        block_conflicts[row_options[lo:hi][block_rows] - option_start,
+            row_options[other_rows]] = True
+        # An option trivially overlaps with itself.
+        block_options = np.arange(option_start, option_end)
+        block_conflicts[block_options - option_start, block_options] = False
+
+        bits[option_start:option_end] = np.packbits(block_conflicts, axis=1)
+
+    return bits
+
+
+class ConflictIndex:
+    """
+    Conflicts between all options of a quarter. Options are numbered in
+    snapshot order, option_section_group/option_meeting give the snapshot
+    records each option is made of.
+    """
+
+    def __init__(self, quarter_code, option_section_group, option_meeting, bits):
+        self.quarter_code = quarter_code
+        self.option_section_group = option_section_group
+        self.option_meeting = option_meeting
+        self.bits = bits
+
+
+    @classmethod
+    def from_snapshot(cls, quarter_snapshot, quarter_code=None, block_size=OPTIONS_BLOCK_SIZE):
+        """
+        The index of quarter_code's options. quarter_code may only be left
+        out when the snapshot has a single quarter.
+        """
+        quarters = snapshot_quarters(quarter_snapshot)
+        if quarter_code is None:
+            if len(quarters) > 1:
+                raise ValueError(f"Snapshot has quarters {sorted(quarters)}, "
+                    "a conflict index is of one quarter")
+            quarter_code = next(iter(quarters), None)
+        section_group_indexes = quarters.get(quarter_code, [])
+
+        meetings = quarter_snapshot.meetings
+        option_section_group, option_meeting, (row_options, row_meetings) = \
+            build_options(quarter_snapshot.section_groups, meetings, section_group_indexes)
+
+        # Meetings without days or times can't conflict with anything.
+        timed = (
+            (meetings["days"][row_meetings] != 0) &
+            (meetings["start_time"][row_meetings] != snapshot.NO_TIME) &
+            (meetings["end_time"][row_meetings] != snapshot.NO_TIME)
+        )
+        row_options = row_options[timed]
+        row_meetings = row_meetings[timed]
+
+        bits = compute_conflict_bits(len(option_meeting), row_options,
+            meetings["days"][row_meetings],
+            meetings["start_time"][row_meetings].astype(np.int32),
+            meetings["end_time"][row_meetings].astype(np.int32),
+            block_size)
+        return cls(quarter_code, option_section_group, option_meeting, bits)
+
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            version = int(data["version"])
+            if version != CONFLICT_INDEX_VERSION:
+                raise ValueError(f"{path} has conflict index version {version}, "
+                    f"expected {CONFLICT_INDEX_VERSION}")
+            return cls(str(data["quarter_code"]), data["option_section_group"],
+                data["option_meeting"], data["bits"])
+
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez_compressed(f, version=CONFLICT_INDEX_VERSION,
+                quarter_code=self.quarter_code, option_section_group=self.option_section_group,
+                option_meeting=self.option_meeting, bits=self.bits)
+
+
+    @property
+    def num_options(self):
+        return len(self.option_meeting)
+
+
+    def conflicts(self, a, b):
+        """
+        Whether options a and b conflict.
+        """
+        return bool((self.bits[a, b >> 3] >> (7 - (b & 7))) & 1)
+
+
+    def conflicting_options(self, a):
+        """
+        Indexes of all options conflicting with option a.
+        """
+        row = np.unpackbits(self.bits[a], count=self.num_options)
+        return np.nonzero(row)[0]
+
+
+def conflict_index_path(path, quarter_code, num_quarters=1):
+    """
+    Where the index of quarter_code is written: path itself when the
+    snapshot has a single quarter, else path with the quarter code before
+    its extension, e.g. quarter.conflicts.WI21.npz.
+    """
+    if num_quarters == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{quarter_code}{ext}"
+
+
+def write_conflict_index(snapshot_path, path):
+    """
+    Writes the index of every quarter of the snapshot, see
+    conflict_index_path. Returns {quarter code: index}.
+    """
+    with snapshot.Snapshot(snapshot_path) as quarter_snapshot:
+        indexes = {
+            quarter_code: ConflictIndex.from_snapshot(quarter_snapshot, quarter_code)
+            for quarter_code in sorted(snapshot_quarters(quarter_snapshot))
+        }
+    for quarter_code, index in indexes.items():
+        index.save(conflict_index_path(path, quarter_code, len(indexes)))
+    return indexes
@@ -0,0 +1,81 @@
+import collections
+import threading
+import time
+
+
+class ScheduleCache:
+    """
+    LRU cache of schedule reads with a time to live, tied to the upload
+    generation of the database: every upload bumps the generation, and
+    entries cached under an older one are never returned.
+
+    The generation is looked up at most every generation_interval seconds,
+    so between uploads repeated reads don't touch the database at all.
+    Cached values are shared between callers and must not be modified.
+    """
+
+    def __init__(self, max_size=256, ttl=600, generation_interval=10, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation_interval = generation_interval
+        self.clock = clock
+
+        # key -> (generation, expires_at, value), least recently used first.
+        self.entries = collections.OrderedDict()
+        self.generation = None
+        self.generation_checked_at = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def current_generation(self, fetch_generation):
+        now = self.clock()
+        with self.lock:
+            checked_at = self.generation_checked_at
+            if checked_at is not None and now - checked_at < self.generation_interval:
+                return self.generation
+
+        generation = fetch_generation()
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+            self.generation_checked_at = now
+        return generation
+
+
+    def get(self, key, fetch_generation, load):
+        """
+        The cached value for key, or load() when it is missing, expired or
+        of an older upload generation.
+        """
+        if self.max_size <= 0:
+            return load()
+
+        generation = self.current_generation(fetch_generation)
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == generation and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = load()
+        with self.lock:
+            self.entries[key] = (generation, now + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return value
+
+
+    def invalidate(self):
+        """
+        Drop every entry, and look the generation up again on the next read.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.generation_checked_at = None
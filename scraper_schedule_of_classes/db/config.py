@@ -9,6 +9,18 @@ DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 ENV = os.getenv("ENV")
 
+# Schedule read cache (DataAccess.get_*_schedule): number of schedules kept,
+# seconds they live, and how often, in seconds, the upload generation is
+# checked. A size of 0 disables the cache.
+SCHEDULE_CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", "256"))
+SCHEDULE_CACHE_TTL = float(os.getenv("SCHEDULE_CACHE_TTL", "600"))
+SCHEDULE_CACHE_GENERATION_INTERVAL = float(os.getenv("SCHEDULE_CACHE_GENERATION_INTERVAL", "10"))
+
+# Seat changes found by uploads are published on this notification channel,
+# or appended to SEAT_CHANGES_LOG instead if it is set.
+SEAT_CHANGES_CHANNEL = os.getenv("SEAT_CHANGES_CHANNEL", "seat_changes")
+SEAT_CHANGES_LOG = os.getenv("SEAT_CHANGES_LOG")
+
 # development environment: local machine.
 if ENV == "dev":
     DB_USER = os.getenv("DB_USER_LOCAL")
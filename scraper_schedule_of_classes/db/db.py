@@ -1,16 +1,38 @@
 import os
 import pathlib
+import re
+import weakref
 
 import psycopg2 as pg
 import psycopg2.extras as pg_extras
 import psycopg2.pool as pgpool
 import psycopg2.errors
 
+from scraper_schedule_of_classes.db.cache import ScheduleCache
 from scraper_schedule_of_classes.db.config \
-    import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME
+    import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME, \
+    SCHEDULE_CACHE_SIZE, SCHEDULE_CACHE_TTL, SCHEDULE_CACHE_GENERATION_INTERVAL
 
 DB_DIR = pathlib.Path(__file__).parent.absolute()
 
+# various prepared statements for inserting, read once per process.
+INSERT_PREPARE_STATEMENTS = [
+    open(DB_DIR / fn, "r").read() for fn in (
+        "insert_course_prepare.sql",
+        "insert_course_offering_prepare.sql",
+        "insert_section_group_prepare.sql",
+        "insert_section_meeting_prepare.sql",
+        "insert_general_meeting_prepare.sql",
+        "insert_dated_meeting_prepare.sql",
+    )
+]
+
+# Advisory lock class of seat history locks, see lock_seat_history.
+SEAT_HISTORY_LOCK_CLASS = 46
+
+# Anything but letters and digits separates words in search documents.
+SEARCH_WORD_SEPARATOR_REGEX = re.compile(r"[^0-9a-z]+")
+
 class DataAccess:
 
     conn_pool = pgpool.ThreadedConnectionPool(1, 20,
@@ -19,36 +41,57 @@ class DataAccess:
         host=DB_HOST,
         port=DB_PORT,
         dbname=DB_NAME)
+
+    # Connections of the pool the insert statements are prepared on.
+    prepared_conns = weakref.WeakSet()
+
+    # Schedules read by get_quarter/subject/course_schedule.
+    schedule_cache = ScheduleCache(SCHEDULE_CACHE_SIZE, SCHEDULE_CACHE_TTL,
+        SCHEDULE_CACHE_GENERATION_INTERVAL)
     
     
     @classmethod
     def get_conn(cls):
+        # Connections dropped since they were last used (server restart,
+        # idle timeout while a warm container was frozen) are replaced. All
+        # of the pool's may have been, then a new one is opened.
+        for _ in range(cls.conn_pool.maxconn):
+            conn = cls.conn_pool.getconn()
+            try:
+                cls.prepare_conn(conn)
+                return conn
+            except (pg.OperationalError, pg.InterfaceError):
+                cls.conn_pool.putconn(conn, close=True)
+
         conn = cls.conn_pool.getconn()
-        
-        # various prepared statements for inserting.
-        insert_course_prepare = open(DB_DIR / "insert_course_prepare.sql", "r").read()
-        insert_course_offering_prepare = open(DB_DIR / "insert_course_offering_prepare.sql", "r").read()
-        insert_section_group_prepare = open(DB_DIR / "insert_section_group_prepare.sql", "r").read()
-        insert_section_meeting_prepare = open(DB_DIR / "insert_section_meeting_prepare.sql", "r").read()
-        insert_general_meeting_prepare = open(DB_DIR / "insert_general_meeting_prepare.sql", "r").read()
-        insert_dated_meeting_prepare = open(DB_DIR / "insert_dated_meeting_prepare.sql", "r").read()
-
-        # prepare statements if they have not already been prepared for this connection.
+        cls.prepare_conn(conn)
+        return conn
+
+
+    @classmethod
+    def prepare_conn(cls, conn):
+        """
+        Prepare the insert statements on conn if they have not already been
+        prepared on it, otherwise check it is still alive: conn.closed is
+        only set once a query failed, not when the server dropped it.
+        """
+        if conn in cls.prepared_conns:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            return
+
         try:
             with conn:
                 with conn.cursor() as cur:
-                    cur.execute(insert_course_prepare)
-                    cur.execute(insert_course_offering_prepare)
-                    cur.execute(insert_section_group_prepare)
-                    cur.execute(insert_section_meeting_prepare)
-                    cur.execute(insert_general_meeting_prepare)
-                    cur.execute(insert_dated_meeting_prepare)
+                    for prepare_statement in INSERT_PREPARE_STATEMENTS:
+                        cur.execute(prepare_statement)
 
         # duplicate prepared statement
         except psycopg2.errors.lookup('42P05'):
             pass
 
-        return conn
+        cls.prepared_conns.add(conn)
 
     
     @classmethod
@@ -82,6 +125,23 @@ class DataAccess:
                 page_size=len(values_list))
 
 
+    @classmethod
+    def savepoint(cls, conn, name, release = False):
+        """
+        Set savepoint name. With release, the previous savepoint of that
+        name is released first, in the same round trip.
+        """
+        if release:
+            cls.execute_str(conn, f"RELEASE SAVEPOINT {name}; SAVEPOINT {name};")
+        else:
+            cls.execute_str(conn, f"SAVEPOINT {name};")
+
+
+    @classmethod
+    def rollback_to_savepoint(cls, conn, name):
+        cls.execute_str(conn, f"ROLLBACK TO SAVEPOINT {name};")
+
+
     @classmethod
     def insert_quarter(cls, conn, code, name):
 
@@ -138,10 +198,279 @@ class DataAccess:
 
 
     @classmethod
-    def insert_section_group_all_info(cls, conn, item):
+    def get_subject_page_counts(cls, conn):
+        """
+        Page counts of each subject in the last crawl that reached it.
+
+        returns a dict of subject code to number of pages.
+        """
+
+        query_str = """
+            SELECT subject.code, subject_crawl_stats.num_pages
+            FROM subject_crawl_stats
+            JOIN subject ON subject.id = subject_crawl_stats.subject_id;
+        """
+
+        result = cls.execute_str(conn, query_str, do_return=True)
+        return {code: num_pages for (code, num_pages) in result}
+
+
+    @classmethod
+    def upsert_subject_crawl_stats(cls, conn, stats):
+        """
+        stats is a list of (subject_code, num_pages, duration_secs)
+        """
+
+        query_str = """
+            INSERT INTO subject_crawl_stats (subject_id, num_pages, duration_secs, updated_at)
+            SELECT id, %s, %s, now() FROM subject
+            WHERE code = %s
+            ON CONFLICT (subject_id)
+            DO UPDATE SET
+                num_pages = EXCLUDED.num_pages,
+                duration_secs = EXCLUDED.duration_secs,
+                updated_at = EXCLUDED.updated_at;
+        """
+
+        values_list = [
+            (num_pages, duration_secs, subject_code)
+            for (subject_code, num_pages, duration_secs) in stats
+        ]
+        cls.execute_str_batch(conn, query_str, values_list)
+
+
+    @classmethod
+    def save_shard_plan(cls, conn, quarter_code, shards):
+        """
+        Replace the plan of the quarter into len(shards) shards.
+        shards is a list of the subject codes of each shard.
+        """
+
+        values = {"quarter_code": quarter_code, "num_shards": len(shards)}
+        cls.execute_str(conn, """
+            DELETE FROM shard_plan
+            WHERE quarter_code = %(quarter_code)s AND num_shards = %(num_shards)s;
+        """, values)
+
+        query_str = """
+            INSERT INTO shard_plan (quarter_code, num_shards, shard_index, subject_codes)
+            VALUES (%s, %s, %s, %s);
+        """
+        values_list = [
+            (quarter_code, len(shards), shard_index, list(subject_codes))
+            for shard_index, subject_codes in enumerate(shards)
+        ]
+        cls.execute_str_batch(conn, query_str, values_list)
+
+
+    @classmethod
+    def get_shard_plan(cls, conn, quarter_code, num_shards):
+        """
+        The subject codes of each shard of the quarter's plan into
+        num_shards shards, or None if there is no such plan.
+        """
+
+        query_str = """
+            SELECT subject_codes FROM shard_plan
+            WHERE quarter_code = %s AND num_shards = %s
+            ORDER BY shard_index;
+        """
+
+        result = cls.execute_str(conn, query_str, (quarter_code, num_shards), do_return=True)
+        if len(result) != num_shards:
+            return None
+        return [list(subject_codes) for (subject_codes, ) in result]
+
+
+    @classmethod
+    def get_upload_generation(cls, conn):
+        """
+        The current upload generation, bumped after every upload.
+        """
+
+        query_str = """
+            SELECT generation FROM upload_generation;
+        """
+
+        result = cls.execute_str(conn, query_str, do_return=True)
+        return result[0][0] if result else 0
+
+
+    @classmethod
+    def bump_upload_generation(cls, conn):
+        """
+        Mark a change of the uploaded schedules (reset, end of an upload),
+        invalidating cached schedules here and, once they check the
+        generation again, in other processes.
+        """
+
+        query_str = """
+            UPDATE upload_generation
+            SET generation = generation + 1, updated_at = now()
+            RETURNING generation;
+        """
+
+        result = cls.execute_str(conn, query_str, do_return=True)
+        cls.schedule_cache.invalidate()
+        return result[0][0]
+
+
+    @classmethod
+    def get_quarter_schedule(cls, conn, quarter_code):
+        """
+        All section groups of a quarter with their meetings. See get_schedule.
+        """
+        return cls.get_schedule(conn, quarter_code)
+
+
+    @classmethod
+    def get_subject_schedule(cls, conn, quarter_code, subject_code):
+        """
+        The section groups of one subject in a quarter. See get_schedule.
+        """
+        return cls.get_schedule(conn, quarter_code, subject_code)
+
+
+    @classmethod
+    def get_course_schedule(cls, conn, quarter_code, subject_code, number):
+        """
+        The section groups of one course in a quarter. See get_schedule.
+        """
+        return cls.get_schedule(conn, quarter_code, subject_code, number)
+
+
+    @classmethod
+    def get_schedule(cls, conn, quarter_code, subject_code = None, number = None):
+        """
+        Section groups of a quarter, optionally of one subject or course,
+        each with its section, general and dated meetings, in one query.
+        Results are cached until the next upload (see ScheduleCache), so
+        they are shared and must not be modified.
+
+        returns a list of section groups, ordered by subject, course number
+        and section group code, in the same form as the CourseMeetings items
+        uploaded:
+        {
+            "quarter_code", "subj_code", "number", "title",
+            "section_group_code", "instructor",
+            "section_meetings": [{"type_", "days", "start_time", "end_time",
+                "bldg", "room", "days_mask", "start_minute", "end_minute",
+                "number", "seats_avail"}],
+            "general_meetings": [{..., "number", "essential"}],
+            "dated_meetings": [{..., "date"}]
+        }
+        """
+        key = (quarter_code, subject_code, number)
+        return cls.schedule_cache.get(key,
+            lambda: cls.get_upload_generation(conn),
+            lambda: cls.select_schedule(conn, quarter_code, subject_code, number))
+
+
+    @classmethod
+    def select_schedule(cls, conn, quarter_code, subject_code = None, number = None):
+        """
+        get_schedule, without the cache.
+        """
+
+        conditions = ["quarter.code = %(quarter_code)s"]
+        if subject_code is not None:
+            conditions.append("subject.code = %(subject_code)s")
+        if number is not None:
+            conditions.append("course.number_ = %(number)s")
+
+        # One row per meeting (or per section group without meetings),
+        # with the columns of whichever meeting table it is in.
+        query_str = f"""
+            SELECT section_group.id, quarter.code, subject.code, course.number_,
+                course.title, section_group.code, section_group.instructor,
+                meeting.id, meeting.type_, meeting.days, meeting.start_time,
+                meeting.end_time, meeting.building, meeting.room,
+                meeting.days_mask, meeting.start_minute, meeting.end_minute,
+                section_meeting.number_, section_meeting.seats_available,
+                general_meeting.number_, general_meeting.essential,
+                dated_meeting.date_
+            FROM section_group
+            JOIN course_offering ON course_offering.id = section_group.course_offering_id
+            JOIN quarter ON quarter.id = course_offering.quarter_id
+            JOIN course ON course.id = course_offering.course_id
+            JOIN subject ON subject.id = course.subject_id
+            LEFT JOIN meeting ON meeting.section_group_id = section_group.id
+            LEFT JOIN section_meeting ON section_meeting.meeting_id = meeting.id
+            LEFT JOIN general_meeting ON general_meeting.meeting_id = meeting.id
+            LEFT JOIN dated_meeting ON dated_meeting.meeting_id = meeting.id
+            WHERE {" AND ".join(conditions)}
+            ORDER BY subject.code, course.number_, section_group.code, meeting.id;
+        """
+        values = {
+            "quarter_code": quarter_code,
+            "subject_code": subject_code,
+            "number": number
+        }
+
+        rows = cls.execute_str(conn, query_str, values, do_return=True)
+        return cls.schedule_from_rows(rows)
+
+
+    @staticmethod
+    def schedule_from_rows(rows):
+        """
+        Group the meeting rows of select_schedule by section group.
+        """
+        section_groups = {}
+        for (section_group_id, quarter_code, subject_code, number, title,
+                section_group_code, instructor, meeting_id, type_, days,
+                start_time, end_time, bldg, room, days_mask, start_minute,
+                end_minute, section_number, seats_avail, general_number,
+                essential, date) in rows:
+
+            section_group = section_groups.get(section_group_id)
+            if section_group is None:
+                section_group = section_groups[section_group_id] = {
+                    "quarter_code": quarter_code.strip(),
+                    "subj_code": subject_code,
+                    "number": number,
+                    "title": title,
+                    "section_group_code": section_group_code.strip(),
+                    "instructor": instructor,
+                    "section_meetings": [],
+                    "general_meetings": [],
+                    "dated_meetings": []
+                }
+
+            if meeting_id is None:
+                continue
+
+            meeting = {
+                "type_": type_.strip(),
+                "days": days,
+                "start_time": start_time,
+                "end_time": end_time,
+                "bldg": bldg,
+                "room": room,
+                "days_mask": days_mask,
+                "start_minute": start_minute,
+                "end_minute": end_minute
+            }
+            if section_number is not None:
+                meeting.update(number=section_number.strip(), seats_avail=seats_avail)
+                section_group["section_meetings"].append(meeting)
+            elif general_number is not None:
+                meeting.update(number=general_number.strip(), essential=essential)
+                section_group["general_meetings"].append(meeting)
+            else:
+                meeting.update(date=date)
+                section_group["dated_meetings"].append(meeting)
+
+        return list(section_groups.values())
+
+
+    @classmethod
+    def insert_section_group_all_info(cls, conn, item, replace = False):
         """
         Given an item from the course persistence pipeline, insert
         all information from that item (course, offering, section, meetings.)
+        With replace, the meetings the section group already has are
+        deleted first, so inserting the same item again changes nothing.
         """
         # Insert course.
         course_id = cls.insert_course(conn, item.get("subj_code"), 
@@ -154,37 +483,72 @@ class DataAccess:
         # Insert section group
         section_group_id = cls.insert_section_group(conn, course_offering_id,
             item.get("section_group_code"), item.get("instructor"))
+        cls.upsert_section_group_search(conn, section_group_id, item)
+        if replace:
+            cls.delete_section_group_meetings(conn, section_group_id)
+
+        (section_meeting_vals, general_meeting_vals, dated_meeting_vals) = \
+            cls.meeting_values(section_group_id, item)
+        cls.insert_section_meetings(conn, section_meeting_vals)
+        if general_meeting_vals:
+            cls.insert_general_meetings(conn, general_meeting_vals)
+        if dated_meeting_vals:
+            cls.insert_dated_meetings(conn, dated_meeting_vals)
 
-        section_meetings = item.get("section_meetings")
+
+    @staticmethod
+    def meeting_values(section_group_id, item):
+        """
+        Parameters of the section, general and dated meeting inserts of an
+        item. Meetings without days (items from before days_mask, or rows
+        without days) get an empty days mask, the column is not null.
+        """
         section_meeting_vals = [
             (section_group_id, m_item.get("type_"), m_item.get("days"),
             m_item.get("start_time"), m_item.get("end_time"), m_item.get("bldg"),
-            m_item.get("room"), m_item.get("number"), m_item.get("seats_avail"))
-            for m_item in section_meetings
+            m_item.get("room"), m_item.get("number"), m_item.get("seats_avail"),
+            m_item.get("days_mask") or 0, m_item.get("start_minute"), m_item.get("end_minute"))
+            for m_item in item.get("section_meetings") or []
         ]
-        cls.insert_section_meetings(conn, section_meeting_vals)
+        general_meeting_vals = [
+            (section_group_id, m_item.get("type_"), m_item.get("days"),
+            m_item.get("start_time"), m_item.get("end_time"), m_item.get("bldg"),
+            m_item.get("room"), m_item.get("number"), m_item.get("essential"),
+            m_item.get("days_mask") or 0, m_item.get("start_minute"), m_item.get("end_minute"))
+            for m_item in item.get("general_meetings") or []
+        ]
+        dated_meeting_vals = [
+            (section_group_id, m_item.get("type_"), m_item.get("days"),
+            m_item.get("start_time"), m_item.get("end_time"), m_item.get("bldg"),
+            m_item.get("room"), m_item.get("date"),
+            m_item.get("days_mask") or 0, m_item.get("start_minute"), m_item.get("end_minute"))
+            for m_item in item.get("dated_meetings") or []
+        ]
+        return section_meeting_vals, general_meeting_vals, dated_meeting_vals
 
-        general_meetings = item.get("general_meetings")
-        if general_meetings:
-            general_meeting_vals = [
-                (section_group_id, m_item.get("type_"), m_item.get("days"),
-                m_item.get("start_time"), m_item.get("end_time"), m_item.get("bldg"),
-                m_item.get("room"), m_item.get("number"), m_item.get("essential"))
-                for m_item in general_meetings
-            ]
-            cls.insert_general_meetings(conn, general_meeting_vals)
+    
+    @classmethod
+    def replace_section_group_all_info(cls, conn, item):
+        """
+        Like insert_section_group_all_info, but first delete the meetings
+        the section group of the item already has, if it exists.
+        """
+        cls.insert_section_group_all_info(conn, item, replace = True)
+
+
+    @classmethod
+    def delete_section_group_meetings(cls, conn, section_group_id):
+        """
+        Delete all meetings of a section group.
+        """
+        meeting_ids = "SELECT id FROM meeting WHERE section_group_id = %(section_group_id)s"
+        values = {"section_group_id": section_group_id}
+        for table in ("section_meeting", "general_meeting", "dated_meeting"):
+            cls.execute_str(conn, f"DELETE FROM {table} WHERE meeting_id IN ({meeting_ids});", values)
+        cls.execute_str(conn, "DELETE FROM meeting WHERE section_group_id = %(section_group_id)s;",
+            values)
 
-        dated_meetings = item.get("dated_meetings")
-        if dated_meetings:
-            dated_meeting_vals = [
-                (section_group_id, m_item.get("type_"), m_item.get("days"),
-                m_item.get("start_time"), m_item.get("end_time"), m_item.get("bldg"),
-                m_item.get("room"), m_item.get("date"))
-                for m_item in dated_meetings
-            ]
-            cls.insert_dated_meetings(conn, dated_meeting_vals)
 
-    
     @classmethod
     def insert_course(cls, conn, subject_code, number, title):
         """
@@ -237,8 +601,11 @@ class DataAccess:
         # $7: room
         # $8: (meeting) number
         # $9: seats available
+        # $10: days mask
+        # $11: start minute
+        # $12: end minute
         cls.execute_str_batch(conn, "EXECUTE insert_section_meetings "
-            "(%s, %s, %s, %s, %s, %s, %s, %s, %s);", section_meeting_values)
+            "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);", section_meeting_values)
 
 
     @classmethod
@@ -252,8 +619,11 @@ class DataAccess:
         # $7: room
         # $8: (meeting) number
         # $9: essential
+        # $10: days mask
+        # $11: start minute
+        # $12: end minute
         cls.execute_str_batch(conn, "EXECUTE insert_general_meetings "
-            "(%s, %s, %s, %s, %s, %s, %s, %s, %s);", general_meeting_values)
+            "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);", general_meeting_values)
 
 
     @classmethod
@@ -266,8 +636,391 @@ class DataAccess:
         # $6: building
         # $7: room
         # $8: date
+        # $9: days mask
+        # $10: start minute
+        # $11: end minute
         cls.execute_str_batch(conn, "EXECUTE insert_dated_meetings "
-            "(%s, %s, %s, %s, %s, %s, %s, %s);", dated_meeting_values)    
+            "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);", dated_meeting_values)    
+
+
+    @classmethod
+    def get_section_seats(cls, conn, quarter_codes):
+        """
+        Last known seats available of every section meeting of the quarters,
+        kept across resets to find seat changes.
+
+        returns a dict of
+        (quarter_code, subject_code, course number, section number) to seats.
+        """
+
+        query_str = """
+            SELECT quarter_code, subject_code, course_number, section_number, seats_available
+            FROM section_seats
+            WHERE quarter_code = ANY(%s);
+        """
+
+        result = cls.execute_str(conn, query_str, (list(quarter_codes), ), do_return=True)
+        return {
+            (quarter_code.strip(), subject_code, number, section_number.strip()): seats
+            for (quarter_code, subject_code, number, section_number, seats) in result
+        }
+
+
+    @classmethod
+    def upsert_section_seats(cls, conn, seats):
+        """
+        seats is a list of
+        (quarter_code, subject_code, course number, section number, seats available)
+        """
+
+        query_str = """
+            INSERT INTO section_seats (quarter_code, subject_code, course_number,
+                section_number, seats_available, updated_at)
+            VALUES (%s, %s, %s, %s, %s, now())
+            ON CONFLICT (quarter_code, subject_code, course_number, section_number)
+            DO UPDATE SET
+                seats_available = EXCLUDED.seats_available,
+                updated_at = EXCLUDED.updated_at;
+        """
+        cls.execute_str_batch(conn, query_str, seats)
+
+
+    @classmethod
+    def lock_seat_history(cls, conn, keys):
+        """
+        Lock the seat history of every section meeting in keys until the
+        transaction ends. Locks are taken in order, so writers of
+        overlapping sections don't deadlock.
+        """
+
+        query_str = """
+            SELECT pg_advisory_xact_lock(%s, hashtext(key))
+            FROM (SELECT DISTINCT unnest(%s::text[]) AS key ORDER BY key) AS keys;
+        """
+        values = (SEAT_HISTORY_LOCK_CLASS, ["|".join(key) for key in keys])
+        cls.execute_str(conn, query_str, values)
+
+
+    @classmethod
+    def get_last_seat_history_chunks(cls, conn, keys):
+        """
+        The last seat history chunk of every section meeting in keys, a
+        list of (quarter_code, subject_code, course number, section number).
+
+        returns a dict of key to
+        {"first_time", "last_time", "last_seats", "num_points"}
+        for the keys with a history.
+        """
+
+        query_str = """
+            SELECT DISTINCT ON (seat_history.quarter_code, seat_history.subject_code,
+                    seat_history.course_number, seat_history.section_number)
+                seat_history.quarter_code, seat_history.subject_code,
+                seat_history.course_number, seat_history.section_number,
+                first_time, last_time, last_seats, num_points
+            FROM seat_history
+            JOIN unnest(%s::char(4)[], %s::varchar(4)[], %s::varchar(8)[], %s::char(3)[])
+                AS key (quarter_code, subject_code, course_number, section_number)
+            ON seat_history.quarter_code = key.quarter_code
+                AND seat_history.subject_code = key.subject_code
+                AND seat_history.course_number = key.course_number
+                AND seat_history.section_number = key.section_number
+            ORDER BY seat_history.quarter_code, seat_history.subject_code,
+                seat_history.course_number, seat_history.section_number, first_time DESC;
+        """
+        values = tuple(list(column) for column in zip(*keys))
+
+        result = cls.execute_str(conn, query_str, values, do_return=True)
+        return {
+            (quarter_code.strip(), subject_code, number, section_number.strip()): {
+                "first_time": first_time,
+                "last_time": last_time,
+                "last_seats": last_seats,
+                "num_points": num_points
+            }
+            for (quarter_code, subject_code, number, section_number,
+                first_time, last_time, last_seats, num_points) in result
+        }
+
+
+    @classmethod
+    def insert_seat_history(cls, conn, chunks):
+        """
+        chunks is a list of
+        (quarter_code, subject_code, course number, section number,
+        first time, last time, last seats, number of points, packed points)
+        """
+
+        query_str = """
+            INSERT INTO seat_history (quarter_code, subject_code, course_number,
+                section_number, first_time, last_time, last_seats, num_points, points)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+        """
+        cls.execute_str_batch(conn, query_str, chunks)
+
+
+    @classmethod
+    def append_seat_history(cls, conn, appends):
+        """
+        appends is a list of
+        (packed points, last time, last seats, number of points,
+        quarter_code, subject_code, course number, section number, chunk first time)
+        """
+
+        query_str = """
+            UPDATE seat_history SET
+                points = points || %s,
+                last_time = %s,
+                last_seats = %s,
+                num_points = num_points + %s
+            WHERE quarter_code = %s AND subject_code = %s AND course_number = %s
+                AND section_number = %s AND first_time = %s;
+        """
+        cls.execute_str_batch(conn, query_str, appends)
+
+
+    @classmethod
+    def select_seat_history(cls, conn, quarter_code, subject_code, number,
+            section_number = None, start = None, end = None):
+        """
+        Seat history chunks of a course, or one of its section meetings,
+        with points between start and end (unix seconds).
+
+        returns a list of {"section_number", "first_time", "points"}
+        """
+
+        conditions = [
+            "quarter_code = %(quarter_code)s",
+            "subject_code = %(subject_code)s",
+            "course_number = %(number)s"
+        ]
+        if section_number is not None:
+            conditions.append("section_number = %(section_number)s")
+        if start is not None:
+            conditions.append("last_time >= %(start)s")
+        if end is not None:
+            conditions.append("first_time <= %(end)s")
+
+        query_str = f"""
+            SELECT section_number, first_time, points
+            FROM seat_history
+            WHERE {" AND ".join(conditions)}
+            ORDER BY section_number, first_time;
+        """
+        values = {
+            "quarter_code": quarter_code,
+            "subject_code": subject_code,
+            "number": number,
+            "section_number": section_number,
+            "start": start,
+            "end": end
+        }
+
+        result = cls.execute_str(conn, query_str, values, do_return=True)
+        return [
+            {
+                "section_number": section_number.strip(),
+                "first_time": first_time,
+                "points": bytes(points)
+            }
+            for (section_number, first_time, points) in result
+        ]
+
+
+    @classmethod
+    def notify(cls, conn, channel, payload):
+        """
+        Send a notification, delivered when the transaction commits.
+        """
+        cls.execute_str(conn, "SELECT pg_notify(%s, %s);", (channel, payload))
+
+
+    @staticmethod
+    def normalize_search_text(text):
+        """
+        Lowercase text with words separated by single spaces.
+        """
+        return SEARCH_WORD_SEPARATOR_REGEX.sub(" ", (text or "").lower()).strip()
+
+
+    @classmethod
+    def search_document(cls, item):
+        """
+        The text a section group is searched by: course code, title and
+        instructor, normalized.
+        """
+        course_code = f"{item.get('subj_code')} {item.get('number')}"
+        return cls.normalize_search_text(
+            f"{course_code} {item.get('title') or ''} {item.get('instructor') or ''}")
+
+
+    @classmethod
+    def upsert_section_group_search(cls, conn, section_group_id, item):
+        """
+        Keep the search document of a section group up to date, called
+        for every uploaded item.
+        """
+
+        query_str = """
+            INSERT INTO section_group_search (section_group_id, quarter_id, course_code, document)
+            SELECT section_group.id, course_offering.quarter_id, %s, %s
+            FROM section_group
+            JOIN course_offering ON course_offering.id = section_group.course_offering_id
+            WHERE section_group.id = %s
+            ON CONFLICT (section_group_id)
+            DO UPDATE SET
+                course_code = EXCLUDED.course_code,
+                document = EXCLUDED.document;
+        """
+        course_code = cls.normalize_search_text(f"{item.get('subj_code')} {item.get('number')}")
+        values = (course_code, cls.search_document(item), section_group_id)
+
+        cls.execute_str(conn, query_str, values)
+
+
+    @classmethod
+    def search_section_groups(cls, conn, quarter_code, query, limit = 20):
+        """
+        Section groups of a quarter matching a partial course code
+        ("CSE 1"), title words or instructor names, best matches first.
+
+        Course code prefix matches rank first, then trigram word similarity
+        of the query to the search document (pg_trgm), both served by the
+        indexes on section_group_search.
+
+        returns a list of
+        {
+            "subj_code", "number", "title", "section_group_code",
+            "instructor", "score"
+        }
+        """
+        query = cls.normalize_search_text(query)
+        if not query:
+            return []
+
+        # "<%" is pg_trgm's word similarity operator, "%%" escapes it
+        # from psycopg2.
+        query_str = """
+            SELECT subject.code, course.number_, course.title, section_group.code,
+                section_group.instructor,
+                section_group_search.course_code LIKE %(prefix)s AS code_match,
+                word_similarity(%(query)s, section_group_search.document) AS score
+            FROM section_group_search
+            JOIN quarter ON quarter.id = section_group_search.quarter_id
+            JOIN section_group ON section_group.id = section_group_search.section_group_id
+            JOIN course_offering ON course_offering.id = section_group.course_offering_id
+            JOIN course ON course.id = course_offering.course_id
+            JOIN subject ON subject.id = course.subject_id
+            WHERE quarter.code = %(quarter_code)s
+                AND (section_group_search.course_code LIKE %(prefix)s
+                    OR %(query)s <%% section_group_search.document)
+            ORDER BY code_match DESC, score DESC, subject.code, course.number_, section_group.code
+            LIMIT %(limit)s;
+        """
+        # Normalized queries have no LIKE wildcards to escape.
+        prefix = query + "%"
+        values = {
+            "quarter_code": quarter_code,
+            "query": query,
+            "prefix": prefix,
+            "limit": limit
+        }
+
+        result = cls.execute_str(conn, query_str, values, do_return=True)
+        return [
+            {
+                "subj_code": subject_code,
+                "number": number,
+                "title": title,
+                "section_group_code": section_group_code.strip(),
+                "instructor": instructor,
+                "score": 1.0 if code_match else score
+            }
+            for (subject_code, number, title, section_group_code, instructor,
+                code_match, score) in result
+        ]
+
+
+    @classmethod
+    def reset_subjects_for_scrape(cls, conn, quarter_code, subject_codes):
+        """
+        Like reset_for_scrape, but only for the section groups and meetings
+        of the given subjects in one quarter. Used when the subjects of a
+        quarter are crawled and uploaded in separate shards.
+        """
+        section_group_ids = """
+            SELECT section_group.id FROM section_group
+            JOIN course_offering ON course_offering.id = section_group.course_offering_id
+            JOIN quarter ON quarter.id = course_offering.quarter_id
+            JOIN course ON course.id = course_offering.course_id
+            JOIN subject ON subject.id = course.subject_id
+            WHERE quarter.code = %(quarter_code)s AND subject.code = ANY(%(subject_codes)s)
+        """
+        values = {
+            "quarter_code": quarter_code,
+            "subject_codes": list(subject_codes)
+        }
+        cls.delete_section_groups(conn, section_group_ids, values)
+        cls.bump_upload_generation(conn)
+
+
+    @classmethod
+    def start_scrape(cls, conn, quarter_code):
+        """
+        Mark the start of a scrape of a quarter that is written over its
+        previous scrape, see end_scrape.
+        """
+        cls.execute_str(conn, "UPDATE quarter SET scrape_started_at = now() WHERE code = %s;",
+            (quarter_code,))
+
+
+    @classmethod
+    def end_scrape(cls, conn, quarter_code, subject_codes):
+        """
+        Once a scrape started with start_scrape is complete, delete the
+        section groups of the given subjects it didn't scrape again (they
+        were not stamped since it started), and the course offerings left
+        without section groups. Until then readers see the previous scrape,
+        with what was scraped again already replaced.
+        """
+        section_group_ids = """
+            SELECT section_group.id FROM section_group
+            JOIN course_offering ON course_offering.id = section_group.course_offering_id
+            JOIN quarter ON quarter.id = course_offering.quarter_id
+            JOIN course ON course.id = course_offering.course_id
+            JOIN subject ON subject.id = course.subject_id
+            WHERE quarter.code = %(quarter_code)s AND subject.code = ANY(%(subject_codes)s)
+                AND section_group.scraped_at < quarter.scrape_started_at
+        """
+        values = {
+            "quarter_code": quarter_code,
+            "subject_codes": list(subject_codes)
+        }
+        cls.delete_section_groups(conn, section_group_ids, values)
+        cls.execute_str(conn, """
+            DELETE FROM course_offering
+            WHERE quarter_id = (SELECT id FROM quarter WHERE code = %(quarter_code)s)
+                AND NOT EXISTS (SELECT 1 FROM section_group
+                    WHERE section_group.course_offering_id = course_offering.id);
+        """, values)
+        cls.bump_upload_generation(conn)
+
+
+    @classmethod
+    def delete_section_groups(cls, conn, section_group_ids, values):
+        """
+        Delete the section groups selected by the query section_group_ids,
+        with their meetings and search documents.
+        """
+        meeting_ids = f"""
+            SELECT id FROM meeting WHERE section_group_id IN ({section_group_ids})
+        """
+        for table in ("section_meeting", "general_meeting", "dated_meeting"):
+            cls.execute_str(conn, f"DELETE FROM {table} WHERE meeting_id IN ({meeting_ids});", values)
+        cls.execute_str(conn, f"DELETE FROM meeting WHERE id IN ({meeting_ids});", values)
+        cls.execute_str(conn, "DELETE FROM section_group_search "
+            f"WHERE section_group_id IN ({section_group_ids});", values)
+        cls.execute_str(conn, f"DELETE FROM section_group WHERE id IN ({section_group_ids});", values)
 
 
     @classmethod
@@ -277,6 +1030,8 @@ class DataAccess:
         Delete all course offerings, section groups, and meetings.
         """
         query_str = """
-            TRUNCATE section_meeting, general_meeting, dated_meeting, meeting, section_group, course_offering;
+            TRUNCATE section_meeting, general_meeting, dated_meeting, meeting, section_group_search,
+                section_group, course_offering;
         """
-        cls.execute_str(conn, query_str)
\ No newline at end of file
+        cls.execute_str(conn, query_str)
+        cls.bump_upload_generation(conn)
\ No newline at end of file
@@ -9,12 +9,16 @@ Parameters:
     $6: building
     $7: room
     $8: date
+    $9: days mask
+    $10: start minute
+    $11: end minute
 */
-PREPARE insert_dated_meetings (integer, text, text, time, time, text, text, text) AS
+PREPARE insert_dated_meetings (integer, text, text, time, time, text, text, text, smallint, smallint, smallint) AS
     WITH insert_meeting_get_id AS (
-        INSERT INTO meeting (section_group_id, type_, days, start_time, end_time, building, room)
+        INSERT INTO meeting (section_group_id, type_, days, start_time, end_time, building, room,
+            days_mask, start_minute, end_minute)
         VALUES
-            ($1, $2, $3, $4, $5, $6, $7)
+            ($1, $2, $3, $4, $5, $6, $7, $9, $10, $11)
         RETURNING id
     )
     INSERT INTO dated_meeting (meeting_id, date_)
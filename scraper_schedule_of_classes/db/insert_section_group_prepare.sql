@@ -9,7 +9,8 @@ PREPARE insert_section_group (int, text, text) AS
         INSERT INTO section_group (course_offering_id, code, instructor)
         VALUES 
             ($1, $2, $3)
-        ON CONFLICT (course_offering_id, code) DO NOTHING
+        ON CONFLICT (course_offering_id, code)
+        DO UPDATE SET scraped_at = now(), instructor = EXCLUDED.instructor
         RETURNING id
     )
     SELECT * FROM insert_section_group_get_id
@@ -10,12 +10,16 @@ Parameters:
     $7: room
     $8: (meeting) number
     $9: seats available
+    $10: days mask
+    $11: start minute
+    $12: end minute
 */
-PREPARE insert_section_meetings (integer, text, text, time, time, text, text, text, integer) AS
+PREPARE insert_section_meetings (integer, text, text, time, time, text, text, text, integer, smallint, smallint, smallint) AS
     WITH insert_meeting_get_id AS (
-        INSERT INTO meeting (section_group_id, type_, days, start_time, end_time, building, room)
+        INSERT INTO meeting (section_group_id, type_, days, start_time, end_time, building, room,
+            days_mask, start_minute, end_minute)
         VALUES
-            ($1, $2, $3, $4, $5, $6, $7)
+            ($1, $2, $3, $4, $5, $6, $7, $10, $11, $12)
         RETURNING id
     )
     INSERT INTO section_meeting (meeting_id, number_, seats_available)
@@ -0,0 +1,204 @@
+"""
+Seat change events. Uploads compare the seats of every section meeting
+with the last known ones (table section_seats, kept across resets) and
+publish only the changes, batched, either as Postgres notifications on a
+channel or appended to a local change log (json lines).
+
+A batch is {"v": 1, "t": <unix time>, "c": [[quarter_code, subj_code,
+number, section_group_code, section_number, old_seats, new_seats], ...]},
+old_seats being None for a section not seen before.
+"""
+import collections
+import json
+import os
+import select
+import time
+
+from scraper_schedule_of_classes.db.db import DataAccess
+from scraper_schedule_of_classes.db.seat_history import record_seats
+from scraper_schedule_of_classes.db.config import SEAT_CHANGES_CHANNEL, SEAT_CHANGES_LOG
+
+
+SEAT_CHANGES_VERSION = 1
+
+# Postgres notification payloads must be under 8000 bytes.
+MAX_PAYLOAD_BYTES = 7900
+
+SeatChange = collections.namedtuple("SeatChange", ["quarter_code", "subj_code", "number",
+    "section_group_code", "section_number", "old_seats", "new_seats"])
+
+
+def encode_batches(changes, max_bytes=MAX_PAYLOAD_BYTES):
+    """
+    Compact json payloads of at most max_bytes holding the changes.
+    """
+    timestamp = int(time.time())
+    batch = []
+    size = 0
+    for change in changes:
+        encoded = json.dumps(list(change), separators=(",", ":"))
+        if batch and size + len(encoded) + 40 > max_bytes:
+            yield encode_batch(batch, timestamp)
+            batch = []
+            size = 0
+        batch.append(encoded)
+        size += len(encoded) + 1
+    if batch:
+        yield encode_batch(batch, timestamp)
+
+
+def encode_batch(encoded_changes, timestamp):
+    return f'{{"v":{SEAT_CHANGES_VERSION},"t":{timestamp},"c":[{",".join(encoded_changes)}]}}'
+
+
+def decode_batch(payload):
+    """
+    The SeatChanges of one payload.
+    """
+    batch = json.loads(payload)
+    return [SeatChange(*change) for change in batch["c"]]
+
+
+class NotifyPublisher:
+    """
+    Publish with pg_notify, delivered to listeners when the upload's
+    transaction commits.
+    """
+
+    def __init__(self, channel=SEAT_CHANGES_CHANNEL):
+        self.channel = channel
+
+
+    def publish(self, conn, changes):
+        for payload in encode_batches(changes):
+            DataAccess.notify(conn, self.channel, payload)
+
+
+class ChangeLogPublisher:
+    """
+    Append to a local change log, one batch per line.
+    """
+
+    def __init__(self, path=SEAT_CHANGES_LOG):
+        self.path = path
+
+
+    def publish(self, conn, changes):
+        with open(self.path, "a") as f:
+            for payload in encode_batches(changes):
+                f.write(payload + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def make_publisher():
+    """
+    The change log when SEAT_CHANGES_LOG is set, notifications otherwise.
+    """
+    if SEAT_CHANGES_LOG:
+        return ChangeLogPublisher(SEAT_CHANGES_LOG)
+    return NotifyPublisher(SEAT_CHANGES_CHANNEL)
+
+
+class SeatChangeTracker:
+    """
+    Collects the seat changes of uploaded items. load() the last known
+    seats of the quarters first, observe() every item, and flush() in the
+    upload's transaction to save the new seats, add them to the seat
+    history (see seat_history.py) and publish the changes.
+
+    The first upload of a quarter only records seats, it doesn't publish
+    every section as a change.
+    """
+
+    def __init__(self, publisher, batch_size=500, flush_interval=5):
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.previous = {}
+        self.known_quarters = set()
+        self.pending_seats = []
+        self.pending_changes = []
+        self.last_flush = time.monotonic()
+
+
+    def load(self, conn, quarter_codes):
+        self.previous.update(DataAccess.get_section_seats(conn, quarter_codes))
+        self.known_quarters.update(quarter_code for (quarter_code, *_) in self.previous)
+
+
+    def observe(self, item):
+        quarter_code = item.get("quarter_code")
+        subject_code = item.get("subj_code")
+        number = item.get("number")
+        for meeting in item.get("section_meetings") or []:
+            key = (quarter_code, subject_code, number, meeting.get("number"))
+            new_seats = meeting.get("seats_avail")
+            known = key in self.previous
+            old_seats = self.previous.get(key)
+            if known and old_seats == new_seats:
+                continue
+
+            self.previous[key] = new_seats
+            self.pending_seats.append((*key, new_seats))
+            if known or quarter_code in self.known_quarters:
+                self.pending_changes.append(SeatChange(quarter_code, subject_code, number,
+                    item.get("section_group_code"), meeting.get("number"), old_seats, new_seats))
+
+
+    def should_flush(self):
+        return (len(self.pending_seats) >= self.batch_size or
+            (self.pending_seats and time.monotonic() - self.last_flush >= self.flush_interval))
+
+
+    def flush(self, conn):
+        """
+        Save the changed seats and publish the changes. Returns the number
+        of changes published.
+        """
+        num_changes = len(self.pending_changes)
+        if self.pending_seats:
+            DataAccess.upsert_section_seats(conn, self.pending_seats)
+            record_seats(conn, self.pending_seats, int(time.time()))
+        if self.pending_changes:
+            self.publisher.publish(conn, self.pending_changes)
+        self.pending_seats = []
+        self.pending_changes = []
+        self.last_flush = time.monotonic()
+        return num_changes
+
+
+def listen_seat_changes(conn, channel=SEAT_CHANGES_CHANNEL, timeout=None):
+    """
+    Yield SeatChanges as they are published on channel. conn is used for
+    nothing else, and is put in autocommit mode. Returns after timeout
+    seconds without notifications, or never if timeout is None.
+    """
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {channel};")
+
+    while True:
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return
+        conn.poll()
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            yield from decode_batch(notify.payload)
+
+
+def read_change_log(path=SEAT_CHANGES_LOG, offset=0):
+    """
+    Yield (offset, SeatChanges) for every batch in the change log after
+    offset, offset being where reading should resume once that batch is
+    handled. A partially written last line is left for the next read.
+    """
+    if not path or not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            offset += len(line)
+            yield offset, decode_batch(line)
@@ -0,0 +1,179 @@
+"""
+Seat history: the seats available of every section meeting over time,
+recorded only when they change (by SeatChangeTracker, see
+seat_changes.py).
+
+Each section's series is kept in chunks of at most CHUNK_POINTS points
+(table seat_history). A chunk has the time of its first and last point,
+for range queries, and its points packed as deltas: for every point, the
+seconds since the previous point and the change in seats since the
+previous point, as varints (the seats zigzag encoded, since they go both
+ways). The first point of a chunk is relative to its first time and 0
+seats. A point usually takes 3 or 4 bytes.
+
+New points are appended to the section's last chunk, or start a new one
+once it is full. Points are never changed or removed.
+"""
+import datetime
+
+from scraper_schedule_of_classes.db.db import DataAccess
+
+
+CHUNK_POINTS = 256
+
+# Seats of sections without a seat count.
+NO_SEATS = -1
+
+
+def encode_varint(n, out):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def zigzag(n):
+    return (n << 1) if n >= 0 else ((-n << 1) - 1)
+
+
+def unzigzag(n):
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+
+def encode_points(points, prev_time, prev_seats):
+    """
+    Packed (time, seats) points, time in unix seconds, following a point
+    at prev_time with prev_seats.
+    """
+    out = bytearray()
+    for (time, seats) in points:
+        seats = NO_SEATS if seats is None else seats
+        encode_varint(time - prev_time, out)
+        encode_varint(zigzag(seats - prev_seats), out)
+        prev_time, prev_seats = time, seats
+    return bytes(out)
+
+
+def decode_points(first_time, data):
+    """
+    The (time, seats) points of a chunk starting at first_time.
+    """
+    points = []
+    time = first_time
+    seats = 0
+    values = []
+    n = 0
+    shift = 0
+    for byte in data:
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if byte & 0x80:
+            continue
+        values.append(n)
+        n = 0
+        shift = 0
+        if len(values) == 2:
+            time += values[0]
+            seats += unzigzag(values[1])
+            points.append((time, None if seats == NO_SEATS else seats))
+            values = []
+    return points
+
+
+def record_seats(conn, seats, timestamp):
+    """
+    Append a point at timestamp (unix seconds) to the history of every
+    section in seats, a list of
+    (quarter_code, subject_code, course number, section number, seats available)
+    of seats that changed.
+    The histories are locked until conn's transaction ends, so concurrent
+    writers don't append to a chunk against the same last point.
+    """
+    points = {}
+    for (*key, seats_avail) in seats:
+        points.setdefault(tuple(key), []).append((timestamp, seats_avail))
+    if not points:
+        return
+
+    DataAccess.lock_seat_history(conn, list(points))
+    last_chunks = DataAccess.get_last_seat_history_chunks(conn, list(points))
+
+    appends, inserts = seat_history_writes(points, last_chunks)
+    if appends:
+        DataAccess.append_seat_history(conn, appends)
+    if inserts:
+        DataAccess.insert_seat_history(conn, inserts)
+
+
+def seat_history_writes(points, last_chunks):
+    """
+    The appends to last chunks and the new chunks (see append_seat_history
+    and insert_seat_history) recording points, a dict of section key to
+    its new (time, seats) points, given the last chunk of every section
+    that has one.
+    """
+    appends = []
+    inserts = []
+    for key, key_points in points.items():
+        chunk = last_chunks.get(key)
+        if chunk is not None and chunk["num_points"] + len(key_points) <= CHUNK_POINTS:
+            # Times only go forward, even if the clock steps back.
+            key_points = [(max(time, chunk["last_time"]), seats) for (time, seats) in key_points]
+            last_seats = NO_SEATS if chunk["last_seats"] is None else chunk["last_seats"]
+            data = encode_points(key_points, chunk["last_time"], last_seats)
+            appends.append((data, key_points[-1][0], key_points[-1][1], len(key_points),
+                *key, chunk["first_time"]))
+        else:
+            first_time = key_points[0][0]
+            data = encode_points(key_points, first_time, 0)
+            inserts.append((*key, first_time, key_points[-1][0], key_points[-1][1],
+                len(key_points), data))
+    return appends, inserts
+
+
+def chunks_points(chunks, start=None, end=None):
+    """
+    (time, seats) points of chunks, in order, between start and end.
+    """
+    points = []
+    for chunk in sorted(chunks, key=lambda chunk: chunk["first_time"]):
+        points.extend(point for point in decode_points(chunk["first_time"], chunk["points"])
+            if (start is None or point[0] >= start) and (end is None or point[0] <= end))
+    return points
+
+
+def to_unix_time(time):
+    if isinstance(time, datetime.datetime):
+        return int(time.timestamp())
+    return time
+
+
+def section_seat_curve(conn, quarter_code, subject_code, number, section_number,
+        start=None, end=None):
+    """
+    The seats of one section meeting over the quarter, or from start to
+    end (unix seconds or datetimes), as a list of (unix time, seats),
+    one point per change.
+    """
+    start, end = to_unix_time(start), to_unix_time(end)
+    chunks = DataAccess.select_seat_history(conn, quarter_code, subject_code, number,
+        section_number, start, end)
+    return chunks_points(chunks, start, end)
+
+
+def course_seat_curves(conn, quarter_code, subject_code, number, start=None, end=None):
+    """
+    section_seat_curve for every section meeting of a course, as a dict
+    of section number to its curve.
+    """
+    start, end = to_unix_time(start), to_unix_time(end)
+    chunks = DataAccess.select_seat_history(conn, quarter_code, subject_code, number,
+        None, start, end)
+
+    section_chunks = {}
+    for chunk in chunks:
+        section_chunks.setdefault(chunk["section_number"], []).append(chunk)
+    return {
+        section_number: chunks_points(chunks, start, end)
+        for section_number, chunks in sorted(section_chunks.items())
+    }
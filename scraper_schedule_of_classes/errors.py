@@ -1,3 +1,6 @@
+from scrapy.exceptions import DropItem
+
+
 class MissingSubjectError(Exception):
     pass
 
@@ -5,4 +8,22 @@ class MissingQuarterError(Exception):
     pass
 
 class ScraperError(Exception):
+    pass
+
+class CancelledMeetingError(ScraperError):
+    pass
+
+class SnapshotError(Exception):
+    pass
+
+class ItemFeedError(Exception):
+    pass
+
+class ShardSpecError(Exception):
+    pass
+
+class CheckpointError(Exception):
+    pass
+
+class NoSectionMeetingsError(DropItem):
     pass
\ No newline at end of file
@@ -0,0 +1,157 @@
+import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from itemadapter import ItemAdapter
+from scrapy.exporters import BaseItemExporter
+
+
+SECTION_GROUPS_TABLE = "section_groups"
+MEETINGS_TABLE = "meetings"
+
+# Which list of a CourseMeetings item each meeting came from.
+MEETING_CATEGORIES = (
+    ("section", "section_meetings"),
+    ("general", "general_meetings"),
+    ("dated", "dated_meetings"),
+)
+
+SECTION_GROUPS_SCHEMA = pa.schema([
+    ("section_group_id", pa.int32()),
+    ("quarter_code", pa.dictionary(pa.int32(), pa.string())),
+    ("subj_code", pa.dictionary(pa.int32(), pa.string())),
+    ("number", pa.dictionary(pa.int32(), pa.string())),
+    ("title", pa.dictionary(pa.int32(), pa.string())),
+    ("section_group_code", pa.dictionary(pa.int32(), pa.string())),
+    ("instructor", pa.dictionary(pa.int32(), pa.string())),
+])
+
+MEETINGS_SCHEMA = pa.schema([
+    ("section_group_id", pa.int32()),
+    ("category", pa.dictionary(pa.int8(), pa.string())),
+    ("sec_id", pa.string()),
+    ("type_", pa.dictionary(pa.int8(), pa.string())),
+    ("number", pa.dictionary(pa.int32(), pa.string())),
+    ("date", pa.date32()),
+    ("days", pa.dictionary(pa.int8(), pa.string())),
+    ("start_time", pa.time32("s")),
+    ("end_time", pa.time32("s")),
+    ("days_mask", pa.uint8()),
+    ("start_minute", pa.int16()),
+    ("end_minute", pa.int16()),
+    ("bldg", pa.dictionary(pa.int32(), pa.string())),
+    ("room", pa.dictionary(pa.int32(), pa.string())),
+    ("instructor", pa.dictionary(pa.int32(), pa.string())),
+    ("seats_avail", pa.int32()),
+    ("essential", pa.bool_()),
+])
+
+TABLE_SCHEMAS = {
+    SECTION_GROUPS_TABLE: SECTION_GROUPS_SCHEMA,
+    MEETINGS_TABLE: MEETINGS_SCHEMA,
+}
+
+
+def parse_meeting_date(date):
+    """
+    Meeting dates are scraped as mm/dd/yyyy strings.
+    """
+    if date is None:
+        return None
+    return datetime.datetime.strptime(date, "%m/%d/%Y").date()
+
+
+class ColumnarQuarter:
+    """
+    Accumulates CourseMeetings items column by column, then builds one
+    arrow table of section groups and one of meetings. Meetings refer
+    to their section group by section_group_id, the position of the item.
+    """
+
+    def __init__(self):
+        self.columns = {
+            name: {field.name: [] for field in schema}
+            for name, schema in TABLE_SCHEMAS.items()
+        }
+        self.num_section_groups = 0
+
+
+    def add_item(self, item):
+        adapter = ItemAdapter(item)
+        section_group_id = self.num_section_groups
+        self.num_section_groups += 1
+
+        section_group_cols = self.columns[SECTION_GROUPS_TABLE]
+        section_group_cols["section_group_id"].append(section_group_id)
+        for name in SECTION_GROUPS_SCHEMA.names[1:]:
+            section_group_cols[name].append(adapter.get(name))
+
+        meeting_cols = self.columns[MEETINGS_TABLE]
+        for category, field in MEETING_CATEGORIES:
+            for meeting in adapter.get(field) or []:
+                for name in MEETINGS_SCHEMA.names:
+                    if name == "section_group_id":
+                        value = section_group_id
+                    elif name == "category":
+                        value = category
+                    elif name == "date":
+                        value = parse_meeting_date(meeting.get("date"))
+                    else:
+                        value = meeting.get(name)
+                    meeting_cols[name].append(value)
+
+
+    def table(self, name):
+        schema = TABLE_SCHEMAS[name]
+        cols = self.columns[name]
+        arrays = []
+        for field in schema:
+            if pa.types.is_dictionary(field.type):
+                array = pa.array(cols[field.name], pa.string()) \
+                    .dictionary_encode().cast(field.type)
+            else:
+                array = pa.array(cols[field.name], field.type)
+            arrays.append(array)
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+
+    def write_parquet(self, directory):
+        """
+        Write both tables as <directory>/<table name>.parquet
+        """
+        for name in TABLE_SCHEMAS:
+            pq.write_table(self.table(name), f"{directory}/{name}.parquet")
+
+
+class ParquetItemExporter(BaseItemExporter):
+    """
+    Feed exporter writing one of the columnar tables of CourseMeetings
+    items to a single parquet file. Use one feed per table, e.g.
+
+    FEEDS = {
+        'section_groups.parquet': {
+            'format': 'parquet',
+            'item_export_kwargs': {'table': 'section_groups'},
+        },
+        'meetings.parquet': {
+            'format': 'parquet',
+            'item_export_kwargs': {'table': 'meetings'},
+        },
+    }
+    """
+
+    def __init__(self, file, table=MEETINGS_TABLE, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        if table not in TABLE_SCHEMAS:
+            raise ValueError(f"Unknown columnar table {table}")
+        self.file = file
+        self.table_name = table
+        self.quarter = ColumnarQuarter()
+
+
+    def export_item(self, item):
+        self.quarter.add_item(item)
+
+
+    def finish_exporting(self):
+        pq.write_table(self.quarter.table(self.table_name), self.file)
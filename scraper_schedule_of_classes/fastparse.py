@@ -0,0 +1,293 @@
+"""
+Fast extraction of the course rows of a results page: precompiled patterns
+run over the response bytes, without building a tree of the page.
+
+The results table is regular enough for its rows and cells to be cut out
+with patterns. Rows come out as FastRow objects, which offer the part of
+the bs4 tag interface the spider uses (name, text, class, the cells, the
+link of a cell), with the same text bs4 would give, so grouping and
+build_item_from_group work on them unchanged.
+
+Anything the patterns can't be trusted with falls back to BeautifulSoup,
+for that row only: a row that isn't closed before the next one starts, a
+row with a comment, script, stray "<", text outside of its cells, an
+ambiguous character reference or an unclosed cell or link. A page with
+more tables than the results page has (a table inside a row), or that
+isn't utf-8, is parsed with bs4 entirely.
+"""
+import html
+import re
+
+from bs4 import BeautifulSoup
+
+import scraper_schedule_of_classes.utils as utils
+
+
+# The inside of a tag, with quoted attribute values that may hold ">".
+_TAG_BODY = rb"""(?:[^>"']|"[^"]*"|'[^']*')*"""
+
+# Row starts. Comments, scripts and styles, which may hold "<tr", are
+# matched too, to be skipped.
+ROW_START_REGEX = re.compile(
+    rb"<!--.*?-->|<script\b.*?</script\s*>|<style\b.*?</style\s*>|<tr\b(" + _TAG_BODY + rb")>",
+    re.DOTALL | re.IGNORECASE)
+ROW_END_REGEX = re.compile(rb"</tr\s*>", re.IGNORECASE)
+# What closes a row without a </tr> of its own.
+ROW_CLOSE_REGEX = re.compile(rb"<tr\b|</table\s*>", re.IGNORECASE)
+CELL_REGEX = re.compile(rb"<td\b(" + _TAG_BODY + rb")>(.*?)</td\s*>",
+    re.DOTALL | re.IGNORECASE)
+CELL_START_REGEX = re.compile(rb"<td\b", re.IGNORECASE)
+LINK_REGEX = re.compile(rb"<a\b" + _TAG_BODY + rb">(.*?)</a\s*>", re.DOTALL | re.IGNORECASE)
+LINK_START_REGEX = re.compile(rb"<a\b", re.IGNORECASE)
+TAG_REGEX = re.compile(rb"</?[a-zA-Z]" + _TAG_BODY + rb">")
+ATTRIBUTE_REGEX = re.compile(
+    rb"""([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+)))?""")
+CHARSET_REGEX = re.compile(rb"""<meta\b[^>]*charset\s*=\s*["']?([\w-]+)""", re.IGNORECASE)
+TABLE_REGEX = re.compile(rb"<table\b", re.IGNORECASE)
+
+# Row content an html parser doesn't read as plain tags and text.
+ROW_ANOMALY_REGEX = re.compile(
+    rb"<tr\b|<table\b|<!--|<!\[CDATA\[|<script\b|<style\b|<textarea\b|<pre\b|<(?![a-zA-Z/])",
+    re.IGNORECASE)
+# Character references that may not decode like the html parser decodes
+# them: not terminated by ";".
+AMBIGUOUS_CHAR_REF_REGEX = re.compile(
+    rb"&(?=[a-zA-Z0-9#])(?!#[0-9]+;|#[xX][0-9a-fA-F]+;|[a-zA-Z][a-zA-Z0-9]*;)")
+
+# Whitespace bs4 collapses strings made only of.
+ASCII_SPACES = {ord(c): None for c in "\x20\x0a\x09\x0c\x0d"}
+
+# Attributes bs4 splits into several values.
+MULTI_VALUED_ATTRIBUTES = {"class"}
+
+# The results page has 3 tables of its own.
+PAGE_TABLES = 3
+
+
+class FallbackRow(Exception):
+    """
+    A row the patterns can't be trusted with.
+    """
+    pass
+
+
+def parse_attributes(data):
+    attrs = {}
+    for match in ATTRIBUTE_REGEX.finditer(data):
+        name = match.group(1).decode("utf-8").lower()
+        if name in attrs:
+            continue
+        value = next((value for value in match.group(2, 3, 4) if value is not None), b"")
+        value = html.unescape(value.decode("utf-8"))
+        attrs[name] = value.split() if name in MULTI_VALUED_ATTRIBUTES else value
+    return attrs
+
+
+def string_text(data):
+    """
+    Text of a string between tags, as bs4 has it: line breaks normalized,
+    character references decoded, and a string of only whitespace
+    collapsed to a line break or a space.
+    """
+    if AMBIGUOUS_CHAR_REF_REGEX.search(data):
+        raise FallbackRow("ambiguous character reference")
+    text = html.unescape(data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n"))
+    if text and not text.translate(ASCII_SPACES):
+        return "\n" if "\n" in text else " "
+    return text
+
+
+def html_text(data):
+    """
+    Text of an html fragment with only plain tags, like bs4's tag.text.
+    """
+    return "".join(string_text(string) for string in TAG_REGEX.split(data))
+
+
+class FastLink:
+    """
+    An a in a FastCell.
+    """
+    name = "a"
+
+    def __init__(self, data):
+        self.text = html_text(data)
+
+
+class FastCell:
+    """
+    A td of a FastRow.
+    """
+    name = "td"
+
+    def __init__(self, attrs_data, data):
+        self.attrs = parse_attributes(attrs_data)
+        self.text = html_text(data)
+
+        self.a = None
+        if LINK_START_REGEX.search(data):
+            match = LINK_REGEX.search(data)
+            if match is None:
+                raise FallbackRow("unclosed link")
+            self.a = FastLink(match.group(1))
+
+    def has_attr(self, name):
+        return name in self.attrs
+
+    def __getitem__(self, name):
+        return self.attrs[name]
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+
+class FastRow:
+    """
+    A tr cut out of the page, with the part of the bs4 tag interface the
+    spider uses.
+    """
+    name = "tr"
+
+    def __init__(self, attrs_data, data):
+        if ROW_ANOMALY_REGEX.search(data):
+            raise FallbackRow("unexpected markup in row")
+
+        self.attrs = parse_attributes(attrs_data)
+        self.cells = []
+        strings = []
+        pos = 0
+        for match in CELL_REGEX.finditer(data):
+            # Text between cells is moved out of the table by the parser.
+            between = html_text(data[pos:match.start()])
+            if between.strip():
+                raise FallbackRow("text outside of cells")
+            cell = FastCell(match.group(1), match.group(2))
+            self.cells.append(cell)
+            strings += [between, cell.text]
+            pos = match.end()
+
+        between = html_text(data[pos:])
+        if between.strip():
+            raise FallbackRow("text outside of cells")
+        if len(self.cells) != len(CELL_START_REGEX.findall(data)):
+            raise FallbackRow("unclosed cell")
+        self.text = "".join(strings) + between
+
+    @property
+    def td(self):
+        return self.cells[0] if self.cells else None
+
+    def find_all(self, name):
+        if name != "td":
+            raise ValueError(f"FastRow only finds td, not {name}")
+        return self.cells
+
+    def has_attr(self, name):
+        return name in self.attrs
+
+    def __getitem__(self, name):
+        return self.attrs[name]
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+
+def soup_tags(data):
+    """
+    Matching tags of a page, or part of one, the existing way: with bs4.
+    """
+    soup = BeautifulSoup(data, "lxml")
+    return soup, soup.find_all(utils.tag_matches_any)
+
+
+class FastPageParser:
+    """
+    The rows of a results page matching utils.tag_matches_any, in page
+    order: FastRows, and bs4 tags for the rows that fell back.
+
+    num_pages is the page count of the page. num_fallback_rows counts the
+    rows parsed with bs4; page_fell_back tells whether the whole page was.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.num_fallback_rows = 0
+        self.soup = None
+        self.page_fell_back = self.page_needs_fallback()
+        if self.page_fell_back:
+            self.soup, self.tags = soup_tags(body)
+
+
+    def page_needs_fallback(self):
+        match = CHARSET_REGEX.search(self.body, 0, 4096)
+        if match and match.group(1).lower() not in (b"utf-8", b"utf8"):
+            return True
+        try:
+            self.body.decode("utf-8")
+        except UnicodeDecodeError:
+            return True
+        # A row holding a table of its own.
+        return len(TABLE_REGEX.findall(self.body)) > PAGE_TABLES
+
+
+    def get_num_pages(self, page_num_regex):
+        """
+        Like the spider's get_num_pages: the last match of page_num_regex
+        in a right aligned cell.
+        """
+        if self.soup is not None:
+            texts = (td.text for td in self.soup.select("td[align='right']"))
+        else:
+            texts = (cell_text for (attrs, cell_text) in self.iter_cells()
+                if attrs.get("align") == "right")
+
+        num_pages = 0
+        for text in texts:
+            match = page_num_regex.search(text)
+            if match:
+                num_pages = int(match.group(1))
+        return num_pages
+
+
+    def iter_cells(self):
+        for match in CELL_REGEX.finditer(self.body):
+            try:
+                yield parse_attributes(match.group(1)), html_text(match.group(2))
+            except FallbackRow:
+                pass
+
+
+    def iter_tags(self):
+        if self.page_fell_back:
+            yield from self.tags
+            return
+
+        body = self.body
+        pos = 0
+        while True:
+            start = ROW_START_REGEX.search(body, pos)
+            if start is None:
+                return
+            pos = start.end()
+            # A comment, script or style.
+            if start.group(1) is None:
+                continue
+
+            end = ROW_END_REGEX.search(body, pos)
+            close = ROW_CLOSE_REGEX.search(body, pos)
+            try:
+                if end is None or (close is not None and close.start() < end.start()):
+                    raise FallbackRow("unclosed row")
+                row = FastRow(start.group(1), body[pos:end.start()])
+                pos = end.end()
+                if utils.tag_matches_any(row):
+                    yield row
+            except FallbackRow:
+                # The row ends at its </tr>, or where it is closed.
+                if end is None or (close is not None and close.start() < end.start()):
+                    pos = close.start() if close is not None else len(body)
+                else:
+                    pos = end.end()
+                self.num_fallback_rows += 1
+                _, tags = soup_tags(b"<table>" + body[start.start():pos] + b"</table>")
+                yield from tags
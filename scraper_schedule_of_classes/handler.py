@@ -0,0 +1,139 @@
+"""
+Serverless entry point: handler(event, context) crawls a quarter and
+inserts it into the database, like run_quarter.py.
+
+Everything that doesn't depend on the event is set up on the first
+invocation of a container and kept for the next ones: the database
+credentials (resolved at import by db/config.py) and connection pool,
+the prepared insert statements of the pooled connections, the spiders'
+compiled parsers, the subject list of every quarter crawled, and the
+reactor with its crawler runner. A warm invocation only fetches, parses
+and writes.
+
+Event:
+    {
+        "quarter_code": "SP21",
+        "quarter_name": "Spring 2021",
+        "subject_codes": ["CSE", "MATH"],   (optional, default all)
+        "refresh_subjects": false           (optional)
+    }
+
+The crawl stops before the invocation runs out of time, and the next
+invocation for the same quarter continues where it stopped (the
+checkpoint is kept in HANDLER_CHECKPOINT_DIR, /tmp by default).
+"""
+import os
+import time
+
+from scrapy.utils.project import get_project_settings
+
+from scraper_schedule_of_classes.checkpoint import load_resumable
+from scraper_schedule_of_classes.db.db import DataAccess
+from scraper_schedule_of_classes.runner import ReusableCrawlRunner
+from scraper_schedule_of_classes.spiders.subjects_spider import SubjectsSpider
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+import scraper_schedule_of_classes.errors as errors
+
+
+settings = get_project_settings().copy()
+settings.set("FEEDS", {})
+settings.set("DATABASE_UPLOAD", True)
+settings.set("LOG_FILE", None)
+
+# Kept across warm invocations.
+runner = ReusableCrawlRunner(settings)
+# quarter code -> (subject codes, time they were crawled)
+subject_lists = {}
+
+
+def get_subject_codes(quarter_code, refresh=False):
+    """
+    The subject codes of the quarter, crawled with the subjects spider at
+    most every HANDLER_SUBJECTS_TTL seconds.
+    """
+    cached = subject_lists.get(quarter_code)
+    if (not refresh and cached is not None and
+            time.monotonic() - cached[1] < settings.getfloat("HANDLER_SUBJECTS_TTL")):
+        return cached[0]
+
+    subject_codes = []
+    def subjects_scraped(item, response, spider):
+        subject_codes.extend(item.get("subject_codes", []))
+    runner.crawl(SubjectsSpider, item_scraped=subjects_scraped, quarter_code=quarter_code)
+
+    # Nothing is crawled (or reset) without subjects.
+    if not subject_codes:
+        raise errors.MissingSubjectError(f"No subjects found for {quarter_code}.")
+    subject_lists[quarter_code] = (subject_codes, time.monotonic())
+    return subject_codes
+
+
+def checkpoint_path(quarter_code):
+    return os.path.join(settings.get("HANDLER_CHECKPOINT_DIR"),
+        f"crawl_checkpoint.{quarter_code}.json")
+
+
+def crawl_settings(quarter_code, context):
+    """
+    Settings of this invocation's courses crawl: its checkpoint, and the
+    time left in the invocation as its time budget, so call it right
+    before the crawl.
+    """
+    crawl_settings = settings.copy()
+    crawl_settings.set("CRAWL_CHECKPOINT_PATH", checkpoint_path(quarter_code))
+    if context is not None:
+        crawl_settings.set("CRAWL_TIME_BUDGET", context.get_remaining_time_in_millis() / 1000)
+    return crawl_settings
+
+
+def handler(event, context):
+    start = time.perf_counter()
+    warm = runner.started
+    runner.start()
+
+    quarter_code = event.get("quarter_code")
+    if not quarter_code:
+        raise errors.MissingQuarterError("The handler needs a quarter_code.")
+    quarter_name = event.get("quarter_name") or quarter_code
+
+    checkpoint = load_resumable(checkpoint_path(quarter_code))
+    if checkpoint is not None:
+        # The previous invocation ran out of time: its items are already
+        # in the database, only crawl what's left.
+        subject_codes = checkpoint.subject_codes
+    else:
+        subject_codes = event.get("subject_codes") or get_subject_codes(quarter_code,
+            event.get("refresh_subjects", False))
+
+        # Insert this quarter. The previous scrape stays readable while
+        # this one is written over it, see run_quarter.py.
+        conn = DataAccess.get_conn()
+        with conn:
+            DataAccess.insert_quarter(conn, quarter_code, quarter_name)
+            DataAccess.start_scrape(conn, quarter_code)
+        DataAccess.put_conn(conn)
+
+    # The subjects crawl and the database took part of the invocation.
+    courses_settings = crawl_settings(quarter_code, context)
+    crawler = runner.crawl(SubjectCoursesSpider, settings=courses_settings,
+        quarter_code=quarter_code, subject_codes=subject_codes)
+    stats = crawler.stats.get_stats()
+
+    # Complete: clear what this scrape didn't find.
+    if crawler.spider.checkpoint.finished:
+        conn = DataAccess.get_conn()
+        with conn:
+            DataAccess.end_scrape(conn, quarter_code, subject_codes)
+        DataAccess.put_conn(conn)
+
+    return {
+        "quarter_code": quarter_code,
+        "warm": warm,
+        "resumed": checkpoint is not None,
+        "finish_reason": stats.get("finish_reason"),
+        "complete": crawler.spider.checkpoint.finished,
+        "num_subjects": len(subject_codes),
+        "items": stats.get("item_scraped_count", 0),
+        "pages": stats.get("response_received_count", 0),
+        "seconds": time.perf_counter() - start,
+    }
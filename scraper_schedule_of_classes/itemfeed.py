@@ -0,0 +1,219 @@
+"""
+Indexed item feed: course items pickled one per record, grouped by subject,
+with a sidecar index of where each subject's records are. Readers can seek
+straight to the subjects they want and decode them on their own, so a feed
+can be split between several uploader processes, or one subject read alone.
+
+Feed file (little endian):
+    header      HEADER_STRUCT: magic, version
+    records     RECORD_STRUCT: payload length, crc32 of the payload,
+                then the payload, a pickled item
+
+Records of a subject are written together, in blocks of about BLOCK_SIZE
+bytes, so a subject is a few contiguous byte ranges of the feed. Blocks
+are in no particular order, but the records of a subject are in the order
+its items were scraped.
+
+Index file (<feed>.idx), json:
+    {
+        "v": 1,
+        "feed_size": <size of the feed it describes>,
+        "num_items": <number of records>,
+        "blocks": [
+            {"quarter_code": "WI21", "subj_code": "CSE",
+                "offset": 8, "length": 65536, "num_items": 97},
+            ...
+        ]
+    }
+The index is written once the feed is complete. A feed whose size doesn't
+match its index is rejected.
+"""
+import json
+import os
+import pickle
+import struct
+import zlib
+
+import scraper_schedule_of_classes.errors as errors
+
+
+FEED_MAGIC = b"EZIF"
+FEED_VERSION = 1
+
+# magic, version, reserved.
+HEADER_STRUCT = struct.Struct("<4sHH")
+# payload length, crc32 of the payload.
+RECORD_STRUCT = struct.Struct("<II")
+
+# Bytes of records a subject buffers before they are written as a block.
+BLOCK_SIZE = 64 * 1024
+
+
+def index_path(feed_path):
+    return f"{feed_path}.idx"
+
+
+def is_item_feed(path):
+    """
+    True if the file at path is an item feed, as opposed to a pickle feed.
+    """
+    with open(path, "rb") as f:
+        return f.read(len(FEED_MAGIC)) == FEED_MAGIC
+
+
+class ItemFeedWriter:
+    """
+    Writes items to an item feed at path, and its index on close().
+    Items are buffered per subject until their subject has block_size
+    bytes of records.
+    """
+
+    def __init__(self, path, block_size=BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self.file = open(path, "wb")
+        self.file.write(HEADER_STRUCT.pack(FEED_MAGIC, FEED_VERSION, 0))
+        # (quarter code, subject code) to its buffered records and their count.
+        self.buffers = {}
+        self.blocks = []
+        self.num_items = 0
+
+
+    def add(self, item):
+        key = (item.get("quarter_code"), item.get("subj_code"))
+        payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        buffer = self.buffers.setdefault(key, [bytearray(), 0])
+        buffer[0] += RECORD_STRUCT.pack(len(payload), zlib.crc32(payload))
+        buffer[0] += payload
+        buffer[1] += 1
+        self.num_items += 1
+        if len(buffer[0]) >= self.block_size:
+            self.write_block(key)
+
+
+    def write_block(self, key):
+        data, num_items = self.buffers.pop(key)
+        self.blocks.append({
+            "quarter_code": key[0],
+            "subj_code": key[1],
+            "offset": self.file.tell(),
+            "length": len(data),
+            "num_items": num_items,
+        })
+        self.file.write(data)
+
+
+    def close(self):
+        for key in sorted(self.buffers, key=lambda key: tuple(map(str, key))):
+            self.write_block(key)
+        feed_size = self.file.tell()
+        self.file.close()
+
+        index = {
+            "v": FEED_VERSION,
+            "feed_size": feed_size,
+            "num_items": self.num_items,
+            "blocks": self.blocks,
+        }
+        tmp_path = f"{index_path(self.path)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp_path, index_path(self.path))
+
+
+def write_item_feed(items, path, block_size=BLOCK_SIZE):
+    writer = ItemFeedWriter(path, block_size)
+    for item in items:
+        writer.add(item)
+    writer.close()
+
+
+def read_index(path):
+    """
+    The blocks of the item feed at path, from its index.
+    """
+    try:
+        with open(index_path(path)) as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        raise errors.ItemFeedError(f"{path} has no index {index_path(path)}")
+
+    if index.get("v") != FEED_VERSION:
+        raise errors.ItemFeedError(
+            f"{index_path(path)} has version {index.get('v')}, expected {FEED_VERSION}")
+    if index["feed_size"] != os.path.getsize(path):
+        raise errors.ItemFeedError(f"{index_path(path)} doesn't match {path}")
+    return index["blocks"]
+
+
+def subject_blocks(blocks, subject_codes, quarter_code=None):
+    """
+    The blocks of the given subjects, of quarter_code or any quarter.
+    """
+    subject_codes = set(subject_codes)
+    return [block for block in blocks
+        if block["subj_code"] in subject_codes and
+            (quarter_code is None or block["quarter_code"] == quarter_code)]
+
+
+def decode_records(data, offset=0):
+    """
+    The items of a run of records, offset being where data starts in the
+    feed, for errors.
+    """
+    items = []
+    view = memoryview(data)
+    pos = 0
+    while pos < len(view):
+        if pos + RECORD_STRUCT.size > len(view):
+            raise errors.ItemFeedError(f"truncated record at {offset + pos}")
+        length, crc = RECORD_STRUCT.unpack_from(view, pos)
+        pos += RECORD_STRUCT.size
+        payload = view[pos:pos + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            raise errors.ItemFeedError(f"corrupt record at {offset + pos - RECORD_STRUCT.size}")
+        items.append(pickle.loads(payload))
+        pos += length
+    return items
+
+
+def read_header(f, path):
+    header = f.read(HEADER_STRUCT.size)
+    if len(header) < HEADER_STRUCT.size:
+        raise errors.ItemFeedError(f"{path} is too small to be an item feed")
+    magic, version, _ = HEADER_STRUCT.unpack(header)
+    if magic != FEED_MAGIC:
+        raise errors.ItemFeedError(f"{path} is not an item feed")
+    if version != FEED_VERSION:
+        raise errors.ItemFeedError(
+            f"{path} has item feed version {version}, expected {FEED_VERSION}")
+
+
+def read_blocks(path, blocks):
+    """
+    The items of the given blocks of the feed at path, block by block.
+    """
+    items = []
+    with open(path, "rb") as f:
+        read_header(f, path)
+        for block in blocks:
+            f.seek(block["offset"])
+            data = f.read(block["length"])
+            if len(data) != block["length"]:
+                raise errors.ItemFeedError(f"{path} is truncated at {block['offset']}")
+            block_items = decode_records(data, block["offset"])
+            if len(block_items) != block["num_items"]:
+                raise errors.ItemFeedError(f"block at {block['offset']} of {path} has "
+                    f"{len(block_items)} items, expected {block['num_items']}")
+            items.extend(block_items)
+    return items
+
+
+def read_item_feed(path, subject_codes=None, quarter_code=None):
+    """
+    The items of the feed at path, or only those of the given subjects.
+    """
+    blocks = read_index(path)
+    if subject_codes is not None:
+        blocks = subject_blocks(blocks, subject_codes, quarter_code)
+    return read_blocks(path, blocks)
@@ -26,6 +26,11 @@ class Meeting(Item):
     days = Field()
     start_time = Field()
     end_time = Field()
+    # Same as days/start_time/end_time, encoded for conflict checks:
+    # 7 bit day mask (utils.days_to_mask), minutes since midnight.
+    days_mask = Field()
+    start_minute = Field()
+    end_minute = Field()
     bldg = Field()
     room = Field()
     instructor = Field()
@@ -62,6 +67,9 @@ class CourseMeetingsUncategorized(Item):
     first_meeting = Field()
     sectxt_meetings = Field()
     nonenrtxt_meetings = Field()
+    # Cell texts and context of the rows, only while quarantining
+    # (see quarantine.py), for when the item is dropped.
+    raw_group = Field()
 
 
 class CourseMeetingsUncategorizedLoader(ItemLoader):
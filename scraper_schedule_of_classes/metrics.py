@@ -0,0 +1,204 @@
+import collections
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.web import resource, server
+
+
+# Upper bounds, in seconds, of the histogram buckets.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds of the buckets for counts (e.g. items per page).
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+METRIC_PREFIX = "scraper_"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{name}="{value}"' for name, value in labels)
+    return f"{{{inner}}}"
+
+
+class Histogram:
+    """
+    Cumulative histogram in the prometheus sense: bucket i counts the
+    observations <= buckets[i].
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.bucket_counts[i] += 1
+
+
+    def to_prometheus(self, name, labels):
+        lines = []
+        for upper, bucket_count in zip(self.buckets, self.bucket_counts):
+            bucket_labels = labels + (("le", upper), )
+            lines.append(f"{name}_bucket{format_labels(bucket_labels)} {bucket_count}")
+        inf_labels = labels + (("le", "+Inf"), )
+        lines.append(f"{name}_bucket{format_labels(inf_labels)} {self.count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+
+class CrawlMetrics:
+    """
+    Histograms and counters for one crawl, keyed by (name, labels), where
+    labels is a tuple of (label, value) pairs. Also keeps a per-subject
+    breakdown.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = collections.Counter()
+        self.subjects = collections.defaultdict(collections.Counter)
+        self.start_time = time.monotonic()
+
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(buckets)
+        self.histograms[key].observe(value)
+
+
+    def inc(self, name, value=1, **labels):
+        self.counters[(name, tuple(sorted(labels.items())))] += value
+
+
+    def inc_subject(self, subject_code, name, value=1):
+        self.subjects[subject_code][name] += value
+
+
+    def to_prometheus(self):
+        lines = []
+
+        histogram_names = set()
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            full_name = METRIC_PREFIX + name
+            if name not in histogram_names:
+                lines.append(f"# TYPE {full_name} histogram")
+                histogram_names.add(name)
+            lines.extend(histogram.to_prometheus(full_name, labels))
+
+        counter_names = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            full_name = METRIC_PREFIX + name
+            if name not in counter_names:
+                lines.append(f"# TYPE {full_name} counter")
+                counter_names.add(name)
+            lines.append(f"{full_name}{format_labels(labels)} {value}")
+
+        elapsed = time.monotonic() - self.start_time
+        items = sum(value for (name, _), value in self.counters.items() if name == "items_total")
+        lines.append(f"# TYPE {METRIC_PREFIX}items_per_second gauge")
+        lines.append(f"{METRIC_PREFIX}items_per_second {items / elapsed if elapsed else 0}")
+
+        return "\n".join(lines) + "\n"
+
+
+def get_crawl_metrics(crawler):
+    """
+    The metrics of a crawler, created on first use. Shared by the
+    extension, the spider middleware and the pipelines.
+    """
+    if not hasattr(crawler, "crawl_metrics"):
+        crawler.crawl_metrics = CrawlMetrics()
+    return crawler.crawl_metrics
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, metrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b"content-type", b"text/plain; version=0.0.4")
+        return self.metrics.to_prometheus().encode("utf-8")
+
+
+class CrawlMetricsExtension:
+    """
+    Records download latency, page sizes, items and dropped items, and
+    exports all crawl metrics in prometheus text format, to METRICS_FILE
+    when the spider closes and, if METRICS_PORT is set, over http while
+    the crawl runs. Logs a per-subject breakdown at close.
+    Only enabled when METRICS_ENABLED is set.
+    """
+
+    def __init__(self, metrics, metrics_file, metrics_port):
+        self.metrics = metrics
+        self.metrics_file = metrics_file
+        self.metrics_port = metrics_port
+        self.listening_port = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured("METRICS_ENABLED not set")
+
+        ext = cls(get_crawl_metrics(crawler),
+            crawler.settings.get("METRICS_FILE"),
+            crawler.settings.getint("METRICS_PORT"))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.item_dropped, signal=signals.item_dropped)
+        return ext
+
+    def spider_opened(self, spider):
+        if self.metrics_port:
+            from twisted.internet import reactor
+            site = server.Site(MetricsResource(self.metrics))
+            self.listening_port = reactor.listenTCP(self.metrics_port, site)
+
+    def response_received(self, response, request, spider):
+        subject_code = request.cb_kwargs.get("subject_code")
+        latency = request.meta.get("download_latency")
+        if latency is not None:
+            self.metrics.observe("download_latency_seconds", latency)
+            if subject_code:
+                self.metrics.inc_subject(subject_code, "download_seconds", latency)
+        if subject_code:
+            self.metrics.inc_subject(subject_code, "pages")
+            self.metrics.inc_subject(subject_code, "bytes", len(response.body))
+
+    def item_scraped(self, item, response, spider):
+        self.metrics.inc("items_total")
+        subject_code = item.get("subj_code") if hasattr(item, "get") else None
+        if subject_code:
+            self.metrics.inc_subject(subject_code, "items")
+
+    def item_dropped(self, item, response, exception, spider):
+        self.metrics.inc("items_dropped_total", reason=type(exception).__name__)
+        subject_code = item.get("subj_code") if hasattr(item, "get") else None
+        if subject_code:
+            self.metrics.inc_subject(subject_code, "dropped")
+
+    def spider_closed(self, spider):
+        if self.listening_port is not None:
+            self.listening_port.stopListening()
+
+        if self.metrics_file:
+            with open(self.metrics_file, "w") as f:
+                f.write(self.metrics.to_prometheus())
+
+        for subject_code, counts in sorted(self.metrics.subjects.items()):
+            breakdown = ", ".join(f"{name}={value:g}" for name, value in sorted(counts.items()))
+            spider.logger.info(f"metrics {subject_code}: {breakdown}")
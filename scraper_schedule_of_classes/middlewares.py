@@ -3,11 +3,16 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+import time
+
+from scrapy import signals, Request
+from scrapy.exceptions import NotConfigured
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from .metrics import get_crawl_metrics, COUNT_BUCKETS
+
 
 class ScraperScheduleOfClassesSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -101,3 +106,102 @@ class ScraperScheduleOfClassesDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class ParseMetricsSpiderMiddleware:
+    """
+    Times each spider callback (parse, parse_extra_page) and counts the
+    items it produces per page, for the CrawlMetricsExtension.
+    Only enabled when METRICS_ENABLED is set.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured("METRICS_ENABLED not set")
+        return cls(get_crawl_metrics(crawler))
+
+    def process_spider_output(self, response, result, spider):
+        request = response.request
+        callback = getattr(request.callback, "__name__", "parse") if request else "parse"
+        subject_code = request.cb_kwargs.get("subject_code") if request else None
+
+        # Callbacks are generators, so the parse time is the time spent
+        # getting each of their results.
+        parse_time = 0
+        num_items = 0
+        result = iter(result)
+        while True:
+            start = time.perf_counter()
+            try:
+                obj = next(result)
+            except StopIteration:
+                parse_time += time.perf_counter() - start
+                break
+            parse_time += time.perf_counter() - start
+            if not isinstance(obj, Request):
+                num_items += 1
+            yield obj
+
+        self.metrics.observe("parse_seconds", parse_time, callback=callback)
+        self.metrics.observe("items_per_page", num_items, COUNT_BUCKETS, callback=callback)
+        if subject_code:
+            self.metrics.inc_subject(subject_code, "parse_seconds", parse_time)
+
+
+class ByteAccountingDownloaderMiddleware:
+    """
+    Counts the bytes of every page as sent over the wire (before
+    HttpCompressionMiddleware decodes it) and once decoded, in total and
+    per subject, so the savings of compressed transfer show in the crawl
+    stats under bandwidth/. Has to sit closer to the downloader than
+    HttpCompressionMiddleware (590) to see the encoded body.
+    """
+
+    WIRE_BYTES_META_KEY = "wire_bytes"
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("COMPRESSION_ENABLED"):
+            raise NotConfigured("COMPRESSION_ENABLED not set")
+        mw = cls(crawler.stats)
+        crawler.signals.connect(mw.response_received, signal=signals.response_received)
+        crawler.signals.connect(mw.spider_closed, signal=signals.spider_closed)
+        return mw
+
+    def process_response(self, request, response, spider):
+        request.meta[self.WIRE_BYTES_META_KEY] = len(response.body)
+        encoding = response.headers.get(b"Content-Encoding", b"identity")
+        self.stats.inc_value(f"bandwidth/content_encoding/{encoding.decode('latin-1')}")
+        return response
+
+    def response_received(self, response, request, spider):
+        # Only count responses that made it through the downloader
+        # middlewares, retried ones are counted on their last attempt.
+        decoded_bytes = len(response.body)
+        wire_bytes = request.meta.get(self.WIRE_BYTES_META_KEY, decoded_bytes)
+        self.stats.inc_value("bandwidth/wire_bytes", wire_bytes)
+        self.stats.inc_value("bandwidth/decoded_bytes", decoded_bytes)
+
+        subject_code = request.cb_kwargs.get("subject_code")
+        if subject_code:
+            self.stats.inc_value(f"bandwidth/subject/{subject_code}/wire_bytes", wire_bytes)
+            self.stats.inc_value(f"bandwidth/subject/{subject_code}/decoded_bytes", decoded_bytes)
+
+    def spider_closed(self, spider):
+        wire_bytes = self.stats.get_value("bandwidth/wire_bytes", 0)
+        decoded_bytes = self.stats.get_value("bandwidth/decoded_bytes", 0)
+        if not decoded_bytes:
+            return
+
+        saved_bytes = decoded_bytes - wire_bytes
+        self.stats.set_value("bandwidth/saved_bytes", saved_bytes)
+        self.stats.set_value("bandwidth/compression_ratio", round(decoded_bytes / max(wire_bytes, 1), 2))
+        spider.logger.info(f"bandwidth: {wire_bytes} bytes on the wire for {decoded_bytes} "
+            f"decoded bytes, {saved_bytes} bytes ({saved_bytes / decoded_bytes:.0%}) saved")
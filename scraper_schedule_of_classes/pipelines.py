@@ -2,15 +2,22 @@
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
+import os
 import re
 import json
+import time
 import pprint
 import pickle
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
-from scrapy.exceptions import DropItem
+from scrapy.exceptions import DropItem, NotConfigured
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
 from .db.db import DataAccess
+from .db.seat_changes import SeatChangeTracker, make_publisher
+from .errors import NoSectionMeetingsError
+from .metrics import get_crawl_metrics
 from .items import *
 from .utils import CourseItemEncoder
 from .spiders.subject_courses_spider import SubjectCoursesSpider
@@ -63,15 +70,17 @@ class SubjectCleanerPipeline:
             raise e
 
         return {
-            "message": "Subjects successfully saved."
+            "message": "Subjects successfully saved.",
+            "subject_codes": [scn["code"] for scn in subjects_codes_names]
         }
 
     def open_spider(self, spider):
         self.conn = DataAccess.get_conn()
 
     def close_spider(self, spider):
+        # The pool itself is closed by whoever runs the crawl, it may
+        # still be needed by the next spider.
         DataAccess.put_conn(self.conn)
-        DataAccess.close()
 
 
 class CourseCleanerPipeline:
@@ -149,7 +158,7 @@ class CourseCleanerPipeline:
         if not course_item.get("section_meetings"):
             err_msg = f"{item.get('quarter_code')} {item.get('subj_code')} "\
                 f"{item.get('number')} {section_group}: no valid sectxt {item}"
-            raise DropItem(err_msg)
+            raise NoSectionMeetingsError(err_msg)
 
         return course_item
 
@@ -168,4 +177,208 @@ class CoursePersistencePipeline:
         return item
         # item_json_encoded = self.encoder.encode(ItemAdapter(item).asdict())
         # print('boutta write')
-        # JLWriter.writeline(json.dumps(item_json_encoded))
\ No newline at end of file
+        # JLWriter.writeline(json.dumps(item_json_encoded))
+
+
+class CourseColumnarExportPipeline:
+    """
+    Given items from the CourseCleanerPipeline, write the quarter as
+    columnar parquet files (section groups and meetings) once the spider
+    closes. Only enabled when COLUMNAR_EXPORT_DIR is set.
+    """
+
+    def __init__(self, export_dir):
+        # pyarrow is only needed when this pipeline is enabled.
+        from .exporters import ColumnarQuarter
+
+        self.export_dir = export_dir
+        self.quarter = ColumnarQuarter()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        export_dir = crawler.settings.get("COLUMNAR_EXPORT_DIR")
+        if not export_dir:
+            raise NotConfigured("COLUMNAR_EXPORT_DIR not set")
+        return cls(export_dir)
+
+    def process_item(self, item, spider):
+        if not isinstance(spider, SubjectCoursesSpider):
+            return item
+        self.quarter.add_item(item)
+        return item
+
+    def close_spider(self, spider):
+        if not isinstance(spider, SubjectCoursesSpider):
+            return
+        os.makedirs(self.export_dir, exist_ok=True)
+        self.quarter.write_parquet(self.export_dir)
+
+
+class CourseSnapshotPipeline:
+    """
+    Given items from the CourseCleanerPipeline, write the scheduler's
+    binary snapshot of the quarter once the spider closes, then its
+    conflict index if CONFLICT_INDEX_PATH is set.
+    Only enabled when SNAPSHOT_PATH is set.
+    """
+
+    def __init__(self, snapshot_path, conflict_index_path=None):
+        self.snapshot_path = snapshot_path
+        self.conflict_index_path = conflict_index_path
+        self.items = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        snapshot_path = crawler.settings.get("SNAPSHOT_PATH")
+        if not snapshot_path:
+            raise NotConfigured("SNAPSHOT_PATH not set")
+        return cls(snapshot_path, crawler.settings.get("CONFLICT_INDEX_PATH"))
+
+    def process_item(self, item, spider):
+        if not isinstance(spider, SubjectCoursesSpider):
+            return item
+        self.items.append(item)
+        return item
+
+    def close_spider(self, spider):
+        if not isinstance(spider, SubjectCoursesSpider):
+            return
+        from .snapshot import write_snapshot
+        write_snapshot(self.items, self.snapshot_path)
+
+        if self.conflict_index_path:
+            from .conflicts import write_conflict_index
+            write_conflict_index(self.snapshot_path, self.conflict_index_path)
+
+
+class CourseItemFeedPipeline:
+    """
+    Given items from the CourseCleanerPipeline, write them to an indexed
+    item feed (see itemfeed.py), which item_uploader.py can split between
+    processes or read one subject of.
+    Only enabled when ITEM_FEED_PATH is set.
+    """
+
+    def __init__(self, feed_path):
+        self.feed_path = feed_path
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        feed_path = crawler.settings.get("ITEM_FEED_PATH")
+        if not feed_path:
+            raise NotConfigured("ITEM_FEED_PATH not set")
+        return cls(feed_path)
+
+    def open_spider(self, spider):
+        if isinstance(spider, SubjectCoursesSpider):
+            from .itemfeed import ItemFeedWriter
+            self.writer = ItemFeedWriter(self.feed_path)
+
+    def process_item(self, item, spider):
+        if self.writer is None:
+            return item
+        # Same items as the pickle feed exporter writes.
+        self.writer.add(dict(ItemAdapter(item)))
+        return item
+
+    def close_spider(self, spider):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class CourseDatabasePipeline:
+    """
+    Given items from the CourseCleanerPipeline, insert each one into the
+    database as soon as it is produced, instead of going through the
+    items.pickle feed and item_uploader.py. Seat changes are published
+    in batches as items come (see db/seat_changes.py).
+    Section groups are replaced, not added to: a resumed crawl fetches
+    again the pages done after its last checkpoint, and their items must
+    not add their meetings a second time.
+    The database work is done in a thread of its own, off the reactor,
+    on one connection: items are inserted in order and never two at once,
+    which would race on their course's row (see item_uploader.py).
+    Only enabled when DATABASE_UPLOAD is set.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.seat_changes = SeatChangeTracker(make_publisher())
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=1,
+            name="CourseDatabasePipeline")
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("DATABASE_UPLOAD"):
+            raise NotConfigured("DATABASE_UPLOAD not set")
+        return cls(get_crawl_metrics(crawler))
+
+    def in_thread(self, function, *args):
+        """
+        Deferred result of function(*args), called in the pipeline's thread.
+        """
+        from twisted.internet import reactor
+        return threads.deferToThreadPool(reactor, self.threadpool, function, *args)
+
+    def record(self, method, *args):
+        # Metrics are only updated in the reactor thread, the one that
+        # exports them.
+        from twisted.internet import reactor
+        reactor.callFromThread(method, *args)
+
+    def process_item(self, item, spider):
+        if not isinstance(spider, SubjectCoursesSpider):
+            return item
+        d = self.in_thread(self.insert_item, item, spider)
+        d.addCallback(lambda _: item)
+        return d
+
+    def insert_item(self, item, spider):
+        # In the pipeline's thread.
+        start = time.perf_counter()
+        try:
+            with self.conn:
+                DataAccess.replace_section_group_all_info(self.conn, ItemAdapter(item))
+            self.seat_changes.observe(ItemAdapter(item))
+        except Exception as e:
+            spider.logger.error(f"could not insert {item}: {e}")
+            self.record(self.metrics.inc, "persistence_errors_total")
+        self.record(self.metrics.observe, "persistence_seconds", time.perf_counter() - start)
+
+        if self.seat_changes.should_flush():
+            self.flush_seat_changes(spider)
+
+    def flush_seat_changes(self, spider):
+        # In the pipeline's thread.
+        try:
+            with self.conn:
+                num_changes = self.seat_changes.flush(self.conn)
+            self.record(self.metrics.inc, "seat_changes_total", num_changes)
+        except Exception as e:
+            spider.logger.error(f"could not publish seat changes: {e}")
+
+    def open_spider(self, spider):
+        self.conn = DataAccess.get_conn()
+        if isinstance(spider, SubjectCoursesSpider):
+            with self.conn:
+                self.seat_changes.load(self.conn, spider.quarter_codes)
+        self.threadpool.start()
+
+    def finish_upload(self, spider):
+        # In the pipeline's thread, after every item.
+        if isinstance(spider, SubjectCoursesSpider):
+            self.flush_seat_changes(spider)
+            # Readers caching schedules see the upload is done.
+            with self.conn:
+                DataAccess.bump_upload_generation(self.conn)
+
+    def close_spider(self, spider):
+        def finished(result):
+            self.threadpool.stop()
+            DataAccess.put_conn(self.conn)
+            return result
+
+        d = self.in_thread(self.finish_upload, spider)
+        d.addBoth(finished)
+        return d
@@ -0,0 +1,196 @@
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+
+# Functions of threading that idle threads wait in: pool workers waiting
+# for work, queue gets, joins.
+IDLE_FUNCTIONS = {"wait", "join", "_wait_for_tstate_lock"}
+
+
+class StackSampler:
+    """
+    Low overhead sampling profiler. A background thread records the
+    current stack of every other thread each interval seconds. Results
+    are written as folded stacks ("outer;inner;leaf count" per line),
+    the input format of flamegraph.pl and speedscope.
+
+    Idle threads, those waiting in threading (see IDLE_FUNCTIONS), are
+    skipped and only counted in num_idle_samples. The reactor thread
+    waiting for the network is not idle: that's time the crawl spends
+    waiting, and it is kept.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stack_counts = collections.Counter()
+        self.num_samples = 0
+        self.num_idle_samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.is_idle(frame):
+                    self.num_idle_samples += 1
+                    continue
+                self.stack_counts[self.fold(frame)] += 1
+            self.num_samples += 1
+
+
+    @staticmethod
+    def is_idle(frame):
+        code = frame.f_code
+        return code.co_filename == threading.__file__ and code.co_name in IDLE_FUNCTIONS
+
+
+    @staticmethod
+    def fold(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+
+    def write_folded(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stack_counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class AllocationTracker:
+    """
+    Periodic tracemalloc snapshots. The report lists the top allocation
+    sites at the end of the run, and the sites that grew the most since
+    the first snapshot.
+    """
+
+    def __init__(self, num_frames=10, top=25):
+        self.num_frames = num_frames
+        self.top = top
+        self.first_snapshot = None
+        self.last_snapshot = None
+        self.peaks = []
+
+
+    def start(self):
+        tracemalloc.start(self.num_frames)
+        self.first_snapshot = self.take_snapshot()
+
+
+    def take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        self.last_snapshot = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        self.peaks.append((time.time(), current, peak))
+        return snapshot
+
+
+    def stop(self):
+        self.take_snapshot()
+        tracemalloc.stop()
+
+
+    def write_report(self, path):
+        with open(path, "w") as f:
+            f.write("time current_bytes peak_bytes\n")
+            for (t, current, peak) in self.peaks:
+                f.write(f"{t:.0f} {current} {peak}\n")
+
+            f.write(f"\nTop {self.top} allocation sites:\n")
+            for stat in self.last_snapshot.statistics("lineno")[:self.top]:
+                f.write(f"{stat}\n")
+
+            f.write(f"\nTop {self.top} growth since start:\n")
+            growth = self.last_snapshot.compare_to(self.first_snapshot, "lineno")
+            for stat in growth[:self.top]:
+                f.write(f"{stat}\n")
+
+            f.write(f"\nTop {self.top} allocation tracebacks:\n")
+            for stat in self.last_snapshot.statistics("traceback")[:self.top]:
+                f.write(f"{stat}\n")
+                for line in stat.traceback.format():
+                    f.write(f"{line}\n")
+
+
+class ProfilingExtension:
+    """
+    Runs the crawl (spider callbacks, item pipelines, DataAccess calls)
+    under the stack sampler and periodic tracemalloc snapshots, then writes
+    <PROFILING_DIR>/<spider>-<timestamp>.folded and
+    <PROFILING_DIR>/<spider>-<timestamp>-allocations.txt.
+    Only enabled when PROFILING_ENABLED is set.
+    """
+
+    def __init__(self, profiling_dir, sample_interval, snapshot_interval, num_frames):
+        self.profiling_dir = profiling_dir
+        self.sampler = StackSampler(sample_interval)
+        self.snapshot_interval = snapshot_interval
+        self.allocations = AllocationTracker(num_frames) if snapshot_interval else None
+        self.snapshot_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("PROFILING_ENABLED"):
+            raise NotConfigured("PROFILING_ENABLED not set")
+
+        ext = cls(settings.get("PROFILING_DIR"),
+            settings.getfloat("PROFILING_SAMPLE_INTERVAL"),
+            settings.getfloat("PROFILING_TRACEMALLOC_INTERVAL"),
+            settings.getint("PROFILING_TRACEMALLOC_FRAMES"))
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        self.sampler.start()
+        if self.allocations:
+            self.allocations.start()
+            self.snapshot_loop = task.LoopingCall(self.allocations.take_snapshot)
+            self.snapshot_loop.start(self.snapshot_interval, now=False)
+
+    def spider_closed(self, spider):
+        self.sampler.stop()
+
+        os.makedirs(self.profiling_dir, exist_ok=True)
+        run_name = f"{spider.name}-{time.strftime('%Y%m%d-%H%M%S')}"
+        folded_path = os.path.join(self.profiling_dir, f"{run_name}.folded")
+        self.sampler.write_folded(folded_path)
+        spider.logger.info(f"{self.sampler.num_samples} stack samples written to {folded_path}")
+
+        if self.allocations:
+            if self.snapshot_loop and self.snapshot_loop.running:
+                self.snapshot_loop.stop()
+            self.allocations.stop()
+            report_path = os.path.join(self.profiling_dir, f"{run_name}-allocations.txt")
+            self.allocations.write_report(report_path)
+            spider.logger.info(f"allocation report written to {report_path}")
@@ -0,0 +1,175 @@
+"""
+Quarantine of the course row groups the courses spider couldn't turn into
+items: a meeting row that failed to parse (cancelled meetings aside), or an
+item dropped by the pipelines. Each group is kept as the text of its cells
+with its context, so it can be parsed again after a parser fix
+(reparse_quarantine.py) without crawling again.
+
+The quarantine is a gzipped json lines file, one group per line:
+    {
+        "v": 1,
+        "quarter_code": "WI21",
+        "subject_code": "CSE",
+        "page_num": 2,
+        "reason": "meeting" | "first_meeting" | "dropped",
+        "error": "...",
+        "rows": [["crsheader", [<cell text>, ...]], ["sectxt", [...]], ...]
+    }
+The first row is always the course header.
+"""
+import gzip
+import json
+import os
+
+from bs4 import BeautifulSoup
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+
+QUARANTINE_VERSION = 1
+
+CRSHEADER_KIND = "crsheader"
+
+# Reasons a group is quarantined.
+REASON_FIRST_MEETING = "first_meeting"
+REASON_MEETING = "meeting"
+REASON_DROPPED = "dropped"
+
+
+def group_rows(tag_group):
+    """
+    Cell texts of a group of crsheader and meeting tags. The course title
+    cell keeps the text of its link, if it has one, like the spider reads it.
+    """
+    rows = []
+    for tag in tag_group:
+        tds = tag.find_all("td")
+        cells = [td.text for td in tds]
+        if tag.has_attr("class"):
+            kind = tag["class"][0]
+        else:
+            kind = CRSHEADER_KIND
+            if len(tds) > 2 and tds[2].a:
+                cells[2] = tds[2].a.text
+        rows.append([kind, cells])
+    return rows
+
+
+def row_tags(rows):
+    """
+    bs4 tags equivalent to the tags group_rows was given, for parsing again.
+    """
+    soup = BeautifulSoup("", "html.parser")
+    tags = []
+    for kind, cells in rows:
+        tr = soup.new_tag("tr")
+        if kind != CRSHEADER_KIND:
+            tr["class"] = [kind]
+        for cell in cells:
+            td = soup.new_tag("td")
+            if kind == CRSHEADER_KIND:
+                td["class"] = [CRSHEADER_KIND]
+            td.string = cell
+            tr.append(td)
+        tags.append(tr)
+    return tags
+
+
+def raw_group(tag_group, quarter_code, subject_code, page_num):
+    return {
+        "v": QUARANTINE_VERSION,
+        "quarter_code": quarter_code,
+        "subject_code": subject_code,
+        "page_num": page_num,
+        "rows": group_rows(tag_group),
+    }
+
+
+class QuarantineWriter:
+    """
+    Appends quarantined groups to a quarantine file. Every writer adds a
+    gzip member to the file, which reads back as one stream.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.num_groups = 0
+
+
+    def add(self, group, reason, error=None):
+        if self.file is None:
+            self.file = gzip.open(self.path, "at", encoding="utf-8")
+        record = dict(group, reason=reason, error=str(error) if error is not None else None)
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.num_groups += 1
+
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_quarantine(path):
+    """
+    The quarantined groups in the file at path, if there is one.
+    """
+    if not path or not os.path.exists(path):
+        return []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_quarantine(path, groups):
+    """
+    Replace the quarantine file at path with groups, atomically.
+    """
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for group in groups:
+            f.write(json.dumps(group, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+
+class QuarantineExtension:
+    """
+    Hands a QuarantineWriter on QUARANTINE_PATH to the courses spider, and
+    quarantines the items dropped by the pipelines (the spider attaches the
+    raw rows of every item while quarantining).
+    Only enabled when QUARANTINE_PATH is set.
+    """
+
+    def __init__(self, crawler, path):
+        self.crawler = crawler
+        self.writer = QuarantineWriter(path)
+
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get("QUARANTINE_PATH")
+        if not path:
+            raise NotConfigured("QUARANTINE_PATH not set")
+        ext = cls(crawler, path)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.item_dropped, signal=signals.item_dropped)
+        return ext
+
+    def spider_opened(self, spider):
+        # Only the courses spider quarantines.
+        if hasattr(spider, "quarantine"):
+            spider.quarantine = self
+
+    def add(self, group, reason, error=None):
+        self.writer.add(group, reason, error)
+        self.crawler.stats.inc_value("quarantine/groups")
+        self.crawler.stats.inc_value(f"quarantine/reason/{reason}")
+
+    def item_dropped(self, item, response, exception, spider):
+        group = item.get("raw_group") if hasattr(item, "get") else None
+        if group:
+            self.add(group, REASON_DROPPED, exception)
+
+    def spider_closed(self, spider):
+        self.writer.close()
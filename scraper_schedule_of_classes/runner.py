@@ -0,0 +1,94 @@
+"""
+Crawls on a reactor started once per process, so one process can run
+crawl after crawl (a warm serverless container, see handler.py) instead
+of setting up and tearing down a CrawlerProcess every time.
+
+The reactor runs in a background thread, and callers block until the
+crawl they asked for is done.
+"""
+import threading
+
+from scrapy import signals
+from scrapy.crawler import Crawler, CrawlerRunner
+from scrapy.utils.log import configure_logging
+from scrapy.utils.reactor import install_reactor, is_reactor_installed
+from twisted.internet import threads
+
+
+class ReusableCrawlRunner:
+    """
+    Wraps a CrawlerRunner whose reactor keeps running between crawls.
+    start() once, then crawl() as many times as needed, one crawl at a
+    time or several from different threads.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.reactor = None
+        self.runner = None
+        self.thread = None
+
+
+    @property
+    def started(self):
+        return self.thread is not None and self.thread.is_alive()
+
+
+    def start(self):
+        if self.started:
+            return self
+
+        # The reactor the settings ask for, unless one was already
+        # installed by an import.
+        reactor_path = self.settings.get("TWISTED_REACTOR")
+        if reactor_path and not is_reactor_installed():
+            install_reactor(reactor_path)
+        from twisted.internet import reactor
+        self.reactor = reactor
+
+        configure_logging(self.settings)
+        self.thread = threading.Thread(target=reactor.run, name="crawl-reactor",
+            kwargs={"installSignalHandlers": False}, daemon=True)
+        self.thread.start()
+        self.runner = self.call(CrawlerRunner, self.settings)
+        return self
+
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call function in the reactor thread and wait for its result, or
+        the result of the Deferred it returns.
+        """
+        return threads.blockingCallFromThread(self.reactor, function, *args, **kwargs)
+
+
+    def crawl(self, spidercls, settings=None, item_scraped=None, **spider_kwargs):
+        """
+        Run one crawl of spidercls to the end and return its Crawler, for
+        its stats. settings replace the runner's for this crawl only, and
+        item_scraped is connected to the item_scraped signal.
+        """
+        def crawl():
+            if settings is None:
+                crawler = self.runner.create_crawler(spidercls)
+            else:
+                crawler = Crawler(spidercls, settings)
+            if item_scraped is not None:
+                crawler.signals.connect(item_scraped, signal=signals.item_scraped)
+            d = self.runner.crawl(crawler, **spider_kwargs)
+            d.addCallback(lambda _: crawler)
+            return d
+
+        return self.call(crawl)
+
+
+    def stop(self):
+        """
+        Stop running crawls and the reactor. The runner can't be started
+        again in this process.
+        """
+        if not self.started:
+            return
+        self.call(self.runner.stop)
+        self.reactor.callFromThread(self.reactor.stop)
+        self.thread.join()
@@ -13,6 +13,10 @@ SPIDER_MODULES = ['scraper_schedule_of_classes.spiders']
 NEWSPIDER_MODULE = 'scraper_schedule_of_classes.spiders'
 
 
+# Where the schedule of classes is served from. Point it at the local mock
+# server (test/mock_server.py) for benchmarks.
+SCHEDULE_OF_CLASSES_HOST = 'https://act.ucsd.edu'
+
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = 'scraper_schedule_of_classes (+http://www.yourdomain.com)'
 
@@ -47,27 +51,114 @@ DOWNLOAD_DELAY = 1
 #SPIDER_MIDDLEWARES = {
 #    'scraper_schedule_of_classes.middlewares.ScraperScheduleOfClassesSpiderMiddleware': 543,
 #}
+SPIDER_MIDDLEWARES = {
+    'scraper_schedule_of_classes.middlewares.ParseMetricsSpiderMiddleware': 950,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #DOWNLOADER_MIDDLEWARES = {
 #    'scraper_schedule_of_classes.middlewares.ScraperScheduleOfClassesDownloaderMiddleware': 543,
 #}
+DOWNLOADER_MIDDLEWARES = {
+    'scraper_schedule_of_classes.middlewares.ByteAccountingDownloaderMiddleware': 595,
+}
+
+# Ask for compressed pages (gzip, deflate, and br when brotli is installed),
+# they're mostly boilerplate html. ByteAccountingDownloaderMiddleware
+# reports bytes on the wire vs decoded, per subject, in the bandwidth/ stats.
+# Connections to the host are kept alive and reused by the HTTP/1.1
+# download handler, up to CONCURRENT_REQUESTS_PER_DOMAIN of them.
+# The results page has a fixed page size (no parameter to widen it), so
+# the request count is set by the site's pagination.
+COMPRESSION_ENABLED = True
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 #}
+EXTENSIONS = {
+    'scraper_schedule_of_classes.metrics.CrawlMetricsExtension': 500,
+    'scraper_schedule_of_classes.profiling.ProfilingExtension': 501,
+    'scraper_schedule_of_classes.checkpoint.CrawlCheckpointExtension': 502,
+    'scraper_schedule_of_classes.quarantine.QuarantineExtension': 503,
+}
+
+# Crawl metrics (CrawlMetricsExtension, ParseMetricsSpiderMiddleware),
+# in prometheus text format. Written to METRICS_FILE at close, and served
+# over http on METRICS_PORT during the crawl if it is set.
+METRICS_ENABLED = False
+METRICS_FILE = 'crawl_metrics.prom'
+#METRICS_PORT = 9410
+
+# Sampling profiler and tracemalloc snapshots for the whole crawl
+# (ProfilingExtension). Writes a folded stacks file (flamegraph.pl,
+# speedscope) and a top allocators report to PROFILING_DIR per run.
+# Set PROFILING_TRACEMALLOC_INTERVAL to 0 to only sample stacks.
+PROFILING_ENABLED = False
+PROFILING_DIR = 'profiles'
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_TRACEMALLOC_INTERVAL = 60
+PROFILING_TRACEMALLOC_FRAMES = 10
+
+# Resumable courses crawl (CrawlCheckpointExtension). The pages done and
+# pending are saved to CRAWL_CHECKPOINT_PATH every CRAWL_CHECKPOINT_INTERVAL
+# seconds and at close, and the next crawl of the same quarters and
+# subjects only fetches the pending pages. With CRAWL_TIME_BUDGET (seconds,
+# 0 for none) the crawl stops CRAWL_SHUTDOWN_MARGIN seconds before the
+# budget runs out. When resuming into a feed, set its overwrite to False.
+#CRAWL_CHECKPOINT_PATH = 'crawl_checkpoint.json'
+CRAWL_CHECKPOINT_INTERVAL = 30
+CRAWL_TIME_BUDGET = 0
+CRAWL_SHUTDOWN_MARGIN = 30
+
+# Course row groups that fail to parse, or whose item is dropped, are
+# appended to QUARANTINE_PATH (QuarantineExtension) as cell texts, to be
+# parsed again with reparse_quarantine.py after a parser fix. Disabled
+# while this is not set.
+#QUARANTINE_PATH = 'quarantine.jsonl.gz'
+
+# Serverless handler (handler.py): subject lists are crawled again after
+# HANDLER_SUBJECTS_TTL seconds in a warm container, and the checkpoints of
+# crawls cut short by the invocation's timeout are kept in
+# HANDLER_CHECKPOINT_DIR.
+HANDLER_SUBJECTS_TTL = 24 * 60 * 60
+HANDLER_CHECKPOINT_DIR = '/tmp'
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
    'scraper_schedule_of_classes.pipelines.SubjectCleanerPipeline': 100,
    'scraper_schedule_of_classes.pipelines.CourseCleanerPipeline': 200,
-   'scraper_schedule_of_classes.pipelines.CoursePersistencePipeline': 201
+   'scraper_schedule_of_classes.pipelines.CoursePersistencePipeline': 201,
+   'scraper_schedule_of_classes.pipelines.CourseColumnarExportPipeline': 202,
+   'scraper_schedule_of_classes.pipelines.CourseSnapshotPipeline': 203,
+   'scraper_schedule_of_classes.pipelines.CourseDatabasePipeline': 204,
+   'scraper_schedule_of_classes.pipelines.CourseItemFeedPipeline': 205
 }
 
+# Insert course items into the database as they are scraped
+# (CourseDatabasePipeline). Set by run_quarter.py.
+DATABASE_UPLOAD = False
+
+# Directory for the parquet files of CourseColumnarExportPipeline.
+# The pipeline is disabled while this is not set.
+#COLUMNAR_EXPORT_DIR = 'columnar'
+
+# Binary snapshot of the quarter for the scheduler, written by
+# CourseSnapshotPipeline. The pipeline is disabled while this is not set.
+#SNAPSHOT_PATH = 'quarter.snapshot'
+# Conflict index between the quarter's options, computed from the snapshot.
+# With several quarters, one per quarter, e.g. quarter.conflicts.WI21.npz.
+#CONFLICT_INDEX_PATH = 'quarter.conflicts.npz'
+
+# Indexed item feed written by CourseItemFeedPipeline, grouped by subject
+# with a sidecar index (<path>.idx), for item_uploader.py. Unlike
+# items.pickle it can be split between processes or read one subject at a
+# time. The pipeline is disabled while this is not set.
+#ITEM_FEED_PATH = 'items.feed'
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
@@ -91,9 +182,29 @@ ITEM_PIPELINES = {
 
 #Logging
 
+# Columnar feeds, one per table. Needs pyarrow.
+#FEED_EXPORTERS = {
+#    'parquet': 'scraper_schedule_of_classes.exporters.ParquetItemExporter'
+#}
+
 FEEDS = {
     'items.pickle': {
         'format': 'pickle',
         'overwrite': True
     }
-}
\ No newline at end of file
+}
+
+# Parse results pages incrementally, row by row, instead of building the
+# whole page in memory first. See scraper_schedule_of_classes/streaming.py
+STREAMING_PARSE = False
+
+# Cut the course rows out of results pages with patterns over the raw
+# bytes instead of parsing the page. Rows the patterns can't be trusted
+# with are still parsed with bs4. See scraper_schedule_of_classes/fastparse.py
+FAST_PARSE = False
+
+# With several quarters in one courses crawl, give each quarter's requests
+# a download slot of their own instead of sharing the host's. Quarters
+# then crawl in about the time of one, but the host gets DOWNLOAD_DELAY
+# worth of requests per quarter.
+QUARTER_DOWNLOAD_SLOTS = False
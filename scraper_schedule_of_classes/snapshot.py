@@ -0,0 +1,258 @@
+"""
+Compact binary snapshot of a quarter's section groups and meetings, for
+the scheduler. Built from CourseMeetings items, read with mmap.
+
+Layout (little endian, every section 8 byte aligned):
+    header
+    string offsets   uint32 * (num_strings + 1)
+    string data      utf-8
+    section groups   SECTION_GROUP_DTYPE * num_section_groups
+    meetings         MEETING_DTYPE * num_meetings
+
+Meetings of a section group are contiguous, starting at the group's
+first_meeting. Strings are referred to by their index in the string
+table, NO_STRING meaning None.
+"""
+import mmap
+import struct
+
+import numpy as np
+from itemadapter import ItemAdapter
+
+import scraper_schedule_of_classes.errors as errors
+import scraper_schedule_of_classes.utils as utils
+
+
+SNAPSHOT_MAGIC = b"EZSS"
+SNAPSHOT_VERSION = 1
+
+# magic, version, reserved, num strings, num section groups, num meetings,
+# offsets of: string offsets, string data, section groups, meetings.
+HEADER_STRUCT = struct.Struct("<4sHHIIIQQQQ")
+
+NO_STRING = 0xFFFFFFFF
+NO_TIME = 0xFFFF
+NO_SEATS = -1
+NO_TYPE = 0xFF
+
+CATEGORY_SECTION = 0
+CATEGORY_GENERAL = 1
+CATEGORY_DATED = 2
+MEETING_CATEGORIES = (
+    (CATEGORY_SECTION, "section_meetings"),
+    (CATEGORY_GENERAL, "general_meetings"),
+    (CATEGORY_DATED, "dated_meetings"),
+)
+
+SECTION_GROUP_DTYPE = np.dtype([
+    ("quarter_code", "<u4"),
+    ("subj_code", "<u4"),
+    ("number", "<u4"),
+    ("title", "<u4"),
+    ("section_group_code", "<u4"),
+    ("instructor", "<u4"),
+    ("first_meeting", "<u4"),
+    ("num_meetings", "<u4"),
+])
+
+MEETING_DTYPE = np.dtype([
+    ("section_group", "<u4"),
+    ("category", "u1"),
+    # Index into utils.MEETING_TYPES.
+    ("type_", "u1"),
+    # utils.days_to_mask
+    ("days", "u1"),
+    ("essential", "u1"),
+    # Minutes since midnight.
+    ("start_time", "<u2"),
+    ("end_time", "<u2"),
+    ("number", "<u4"),
+    ("date", "<u4"),
+    ("bldg", "<u4"),
+    ("room", "<u4"),
+    ("sec_id", "<u4"),
+    ("seats_avail", "<i4"),
+])
+
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class StringTable:
+    """
+    Interns strings, assigning each distinct string an index.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.strings = []
+
+
+    def index(self, s):
+        if s is None:
+            return NO_STRING
+        if s not in self.indexes:
+            self.indexes[s] = len(self.strings)
+            self.strings.append(s)
+        return self.indexes[s]
+
+
+    def to_bytes(self):
+        """
+        Returns (offsets, data). String i is data[offsets[i]:offsets[i + 1]].
+        """
+        encoded = [s.encode("utf-8") for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return offsets.tobytes(), b"".join(encoded)
+
+
+def build_snapshot(items):
+    """
+    Build the snapshot bytes from an iterable of CourseMeetings items.
+    """
+    strings = StringTable()
+    section_group_rows = []
+    meeting_rows = []
+
+    for section_group, item in enumerate(items):
+        adapter = ItemAdapter(item)
+        first_meeting = len(meeting_rows)
+
+        for category, field in MEETING_CATEGORIES:
+            for meeting in adapter.get(field) or []:
+                start_time = utils.time_to_minutes(meeting.get("start_time"))
+                end_time = utils.time_to_minutes(meeting.get("end_time"))
+                seats_avail = meeting.get("seats_avail")
+                sec_id = meeting.get("sec_id")
+                type_ = meeting.get("type_")
+                meeting_rows.append((
+                    section_group,
+                    category,
+                    utils.MEETING_TYPES.index(type_) if type_ else NO_TYPE,
+                    utils.days_to_mask(meeting.get("days")),
+                    1 if meeting.get("essential") else 0,
+                    NO_TIME if start_time is None else start_time,
+                    NO_TIME if end_time is None else end_time,
+                    strings.index(meeting.get("number")),
+                    strings.index(meeting.get("date")),
+                    strings.index(meeting.get("bldg")),
+                    strings.index(meeting.get("room")),
+                    int(sec_id) if sec_id else 0,
+                    NO_SEATS if seats_avail is None else seats_avail,
+                ))
+
+        section_group_rows.append((
+            strings.index(adapter.get("quarter_code")),
+            strings.index(adapter.get("subj_code")),
+            strings.index(adapter.get("number")),
+            strings.index(adapter.get("title")),
+            strings.index(adapter.get("section_group_code")),
+            strings.index(adapter.get("instructor")),
+            first_meeting,
+            len(meeting_rows) - first_meeting,
+        ))
+
+    string_offsets, string_data = strings.to_bytes()
+    section_groups = np.array(section_group_rows, dtype=SECTION_GROUP_DTYPE).tobytes()
+    meetings = np.array(meeting_rows, dtype=MEETING_DTYPE).tobytes()
+
+    string_offsets_off = _align(HEADER_STRUCT.size)
+    string_data_off = _align(string_offsets_off + len(string_offsets))
+    section_groups_off = _align(string_data_off + len(string_data))
+    meetings_off = _align(section_groups_off + len(section_groups))
+
+    buf = bytearray(meetings_off + len(meetings))
+    HEADER_STRUCT.pack_into(buf, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0,
+        len(strings.strings), len(section_group_rows), len(meeting_rows),
+        string_offsets_off, string_data_off, section_groups_off, meetings_off)
+    buf[string_offsets_off:string_offsets_off + len(string_offsets)] = string_offsets
+    buf[string_data_off:string_data_off + len(string_data)] = string_data
+    buf[section_groups_off:section_groups_off + len(section_groups)] = section_groups
+    buf[meetings_off:] = meetings
+    return bytes(buf)
+
+
+def write_snapshot(items, path):
+    data = build_snapshot(items)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class Snapshot:
+    """
+    Read only view of a snapshot file. The file is mmapped, and
+    section_groups and meetings are numpy structured arrays over the
+    mapping, so nothing is copied or decoded until it is used.
+
+    Use as a context manager, or call close().
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < HEADER_STRUCT.size:
+            self._mmap.close()
+            raise errors.SnapshotError(f"{path} is too small to be a snapshot")
+
+        (magic, version, _, num_strings, num_section_groups, num_meetings,
+            string_offsets_off, self._string_data_off, section_groups_off,
+            meetings_off) = HEADER_STRUCT.unpack_from(self._mmap, 0)
+
+        if magic != SNAPSHOT_MAGIC:
+            self._mmap.close()
+            raise errors.SnapshotError(f"{path} is not a snapshot")
+        if version != SNAPSHOT_VERSION:
+            self._mmap.close()
+            raise errors.SnapshotError(
+                f"{path} has snapshot version {version}, expected {SNAPSHOT_VERSION}")
+
+        self.version = version
+        self._string_offsets = np.frombuffer(self._mmap, dtype="<u4",
+            count=num_strings + 1, offset=string_offsets_off)
+        self.section_groups = np.frombuffer(self._mmap, dtype=SECTION_GROUP_DTYPE,
+            count=num_section_groups, offset=section_groups_off)
+        self.meetings = np.frombuffer(self._mmap, dtype=MEETING_DTYPE,
+            count=num_meetings, offset=meetings_off)
+
+
+    def string(self, index):
+        """
+        The string at index in the string table, or None for NO_STRING.
+        """
+        if index == NO_STRING:
+            return None
+        start = self._string_data_off + int(self._string_offsets[index])
+        end = self._string_data_off + int(self._string_offsets[index + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+
+    def section_group_meetings(self, section_group):
+        """
+        The meeting records of one section group (a view, not a copy).
+        """
+        record = self.section_groups[section_group]
+        first = int(record["first_meeting"])
+        return self.meetings[first:first + int(record["num_meetings"])]
+
+
+    def close(self):
+        # The arrays hold exports of the mmap buffer, release them first.
+        self._string_offsets = self.section_groups = self.meetings = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Records taken from the arrays are still alive. The mapping
+            # is released once they are garbage collected.
+            pass
+        self._mmap = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
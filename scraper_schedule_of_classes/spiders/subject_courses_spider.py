@@ -1,5 +1,7 @@
 import re
 import datetime
+import itertools
+import time
 
 import scrapy
 import urllib
@@ -12,16 +14,23 @@ from scraper_schedule_of_classes.items \
     import CourseMeetingsUncategorized, CourseMeetingsUncategorizedLoader, Meeting, MeetingLoader
 import scraper_schedule_of_classes.utils as utils
 from scraper_schedule_of_classes.db.db import DataAccess
+from scraper_schedule_of_classes.streaming import StreamingPageParser
+from scraper_schedule_of_classes.fastparse import FastPageParser
+from scraper_schedule_of_classes.checkpoint import CrawlCheckpoint
+from scraper_schedule_of_classes.quarantine import raw_group, \
+    REASON_FIRST_MEETING, REASON_MEETING
 
 
-SCHEDULE_OF_CLASSES_URL = "https://act.ucsd.edu/scheduleOfClasses/scheduleOfClassesFacultyResult.htm"
+SCHEDULE_OF_CLASSES_HOST = "https://act.ucsd.edu"
+SCHEDULE_OF_CLASSES_PATH = "/scheduleOfClasses/scheduleOfClassesFacultyResult.htm"
+SCHEDULE_OF_CLASSES_URL = f"{SCHEDULE_OF_CLASSES_HOST}{SCHEDULE_OF_CLASSES_PATH}"
 SUBJECT_QUERY_STR = "selectedSubjects"
 TERM_QUERY_STR = "selectedTerm"
 SCHED_OPT_1_STR = "schedOption1"
 SCHED_OPT_2_STR = "schedOption2"
 PAGE_QUERY_STR = "page"
 
-PAGE_NUM_REGEX = re.compile(r"Page\s+\([0-9]+\s+of\s+([0-9+])\)")
+PAGE_NUM_REGEX = re.compile(r"Page\s+\([0-9]+\s+of\s+([0-9]+)\)")
 
 
 XPATH_CRSHEADER = "//tr[td/@class='crsheader']"
@@ -46,77 +55,324 @@ class SubjectCoursesSpider(scrapy.Spider):
     """
     A spider that scrapes all all of the courses/meetings
     for a subject in a given term.
+    Several terms can be crawled together, sharing the connection pool,
+    with quarter_code="SP21,FA21". They also share the host's download
+    slot, so two terms take about twice as long as one, unless
+    QUARTER_DOWNLOAD_SLOTS gives each its own.
     """
     name = "subject_courses"
 
-    def __init__(self, quarter_code=None, *args, **kwargs):
+    def __init__(self, quarter_code=None, *args, subject_codes=None, shard=None,
+            prev_num_pages=None, **kwargs):
         super(SubjectCoursesSpider, self).__init__(*args, **kwargs)
         if not quarter_code:
             raise errors.MissingQuarterError(f"The {self.name} spider needs a quarter.")
-        self.quarter_code = quarter_code
+        self.quarter_codes = [code.strip() for code in quarter_code.split(",") if code.strip()]
+        # Default quarter of the parsing methods.
+        self.quarter_code = self.quarter_codes[0]
+
+        # Only crawl this worker's share of the subjects, given as "i/N".
+        # Shares come from a plan made once for all the workers: computed
+        # here, they would change as other workers save their page counts.
+        # Workers without the database can be given their subjects instead.
+        self.shard = shard
+        if shard:
+            conn = DataAccess.get_conn()
+            with conn:
+                subject_codes = utils.read_shard_plan(conn, self.quarter_code, shard)
+            DataAccess.put_conn(conn)
+
+        # Subjects can be handed over directly (comma separated when given
+        # with -a). Otherwise query database for all subjects.
+        if subject_codes is not None:
+            if isinstance(subject_codes, str):
+                subject_codes = [code.strip() for code in subject_codes.split(",") if code.strip()]
+            self.subject_codes = list(subject_codes)
+        else:
+            conn = DataAccess.get_conn()
+            with conn:
+                self.subject_codes = DataAccess.get_all_subjects(conn)
+            DataAccess.put_conn(conn)
+
+        # Page counts of the previous crawl, to start the largest subjects
+        # first. Read in start_requests, only when there is an order to
+        # choose, unless given.
+        self.prev_num_pages = prev_num_pages
+
+        # Page counts and crawl start/end times of this crawl, by subject.
+        # With several quarters, the largest page count of the subject.
+        self.subject_num_pages = {}
+        self.subject_start_times = {}
+        self.subject_end_times = {}
 
-        # Query database for all subjects. FIXME: get all subjects instead.
-        self.conn = DataAccess.get_conn()
-        with self.conn:
-            self.subject_codes = DataAccess.get_all_subjects(self.conn)
+        # Pages done and pending, saved by CrawlCheckpointExtension.
+        self.checkpoint = CrawlCheckpoint(self.quarter_codes, self.subject_codes)
+
+        # Where row groups that fail to parse go, set by QuarantineExtension.
+        self.quarantine = None
 
     
     def closed(self, reason):
         print('subject courses spider closing.')
-        DataAccess.put_conn(self.conn)
+        self.save_subject_crawl_stats()
+
+
+    def save_subject_crawl_stats(self):
+        """
+        Persist the page count and crawl duration of every subject seen,
+        for ordering the next crawl.
+        """
+        stats = []
+        for subject_code, num_pages in self.subject_num_pages.items():
+            end_time = self.subject_end_times[subject_code]
+            start_time = self.subject_start_times.get(subject_code, end_time)
+            stats.append((subject_code, num_pages, end_time - start_time))
+        if not stats:
+            return
+
+        conn = DataAccess.get_conn()
+        try:
+            with conn:
+                DataAccess.upsert_subject_crawl_stats(conn, stats)
+        except Exception as e:
+            self.logger.error(f"could not save subject crawl stats: {e}")
+        DataAccess.put_conn(conn)
+
+
+    def subject_priority(self, subject_code):
+        """
+        Request priority of a subject: its page count, so that the largest
+        subjects, which set the length of the crawl, start first. Subjects
+        without a previous page count go first since their size is unknown.
+        """
+        prev_num_pages = self.prev_num_pages or {}
+        num_pages = self.subject_num_pages.get(subject_code, prev_num_pages.get(subject_code))
+        if num_pages is None:
+            return max(prev_num_pages.values(), default=0) + 1
+        return num_pages
+
+
+    def load_prev_num_pages(self):
+        """
+        Page counts of the previous crawl, from the database. A single
+        subject has nothing to be ordered against.
+        """
+        if len(self.subject_codes) < 2:
+            return {}
+        conn = DataAccess.get_conn()
+        with conn:
+            prev_num_pages = DataAccess.get_subject_page_counts(conn)
+        DataAccess.put_conn(conn)
+        return prev_num_pages
+
+
+    def ordered_subject_codes(self):
+        return sorted(self.subject_codes, key=self.subject_priority, reverse=True)
+
+
+    def record_subject_page(self, subject_code, num_pages=None):
+        self.subject_end_times[subject_code] = time.monotonic()
+        if num_pages is not None:
+            self.subject_num_pages[subject_code] = max(num_pages,
+                self.subject_num_pages.get(subject_code, 0))
         
 
-    def start_requests(self):
+    async def start(self):
+        # Scrapy >= 2.13 only calls start(), older versions start_requests().
+        for request in self.start_requests():
+            yield request
 
-        for subject_code in self.subject_codes:
 
-            payload = {
-                SUBJECT_QUERY_STR: subject_code,
-                TERM_QUERY_STR: self.quarter_code, 
-                SCHED_OPT_1_STR: "true",
-                SCHED_OPT_2_STR: "true"
-            }
+    def resume_from_checkpoint(self):
+        """
+        Continue the crawl saved at CRAWL_CHECKPOINT_PATH if it is of an
+        unfinished crawl of the same quarters and subjects.
+        """
+        settings = getattr(self, "settings", None)
+        path = settings.get("CRAWL_CHECKPOINT_PATH") if settings is not None else None
+        checkpoint = CrawlCheckpoint.load(path)
+        if checkpoint is None or checkpoint.finished:
+            return
+        if not checkpoint.matches(self.quarter_codes, self.subject_codes):
+            self.logger.warning(f"checkpoint {path} is of another crawl, starting over")
+            return
 
-            query = urllib.parse.urlencode(payload)
-            url = f"{SCHEDULE_OF_CLASSES_URL}?{query}"
+        self.checkpoint = checkpoint
+        num_pending_pages, num_pending_subjects = checkpoint.num_pending()
+        self.logger.info(f"resuming from {path}: {checkpoint.items_persisted} items "
+            f"persisted, {num_pending_pages} pages and {num_pending_subjects} subjects pending")
 
-            # Request for the first page of each subject.
-            yield scrapy.Request(url, self.parse, cb_kwargs=dict(subject_code=subject_code))
 
+    def start_requests(self):
 
-    def parse(self, response, subject_code):
+        self.resume_from_checkpoint()
+        if self.prev_num_pages is None:
+            self.prev_num_pages = self.load_prev_num_pages()
+
+        for subject_code in self.ordered_subject_codes():
+            for quarter_code in self.quarter_codes:
+
+                # Resumed crawl: only the pages not done yet.
+                pending = self.checkpoint.pending_pages(quarter_code, subject_code)
+                if pending is not None:
+                    num_pages = self.checkpoint.num_pages[(quarter_code, subject_code)]
+                    if pending:
+                        self.subject_start_times.setdefault(subject_code, time.monotonic())
+                    yield from self.extra_page_requests(num_pages, subject_code,
+                        quarter_code, pages=pending)
+                    continue
+
+                payload = {
+                    SUBJECT_QUERY_STR: subject_code,
+                    TERM_QUERY_STR: quarter_code, 
+                    SCHED_OPT_1_STR: "true",
+                    SCHED_OPT_2_STR: "true"
+                }
+
+                query = urllib.parse.urlencode(payload)
+                url = f"{self.schedule_of_classes_url()}?{query}"
+
+                # Request for the first page of each subject.
+                self.subject_start_times.setdefault(subject_code, time.monotonic())
+                yield scrapy.Request(url, self.parse,
+                    cb_kwargs=dict(subject_code=subject_code, quarter_code=quarter_code),
+                    priority=self.subject_priority(subject_code),
+                    meta=self.download_slot_meta(url, quarter_code))
+
+
+    def parse(self, response, subject_code, quarter_code=None):
         """
         Parse html for the number of pages, then create more requests
         for additional pages if needed.
         """
 
-        soup = BeautifulSoup(response.body, "lxml")
-        num_pages = self.get_num_pages(soup)
+        if self.use_streaming_parse():
+            yield from self.parse_streaming(response, subject_code, quarter_code)
+            return
+
+        if self.use_fast_parse():
+            page_parser = FastPageParser(response.body)
+            num_pages = page_parser.get_num_pages(PAGE_NUM_REGEX)
+            tags = page_parser.iter_tags()
+        else:
+            soup = BeautifulSoup(response.body, "lxml")
+            num_pages = self.get_num_pages(soup)
+            # Get all the tags with course information
+            tags = soup.find_all(utils.tag_matches_any)
+
+        self.record_subject_page(subject_code, num_pages)
+        self.checkpoint.set_num_pages(quarter_code or self.quarter_code, subject_code, num_pages)
         if num_pages == 0:
             return
         
         # Dispatch the rest of the requests (pages 2 to num_pages)
         # Don't need to request the first page again.
-        for i in range (2, num_pages + 1):
+        yield from self.extra_page_requests(num_pages, subject_code, quarter_code)
+
+        # Group by course header.
+        for item in self.course_meeting_items(tags, subject_code, quarter_code, page_num=1):
+            yield item
+
+        self.checkpoint.page_done(quarter_code or self.quarter_code, subject_code, 1)
+
+
+    def parse_streaming(self, response, subject_code, quarter_code=None):
+        """
+        Same as parse, but rows are parsed and grouped as they are read
+        instead of building the whole page first.
+        """
+
+        page_parser = StreamingPageParser(response.body)
+        tags = page_parser.iter_tags(PAGE_NUM_REGEX)
+
+        # The page count is at the top of the page, before any row.
+        first_tag = next(tags, None)
+        self.record_subject_page(subject_code, page_parser.num_pages)
+        self.checkpoint.set_num_pages(quarter_code or self.quarter_code, subject_code,
+            page_parser.num_pages)
+        if page_parser.num_pages == 0:
+            return
+
+        yield from self.extra_page_requests(page_parser.num_pages, subject_code, quarter_code)
+
+        if first_tag is not None:
+            tags = itertools.chain((first_tag, ), tags)
+            for item in self.course_meeting_items(tags, subject_code, quarter_code,
+                    page_num=1):
+                yield item
+
+        self.checkpoint.page_done(quarter_code or self.quarter_code, subject_code, 1)
+
+
+    def extra_page_requests(self, num_pages, subject_code, quarter_code=None, pages=None):
+        """
+        Requests for pages 2 to num_pages of a subject, or for the given
+        pages when resuming a crawl.
+        """
+        quarter_code = quarter_code or self.quarter_code
+        if pages is None:
+            pages = range(2, num_pages + 1)
+        for i in pages:
             payload = {
                 SUBJECT_QUERY_STR: subject_code,
-                TERM_QUERY_STR: self.quarter_code, 
+                TERM_QUERY_STR: quarter_code, 
                 SCHED_OPT_1_STR: "true",
                 SCHED_OPT_2_STR: "true",
                 PAGE_QUERY_STR: i
             }
 
             query = urllib.parse.urlencode(payload)
-            url = f"{SCHEDULE_OF_CLASSES_URL}?{query}"
+            url = f"{self.schedule_of_classes_url()}?{query}"
 
-            yield scrapy.Request(url, self.parse_extra_page, cb_kwargs=dict(subject_code=subject_code))
+            yield scrapy.Request(url, self.parse_extra_page,
+                cb_kwargs=dict(subject_code=subject_code, quarter_code=quarter_code,
+                    page_num=i),
+                priority=self.subject_priority(subject_code),
+                meta=self.download_slot_meta(url, quarter_code))
 
-        # Get all the tags with course information
-        tags = soup.find_all(utils.tag_matches_any)
 
-        # Group by course header.
-        for item in self.course_meeting_items(tags, subject_code):
-            yield item
+    def schedule_of_classes_url(self):
+        """
+        The results page url. The SCHEDULE_OF_CLASSES_HOST setting can
+        point it elsewhere, e.g. the local mock server in test/mock_server.py
+        """
+        settings = getattr(self, "settings", None)
+        host = settings.get("SCHEDULE_OF_CLASSES_HOST") if settings is not None else None
+        if not host:
+            return SCHEDULE_OF_CLASSES_URL
+        return f"{host.rstrip('/')}{SCHEDULE_OF_CLASSES_PATH}"
+
+
+    def download_slot_meta(self, url, quarter_code):
+        """
+        Request meta putting the requests of each quarter in a download
+        slot of their own, with QUARTER_DOWNLOAD_SLOTS and several quarters:
+        each slot waits DOWNLOAD_DELAY on its own, so the host gets that
+        many times the requests.
+        """
+        settings = getattr(self, "settings", None)
+        if (settings is None or not settings.getbool("QUARTER_DOWNLOAD_SLOTS")
+                or len(self.quarter_codes) < 2):
+            return {}
+        return {"download_slot": f"{urllib.parse.urlparse(url).hostname}:{quarter_code}"}
+
+
+    def use_streaming_parse(self):
+        """
+        Streaming parse is opt in through the STREAMING_PARSE setting.
+        Spiders built outside of a crawler (tests) have no settings.
+        """
+        settings = getattr(self, "settings", None)
+        return settings is not None and settings.getbool("STREAMING_PARSE")
+
+
+    def use_fast_parse(self):
+        """
+        Fast parse is opt in through the FAST_PARSE setting. The streaming
+        parse takes precedence.
+        """
+        settings = getattr(self, "settings", None)
+        return settings is not None and settings.getbool("FAST_PARSE")
         
 
     def get_num_pages(self, soup):
@@ -132,21 +388,32 @@ class SubjectCoursesSpider(scrapy.Spider):
         return num_pages
 
         
-    def parse_extra_page(self, response, subject_code):
+    def parse_extra_page(self, response, subject_code, quarter_code=None, page_num=None):
         """
         Parser for pages beyond the first.
         """
 
-        soup = BeautifulSoup(response.body, "lxml")    
-        # Get all the tags with course information
-        tags = soup.find_all(utils.tag_matches_any)
+        self.record_subject_page(subject_code)
+
+        if self.use_streaming_parse():
+            tags = StreamingPageParser(response.body).iter_tags(PAGE_NUM_REGEX)
+        elif self.use_fast_parse():
+            tags = FastPageParser(response.body).iter_tags()
+        else:
+            soup = BeautifulSoup(response.body, "lxml")    
+            # Get all the tags with course information
+            tags = soup.find_all(utils.tag_matches_any)
 
         # Group by course header.
-        for item in self.course_meeting_items(tags, subject_code):
+        for item in self.course_meeting_items(tags, subject_code, quarter_code,
+                page_num=page_num):
             yield item
 
+        if page_num is not None:
+            self.checkpoint.page_done(quarter_code or self.quarter_code, subject_code, page_num)
+
     
-    def course_meeting_items(self, tags, subject_code):
+    def course_meeting_items(self, tags, subject_code, quarter_code=None, page_num=None):
         """
         Given some all of the matching tags for one page, 
         return rough items representing all the meetings
@@ -157,7 +424,8 @@ class SubjectCoursesSpider(scrapy.Spider):
         tags_grouped = self.group_tags(tags)
 
         for group in tags_grouped:
-            course_item = self.build_item_from_group(group, subject_code)
+            course_item = self.build_item_from_group(group, subject_code, quarter_code,
+                page_num)
             if course_item:
                 yield course_item
 
@@ -166,11 +434,13 @@ class SubjectCoursesSpider(scrapy.Spider):
         return split_before(tags, lambda tag: not tag.has_attr("class"))
 
 
-    def build_item_from_group(self, tag_group, subject_code):
+    def build_item_from_group(self, tag_group, subject_code, quarter_code=None, page_num=None):
         """
         Build a course item from the given group of selectors.
         The first row will always be a crsheader.
         The rest of the rows will be meetings.
+        While quarantining, groups with rows that fail to parse are
+        quarantined, and items carry their raw group.
         """
 
         # If there is only one row, it is just a crsheader
@@ -180,7 +450,7 @@ class SubjectCoursesSpider(scrapy.Spider):
 
         crsheader_tag = tag_group[0]
         loader = CourseMeetingsUncategorizedLoader(item = CourseMeetingsUncategorized())
-        loader.add_value("quarter_code", self.quarter_code)
+        loader.add_value("quarter_code", quarter_code or self.quarter_code)
         loader.add_value("subj_code", subject_code)
 
         crsheader_tag_tds = crsheader_tag.find_all("td")
@@ -195,21 +465,34 @@ class SubjectCoursesSpider(scrapy.Spider):
             loader.add_value("title", crsheader_tag_tds[2].text)
 
 
+        group = None
+        if self.quarantine is not None:
+            group = raw_group(tag_group, quarter_code or self.quarter_code, subject_code,
+                page_num)
+
         first_meeting_tag = tag_group[1]
         try:
             first_meeting_item = self.build_item_from_meeting(first_meeting_tag)
             loader.add_value("first_meeting", first_meeting_item)
         # First main meeting invalid - usually because cancelled.
-        except errors.ScraperError:
+        except errors.CancelledMeetingError:
+            return None
+        except errors.ScraperError as e:
+            if group is not None:
+                self.quarantine.add(group, REASON_FIRST_MEETING, e)
             return None
 
 
         # # Building an item for each subsequent tag.
+        meeting_error = None
         for tag in tag_group[2:]:
             try:
                 meeting_item = self.build_item_from_meeting(tag)
-            except errors.ScraperError:
+            except errors.CancelledMeetingError:
+                continue
+            except errors.ScraperError as e:
                 # Just continue with the next meeting if this row is unparseable.
+                meeting_error = meeting_error or e
                 continue
 
             tr_class = (tag["class"])[0]
@@ -218,7 +501,15 @@ class SubjectCoursesSpider(scrapy.Spider):
             else:
                 loader.add_value("nonenrtxt_meetings", meeting_item)
 
-        return loader.load_item()
+        # The item goes on without the rows that failed, and the whole
+        # group is quarantined to be parsed again later.
+        if group is not None and meeting_error is not None:
+            self.quarantine.add(group, REASON_MEETING, meeting_error)
+
+        item = loader.load_item()
+        if group is not None:
+            item["raw_group"] = group
+        return item
 
 
     def build_item_from_meeting(self, tag):
@@ -229,7 +520,7 @@ class SubjectCoursesSpider(scrapy.Spider):
 
         # Check if the meeting was cancelled.
         if "Cancelled" in tag.text:
-            raise errors.ScraperError("Can't build a cancelled meeting item.")
+            raise errors.CancelledMeetingError("Can't build a cancelled meeting item.")
 
         tr_classes = tag["class"]
         tr_class = tr_classes[0]
@@ -256,11 +547,17 @@ class SubjectCoursesSpider(scrapy.Spider):
         if is_valid_sectxt or is_valid_nonenrtxt:
             days_val = utils.parse_days(tds[IND_DAYS].text)
             loader.add_value("days", days_val)
+            loader.add_value("days_mask", utils.days_to_mask(days_val))
             loader.add_value("bldg", tds[IND_BLDG].text)
             loader.add_value("room", tds[IND_ROOM].text)
             (start_time_val, end_time_val) = utils.parse_time_range(tds[IND_TIME].text)
             loader.add_value("start_time", start_time_val)
             loader.add_value("end_time", end_time_val)
+            loader.add_value("start_minute", utils.time_to_minutes(start_time_val))
+            loader.add_value("end_minute", utils.time_to_minutes(end_time_val))
+        else:
+            # No days known: an empty mask, meeting.days_mask is not null.
+            loader.add_value("days_mask", 0)
 
         if is_valid_sectxt:
             loader.add_value("instructor", tds[IND_INSTRUCTOR].text)
@@ -6,7 +6,9 @@ import scrapy
 import urllib
 
 
-SUBJECTS_BASE_URL = "https://act.ucsd.edu/scheduleOfClasses/subject-list.json"
+SUBJECTS_HOST = "https://act.ucsd.edu"
+SUBJECTS_PATH = "/scheduleOfClasses/subject-list.json"
+SUBJECTS_BASE_URL = f"{SUBJECTS_HOST}{SUBJECTS_PATH}"
 
 
 class ScraperError(Exception):
@@ -26,11 +28,18 @@ class SubjectsSpider(scrapy.Spider):
             raise ScraperError(f"spider {self.name} needs a quarter.")
         self.quarter_code = quarter_code
 
+    async def start(self):
+        # Scrapy >= 2.13 only calls start(), older versions start_requests().
+        for request in self.start_requests():
+            yield request
+
     def start_requests(self):
         query = {
             "selectedTerm": self.quarter_code
         }
-        url = f"{SUBJECTS_BASE_URL}?{urllib.parse.urlencode(query)}"
+        # The host can be pointed elsewhere with SCHEDULE_OF_CLASSES_HOST.
+        host = self.settings.get("SCHEDULE_OF_CLASSES_HOST") or SUBJECTS_HOST
+        url = f"{host.rstrip('/')}{SUBJECTS_PATH}?{urllib.parse.urlencode(query)}"
         yield scrapy.Request(url, callback=self.parse)
 
 
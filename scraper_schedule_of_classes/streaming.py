@@ -0,0 +1,91 @@
+from bs4 import BeautifulSoup
+from lxml import etree
+
+import scraper_schedule_of_classes.utils as utils
+
+
+# Number of bytes of the response body fed to the parser at a time.
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def row_may_match(elem):
+    """
+    Cheap check on an lxml tr element before converting it to bs4.
+    Either crsheader or sectxt/nonenrtxt.
+    """
+    tr_classes = elem.get("class", "").split()
+    if "sectxt" in tr_classes or "nonenrtxt" in tr_classes:
+        return True
+    td = elem.find(".//td")
+    return td is not None and "crsheader" in td.get("class", "").split()
+
+
+def elem_to_tag(elem):
+    """
+    Convert a single closed lxml element into an equivalent bs4 tag,
+    so the rest of the spider can keep working with bs4.
+    """
+    html = etree.tostring(elem, encoding="unicode", with_tail=False)
+    return BeautifulSoup(html, "html.parser").find(elem.tag)
+
+
+def free_elem(elem):
+    """
+    Drop an element that has been handled, along with any siblings
+    before it, so the partial tree never holds more than the current row.
+    """
+    elem.clear(keep_tail=False)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
+class StreamingPageParser:
+    """
+    Incrementally parses a results page, emitting crsheader and meeting
+    rows as bs4 tags as soon as they close, instead of building a tree for
+    the whole page first.
+
+    The page count is recorded in num_pages as it is seen. It is at the
+    top of the page, so it is known by the time the first row is emitted.
+    """
+
+    def __init__(self, body, chunk_size=STREAM_CHUNK_SIZE):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.num_pages = 0
+
+
+    def iter_tags(self, page_num_regex):
+        """
+        Generator of the tags matching utils.tag_matches_any, in page order.
+        """
+        parser = etree.HTMLPullParser(events=("end", ), tag=("tr", "td"))
+
+        for i in range(0, len(self.body), self.chunk_size):
+            parser.feed(self.body[i:i + self.chunk_size])
+            yield from self._handle_events(parser, page_num_regex)
+
+        parser.close()
+        yield from self._handle_events(parser, page_num_regex)
+
+
+    def _handle_events(self, parser, page_num_regex):
+        for _, elem in parser.read_events():
+
+            # Page count cell. Rows are left alone until they close.
+            if elem.tag == "td":
+                if elem.get("align") == "right":
+                    text = etree.tostring(elem, method="text", encoding="unicode")
+                    match = page_num_regex.search(text)
+                    if match:
+                        self.num_pages = int(match.group(1))
+                continue
+
+            if row_may_match(elem):
+                tag = elem_to_tag(elem)
+                if tag is not None and utils.tag_matches_any(tag):
+                    yield tag
+
+            free_elem(elem)
@@ -37,6 +37,18 @@ def tag_matches_meeting(tag):
 
 
 DAYS_REGEX = re.compile(r"(M|Tu|W|Th|F|S)+")
+DAY_REGEX = re.compile(r"M|Tu|W|Th|F|Sa|Su|S")
+# Bit of each day in a day mask. A bare "S" is Saturday.
+DAY_BITS = {
+    "M": 1 << 0,
+    "Tu": 1 << 1,
+    "W": 1 << 2,
+    "Th": 1 << 3,
+    "F": 1 << 4,
+    "S": 1 << 5,
+    "Sa": 1 << 5,
+    "Su": 1 << 6,
+}
 def parse_days(txt):
     txt = txt.strip()
     match = DAYS_REGEX.search(txt)
@@ -45,7 +57,33 @@ def parse_days(txt):
     return match.group(0)
 
 
-MEETING_TYPE_REGEX = re.compile(r"(AC|CL|CO|DI|FI|FM|FW|IN|IT|LA|LE|MI|MU|OT|PB|PR|RE|SE|ST|TU)")
+def days_to_mask(days):
+    """
+    7 bit mask of the days in a days string such as "TuTh".
+    Monday is the lowest bit. None (no days) is an empty mask.
+    """
+    if not days:
+        return 0
+    mask = 0
+    for day in DAY_REGEX.findall(days):
+        mask |= DAY_BITS[day]
+    return mask
+
+
+def time_to_minutes(time):
+    """
+    Minutes since midnight of a datetime.time, or None.
+    """
+    if time is None:
+        return None
+    return time.hour * 60 + time.minute
+
+
+MEETING_TYPES = (
+    "AC", "CL", "CO", "DI", "FI", "FM", "FW", "IN", "IT", "LA",
+    "LE", "MI", "MU", "OT", "PB", "PR", "RE", "SE", "ST", "TU"
+)
+MEETING_TYPE_REGEX = re.compile(f"({'|'.join(MEETING_TYPES)})")
 def parse_meeting_type(txt):
     txt = txt.strip()
     match = MEETING_TYPE_REGEX.search(txt)
@@ -118,6 +156,57 @@ def parse_date(txt):
     return date
 
 
+SHARD_SPEC_REGEX = re.compile(r"^([0-9]+)/([0-9]+)$")
+def parse_shard_spec(txt):
+    """
+    Parse a shard spec "i/N" (shard i of N, 0 based) into (i, N).
+    """
+    txt = txt.strip()
+    match = SHARD_SPEC_REGEX.search(txt)
+    if not match:
+        raise errors.ShardSpecError(f"Could not parse shard spec from {txt}")
+    shard_index, num_shards = int(match.group(1)), int(match.group(2))
+    if num_shards == 0 or shard_index >= num_shards:
+        raise errors.ShardSpecError(f"Shard {shard_index} of {num_shards} does not exist")
+    return (shard_index, num_shards)
+
+
+def shard_subjects(subject_codes, page_counts, num_shards):
+    """
+    Split subjects into num_shards disjoint lists with about the same
+    total number of pages each, using the page counts of a previous crawl
+    (subjects without one count as a single page). Largest subject first,
+    each to the least loaded shard, ties broken by subject code and shard
+    number, so every worker computes the same assignment.
+    """
+    shards = [[] for _ in range(num_shards)]
+    loads = [0] * num_shards
+
+    by_size = sorted(set(subject_codes),
+        key=lambda code: (-page_counts.get(code, 1), code))
+    for code in by_size:
+        shard_index = min(range(num_shards), key=lambda i: (loads[i], i))
+        shards[shard_index].append(code)
+        loads[shard_index] += page_counts.get(code, 1)
+
+    return shards
+
+
+def read_shard_plan(conn, quarter_code, shard_spec):
+    """
+    Subjects of shard "i/N" of the quarter, from its plan into N shards
+    saved in the database, so that every worker, on any machine, crawls
+    the share it was given even if page counts change while they run.
+    """
+    from scraper_schedule_of_classes.db.db import DataAccess
+    shard_index, num_shards = parse_shard_spec(shard_spec)
+    shards = DataAccess.get_shard_plan(conn, quarter_code, num_shards)
+    if shards is None:
+        raise errors.ShardSpecError(f"No plan of {quarter_code} into {num_shards} shards, "
+            f"make one with run_courses_spider.py {quarter_code} --plan-shards={num_shards}")
+    return shards[shard_index]
+
+
 class CourseItemEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime.time):
@@ -0,0 +1,133 @@
+"""
+End to end crawl benchmark against the local mock server.
+
+Runs SubjectCoursesSpider over a synthetic quarter at 1x and 10x the real
+size (more subjects, more rows per page) and reports pages/s, items/s,
+peak memory, bytes on the wire vs decoded and connection reuse for each. Every scale runs in its own process, since a
+CrawlerProcess can only be started once and peak RSS is per process.
+
+    python -m test.bench_crawl [--latency SECONDS] [--error-rate RATE] [--scales 1,10]
+
+Like the spiders, this needs the dev database (DataAccess connects at
+import), but nothing is written to it.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+from test.mock_server import MockScheduleServer, SyntheticSchedule
+
+
+BENCH_QUARTER_CODE = "WI21"
+
+# Synthetic quarter at scale 1, roughly the size of a real one.
+BASE_NUM_SUBJECTS = 60
+BASE_MAX_PAGES = 12
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes elsewhere.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_crawl(scale, latency, error_rate, results):
+    from scraper_schedule_of_classes.spiders.subject_courses_spider \
+        import SubjectCoursesSpider
+
+    # Scale both the number of subjects and the rows on each page.
+    schedule = SyntheticSchedule(num_subjects=BASE_NUM_SUBJECTS * scale,
+        max_pages=BASE_MAX_PAGES, rows_factor=scale)
+    server = MockScheduleServer(schedule, latency=latency, error_rate=error_rate).start()
+
+    settings = get_project_settings().copy()
+    settings.set("SCHEDULE_OF_CLASSES_HOST", server.url)
+    settings.set("FEEDS", {})
+    settings.set("ROBOTSTXT_OBEY", False)
+    settings.set("DOWNLOAD_DELAY", 0)
+    settings.set("LOG_LEVEL", "WARNING")
+
+    counts = {"items": 0, "pages": 0}
+    def item_scraped(item, response, spider):
+        counts["items"] += 1
+    def response_received(response, request, spider):
+        counts["pages"] += 1
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(SubjectCoursesSpider)
+    crawler.signals.connect(item_scraped, signal=signals.item_scraped)
+    crawler.signals.connect(response_received, signal=signals.response_received)
+
+    start = time.perf_counter()
+    process.crawl(crawler, quarter_code=BENCH_QUARTER_CODE,
+        subject_codes=list(schedule.subjects))
+    process.start()
+    elapsed = time.perf_counter() - start
+    server.stop()
+
+    # Injected errors are retried before the spider sees them.
+    counts["errors"] = crawler.stats.get_value("downloader/response_status_count/500", 0)
+    counts["wire_bytes"] = crawler.stats.get_value("bandwidth/wire_bytes", 0)
+    counts["decoded_bytes"] = crawler.stats.get_value("bandwidth/decoded_bytes", 0)
+    counts["connections"] = server.counts.connections
+    counts["requests"] = server.counts.requests
+    results.put(dict(counts, scale=scale, seconds=elapsed,
+        expected_pages=schedule.total_pages, peak_rss=peak_rss_bytes()))
+
+
+def run_scale(scale, latency, error_rate):
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=run_crawl,
+        args=(scale, latency, error_rate, results))
+    proc.start()
+    result = results.get()
+    proc.join()
+    return result
+
+
+def print_result(result):
+    seconds = result["seconds"]
+    print(f"scale {result['scale']:>3}x: "
+        f"{result['pages']}/{result['expected_pages']} pages, "
+        f"{result['items']} items, {result['errors']} errors in {seconds:.1f}s | "
+        f"{result['pages'] / seconds:.1f} pages/s, "
+        f"{result['items'] / seconds:.1f} items/s | "
+        f"peak rss {result['peak_rss'] / 2**20:.0f} MiB | "
+        f"{result['wire_bytes'] / 2**20:.1f}/{result['decoded_bytes'] / 2**20:.1f} MiB "
+        f"wire/decoded, {result['requests'] / max(result['connections'], 1):.1f} "
+        f"requests per connection")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0,
+        help="seconds added to every mock response")
+    parser.add_argument("--error-rate", type=float, default=0,
+        help="fraction of mock responses that are http 500")
+    parser.add_argument("--scales", default="1,10",
+        help="comma separated scale factors")
+    parser.add_argument("--json", action="store_true",
+        help="print the results as json")
+    args = parser.parse_args(argv)
+
+    results = []
+    for scale in [int(s) for s in args.scales.split(",")]:
+        result = run_scale(scale, args.latency, args.error_rate)
+        results.append(result)
+        if not args.json:
+            print_result(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
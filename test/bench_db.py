@@ -0,0 +1,395 @@
+"""
+Database write path benchmark against a local, throwaway Postgres.
+
+Creates a fresh database, applies the schema (mychangelog.postgres.sql),
+and uploads the cleaned fixture items of test_data_files, replicated to
+a full quarter, with every write strategy:
+
+    per_item            item_uploader.save_items with one transaction
+                        per item
+    group_commit        item_uploader.save_items, committing every
+                        --commit-items items or --commit-ms milliseconds
+    threads             item_uploader.upload_items: group commits with
+                        the items split over --threads threads
+    processes           item_uploader.upload_feed: group commits in
+                        --processes worker processes, a subject at a
+                        time, from an item feed of the items. Includes
+                        starting the workers and decoding the feed.
+    single_transaction  one connection, every item in one transaction
+
+and reports rows/s, database round trips and p50/p99 commit latency for
+each. Round trips and commits of worker processes aren't counted, and
+--page-size doesn't apply to them. The database is dropped afterwards
+unless --keep is given.
+
+    python -m test.bench_db [--items N] [--threads N] [--processes N]
+        [--page-size N] [--commit-items N] [--commit-ms T]
+        [--strategies per_item,threads] [--port PORT] [--user USER] [--json]
+
+The user must be allowed to create databases, and pg_trgm available.
+"""
+import argparse
+import json
+import os
+import pathlib
+import pickle
+import tempfile
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras as pg_extras
+import psycopg2.pool as pgpool
+
+from test.data import TEST_FILES_DIR
+
+
+CHANGELOG_PATH = pathlib.Path(__file__).parent.parent.absolute() / "mychangelog.postgres.sql"
+
+BENCH_QUARTER_CODE = "WI21"
+
+# Section groups in a quarter, roughly.
+FULL_QUARTER_ITEMS = 4000
+
+# Copies of a fixture subject are spread over this many subjects, so a
+# full quarter has about as many subjects as a real one.
+SUBJECT_COPIES = 10
+
+# Tables written by DataAccess.insert_section_group_all_info.
+WRITTEN_TABLES = ["course", "course_offering", "section_group", "section_group_search",
+    "meeting", "section_meeting", "general_meeting", "dated_meeting"]
+
+
+class WriteStats:
+    """
+    Round trips and commit latencies of every connection of the pool.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        with self.lock:
+            self.round_trips = 0
+            self.commit_latencies = []
+
+
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+
+
+    def commit(self, seconds):
+        with self.lock:
+            self.round_trips += 1
+            self.commit_latencies.append(seconds)
+
+
+STATS = WriteStats()
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """
+    Every execute is one round trip, including every page of
+    execute_batch.
+    """
+
+    def execute(self, query, vars=None):
+        STATS.round_trip()
+        return super().execute(query, vars)
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """
+    Times commits, explicit or at the end of a "with conn" block.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = CountingCursor
+
+
+    def commit(self):
+        start = time.perf_counter()
+        super().commit()
+        STATS.commit(time.perf_counter() - start)
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            STATS.round_trip()
+            return super().__exit__(exc_type, exc_value, traceback)
+
+        start = time.perf_counter()
+        result = super().__exit__(exc_type, exc_value, traceback)
+        STATS.commit(time.perf_counter() - start)
+        return result
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def load_fixture_items():
+    """
+    Cleaned (ready for upload) items of every fixture page.
+    """
+    from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+    from scraper_schedule_of_classes.spiders.subject_courses_spider \
+        import SubjectCoursesSpider
+
+    cleaner = CourseCleanerPipeline()
+    spider = SubjectCoursesSpider(BENCH_QUARTER_CODE)
+    items = []
+    for path in sorted(TEST_FILES_DIR.glob("*_spider_items")):
+        with open(path, "rb") as f:
+            items.extend(cleaner.process_item(item, spider) for item in pickle.load(f))
+    return items
+
+
+def replicate(items, num_items):
+    """
+    num_items items cycling through items, every copy after the first
+    with its own course numbers so nothing conflicts, in one of
+    SUBJECT_COPIES copies of its subject.
+    """
+    replicated = []
+    for i in range(num_items):
+        copy_num, index = divmod(i, len(items))
+        item = dict(items[index])
+        if copy_num:
+            item["number"] = f"{item['number']}R{copy_num}"
+            item["subj_code"] = f"{item['subj_code'][:3]}{copy_num % SUBJECT_COPIES}"
+        replicated.append(item)
+    return replicated
+
+
+def create_database(args):
+    admin_conn = psycopg2.connect(dbname=args.admin_db, user=args.user,
+        password=args.password, host="localhost", port=args.port)
+    admin_conn.autocommit = True
+    with admin_conn.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {args.dbname};")
+        cur.execute(f"CREATE DATABASE {args.dbname};")
+    admin_conn.close()
+
+    conn = psycopg2.connect(dbname=args.dbname, user=args.user,
+        password=args.password, host="localhost", port=args.port)
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(CHANGELOG_PATH.read_text())
+    conn.close()
+
+
+def drop_database(args):
+    admin_conn = psycopg2.connect(dbname=args.admin_db, user=args.user,
+        password=args.password, host="localhost", port=args.port)
+    admin_conn.autocommit = True
+    with admin_conn.cursor() as cur:
+        cur.execute(f"DROP DATABASE IF EXISTS {args.dbname};")
+    admin_conn.close()
+
+
+def connect_data_access(args):
+    """
+    DataAccess, with its pool on the bench database and counting round
+    trips. DataAccess connects at import, so the environment is set first.
+    """
+    os.environ.update({
+        "ENV": "dev",
+        "DB_NAME": args.dbname,
+        "DB_PORT": str(args.port),
+        "DB_USER_LOCAL": args.user or "",
+        "DB_PASSWORD_LOCAL": args.password or "",
+    })
+    from scraper_schedule_of_classes.db.db import DataAccess
+
+    DataAccess.conn_pool.closeall()
+    DataAccess.conn_pool = pgpool.ThreadedConnectionPool(1, max(20, args.threads),
+        connection_factory=CountingConnection,
+        user=args.user,
+        password=args.password,
+        host="localhost",
+        port=args.port,
+        dbname=args.dbname)
+
+    if args.page_size:
+        def execute_str_batch(conn, query_str, values_list):
+            with conn.cursor() as cur:
+                pg_extras.execute_batch(cur, query_str, values_list, page_size=args.page_size)
+        DataAccess.execute_str_batch = staticmethod(execute_str_batch)
+
+    return DataAccess
+
+
+def upload_per_item(DataAccess, items, args):
+    from item_uploader import save_items
+    save_items(items, commit_items=1)
+
+
+def upload_group_commit(DataAccess, items, args):
+    from item_uploader import save_items
+    save_items(items, args.commit_items, args.commit_ms)
+
+
+def upload_threads(DataAccess, items, args):
+    from item_uploader import upload_items
+    upload_items(items, args.threads, args.commit_items, args.commit_ms)
+
+
+def upload_processes(DataAccess, items, args):
+    from item_uploader import upload_feed
+    from scraper_schedule_of_classes.itemfeed import write_item_feed, read_index
+
+    # Workers connect on their own, with the environment set by
+    # connect_data_access.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        feed_path = os.path.join(tmp_dir, "items.feed")
+        write_item_feed(items, feed_path)
+        upload_feed(feed_path, read_index(feed_path), args.processes,
+            args.commit_items, args.commit_ms)
+
+
+def upload_single_transaction(DataAccess, items, args):
+    conn = DataAccess.get_conn()
+    with conn:
+        for item in items:
+            DataAccess.insert_section_group_all_info(conn, item)
+    DataAccess.put_conn(conn)
+
+
+STRATEGIES = {
+    "per_item": upload_per_item,
+    "group_commit": upload_group_commit,
+    "threads": upload_threads,
+    "processes": upload_processes,
+    "single_transaction": upload_single_transaction,
+}
+
+# Strategies whose writes happen in other processes, out of STATS' sight.
+UNCOUNTED_STRATEGIES = {"processes"}
+
+
+def count_rows(DataAccess):
+    conn = DataAccess.get_conn()
+    with conn:
+        counts = DataAccess.execute_str(conn, "SELECT " + ", ".join(
+            f"(SELECT count(*) FROM {table})" for table in WRITTEN_TABLES) + ";", do_return=True)
+    DataAccess.put_conn(conn)
+    return sum(counts[0])
+
+
+def run_strategy(DataAccess, name, items, args):
+    conn = DataAccess.get_conn()
+    with conn:
+        DataAccess.execute_str(conn, f"TRUNCATE {', '.join(WRITTEN_TABLES)};")
+    DataAccess.put_conn(conn)
+
+    STATS.reset()
+    start = time.perf_counter()
+    STRATEGIES[name](DataAccess, items, args)
+    elapsed = time.perf_counter() - start
+    round_trips = STATS.round_trips
+    latencies = STATS.commit_latencies
+    counted = name not in UNCOUNTED_STRATEGIES
+
+    return {
+        "strategy": name,
+        "items": len(items),
+        "rows": count_rows(DataAccess),
+        "seconds": elapsed,
+        "round_trips": round_trips if counted else None,
+        "commits": len(latencies) if counted else None,
+        "commit_p50": percentile(latencies, 50) if counted else None,
+        "commit_p99": percentile(latencies, 99) if counted else None,
+    }
+
+
+def print_result(result):
+    seconds = result["seconds"]
+    if result["round_trips"] is None:
+        print(f"{result['strategy']:>18}: {result['items']} items, "
+            f"{result['rows']} rows in {seconds:.1f}s | "
+            f"{result['rows'] / seconds:.0f} rows/s | "
+            f"round trips and commits not counted")
+        return
+    print(f"{result['strategy']:>18}: {result['items']} items, "
+        f"{result['rows']} rows in {seconds:.1f}s | "
+        f"{result['rows'] / seconds:.0f} rows/s | "
+        f"{result['round_trips']} round trips, "
+        f"{result['round_trips'] / max(result['items'], 1):.1f} per item | "
+        f"{result['commits']} commits, p50 {result['commit_p50'] * 1000:.2f} ms, "
+        f"p99 {result['commit_p99'] * 1000:.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=FULL_QUARTER_ITEMS,
+        help="items uploaded by every strategy")
+    parser.add_argument("--threads", type=int, default=20,
+        help="threads of the threads strategy")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(),
+        help="worker processes of the processes strategy")
+    parser.add_argument("--page-size", type=int, default=0,
+        help="execute_batch page size, 0 for one page per batch like DataAccess")
+    parser.add_argument("--commit-items", type=int, default=500,
+        help="items per transaction of group commits")
+    parser.add_argument("--commit-ms", type=float, default=1000,
+        help="milliseconds before a group commit")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+        help="comma separated strategies to run")
+    parser.add_argument("--port", type=int, default=int(os.getenv("DB_PORT") or 5432))
+    parser.add_argument("--user", default=os.getenv("DB_USER_LOCAL"))
+    parser.add_argument("--password", default=os.getenv("DB_PASSWORD_LOCAL"))
+    parser.add_argument("--admin-db", default="postgres",
+        help="database to connect to for creating the bench database")
+    parser.add_argument("--dbname", default="schedule_of_classes_bench",
+        help="name of the throwaway bench database")
+    parser.add_argument("--keep", action="store_true",
+        help="keep the bench database afterwards")
+    parser.add_argument("--json", action="store_true",
+        help="print the results as json")
+    args = parser.parse_args(argv)
+
+    strategies = args.strategies.split(",")
+    for name in strategies:
+        if name not in STRATEGIES:
+            parser.error(f"unknown strategy {name}")
+
+    create_database(args)
+    try:
+        # Loading the items imports DataAccess, so the pool must be set up first.
+        DataAccess = connect_data_access(args)
+        items = replicate(load_fixture_items(), args.items)
+
+        conn = DataAccess.get_conn()
+        with conn:
+            DataAccess.insert_quarter(conn, BENCH_QUARTER_CODE, BENCH_QUARTER_CODE)
+            DataAccess.insert_subjects(conn, [{"code": code, "name": code}
+                for code in sorted({item["subj_code"] for item in items})])
+        DataAccess.put_conn(conn)
+
+        results = []
+        for name in strategies:
+            result = run_strategy(DataAccess, name, items, args)
+            results.append(result)
+            if not args.json:
+                print_result(result)
+        DataAccess.close()
+    finally:
+        if not args.keep:
+            drop_database(args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
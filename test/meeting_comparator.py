@@ -3,6 +3,7 @@ import unittest
 from itertools import zip_longest
 
 from scraper_schedule_of_classes.items import *
+from scraper_schedule_of_classes import utils
 
 
 class MeetingComparator(unittest.TestCase):
@@ -30,6 +31,9 @@ class MeetingComparator(unittest.TestCase):
         loader.add_value("days", days)
         loader.add_value("start_time", start_time)
         loader.add_value("end_time", end_time)
+        loader.add_value("days_mask", utils.days_to_mask(days))
+        loader.add_value("start_minute", utils.time_to_minutes(start_time))
+        loader.add_value("end_minute", utils.time_to_minutes(end_time))
         loader.add_value("bldg", bldg)
         loader.add_value("room", room)
         loader.add_value("instructor", instructor)
@@ -0,0 +1,213 @@
+"""
+Local stand-in for act.ucsd.edu's schedule of classes, for load testing
+the spiders without hitting the real site.
+
+Serves subject-list.json and paginated scheduleOfClassesFacultyResult.htm
+pages built from the fixture pages in test_data_files. A synthetic
+generator scales the number of subjects and rows per page, and requests
+can be given latency and random errors. Like the real site, connections
+are kept alive and responses are gzipped when the client accepts it.
+
+    python -m test.mock_server [port]
+
+then crawl with -s SCHEDULE_OF_CLASSES_HOST=http://localhost:<port>
+"""
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from test.data import TEST_FILES_DIR
+
+
+SUBJECTS_PATH = "/scheduleOfClasses/subject-list.json"
+RESULTS_PATH = "/scheduleOfClasses/scheduleOfClassesFacultyResult.htm"
+
+PAGE_NUM_REGEX = re.compile(rb"Page \([0-9]+&nbsp;of&nbsp;[0-9]+\)")
+
+
+class PageTemplate:
+    """
+    A fixture page split into the part before the results rows, the rows,
+    and the part after, so pages with any number of rows can be built.
+    """
+
+    def __init__(self, html):
+        first_row = html.find(b'class="crsheader"')
+        self.start = html.rfind(b"<tr", 0, first_row)
+        last_row = max(html.rfind(b'class="sectxt"'), html.rfind(b'class="nonenrtxt"'))
+        self.end = html.find(b"</table>", last_row)
+
+        self.head = html[:self.start]
+        self.rows = html[self.start:self.end]
+        self.tail = html[self.end:]
+
+
+    def render(self, page_num, num_pages, rows_factor=1):
+        page_str = f"Page ({page_num}&nbsp;of&nbsp;{num_pages})".encode()
+        head = PAGE_NUM_REGEX.sub(page_str, self.head)
+        tail = PAGE_NUM_REGEX.sub(page_str, self.tail)
+        return head + self.rows * rows_factor + tail
+
+
+def load_templates():
+    return [
+        PageTemplate(path.read_bytes())
+        for path in sorted(TEST_FILES_DIR.glob("*.html"))
+    ]
+
+
+class SyntheticSchedule:
+    """
+    num_subjects subjects, with 1 to max_pages pages each (deterministic
+    given the seed), each page being a fixture page with its rows repeated
+    rows_factor times.
+    """
+
+    def __init__(self, num_subjects=50, max_pages=12, rows_factor=1, seed=0):
+        rng = random.Random(seed)
+        self.templates = load_templates()
+        self.rows_factor = rows_factor
+        self.subjects = {}
+        self.subject_indexes = {}
+        for i in range(num_subjects):
+            code = f"S{i:03d}"
+            self.subjects[code] = rng.randint(1, max_pages)
+            self.subject_indexes[code] = i
+
+
+    def subject_list(self):
+        return [
+            {"code": code, "value": f"{code} - Synthetic Subject {code}"}
+            for code in self.subjects
+        ]
+
+
+    def page(self, subject_code, page_num):
+        num_pages = self.subjects.get(subject_code)
+        if num_pages is None or page_num > num_pages:
+            return None
+        template_index = self.subject_indexes[subject_code] + page_num
+        template = self.templates[template_index % len(self.templates)]
+        return template.render(page_num, num_pages, self.rows_factor)
+
+
+    @property
+    def total_pages(self):
+        return sum(self.subjects.values())
+
+
+class ServerCounts:
+    """
+    Connections and requests served, to check connection reuse.
+    """
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+    def inc(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+def gzip_bytes(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def make_handler(schedule, counts, latency=0, error_rate=0, seed=0):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class MockScheduleHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            counts.inc("connections")
+
+        def do_GET(self):
+            counts.inc("requests")
+            url = urllib.parse.urlparse(self.path)
+            query = urllib.parse.parse_qs(url.query)
+
+            if latency:
+                time.sleep(latency)
+            with rng_lock:
+                fail = rng.random() < error_rate
+            if fail:
+                self.send_error(500, "Injected error")
+                return
+
+            if url.path == SUBJECTS_PATH:
+                body = json.dumps(schedule.subject_list()).encode()
+                content_type = "application/json"
+            elif url.path == RESULTS_PATH:
+                subject_code = query.get("selectedSubjects", [""])[0]
+                page_num = int(query.get("page", ["1"])[0])
+                body = schedule.page(subject_code, page_num)
+                content_type = "text/html;charset=UTF-8"
+            else:
+                body = None
+
+            if body is None:
+                self.send_error(404)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip_bytes(body)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockScheduleHandler
+
+
+class MockScheduleServer:
+    """
+    Runs the mock site in a background thread. port 0 picks a free port.
+    """
+
+    def __init__(self, schedule, port=0, latency=0, error_rate=0):
+        self.schedule = schedule
+        self.counts = ServerCounts()
+        self.httpd = ThreadingHTTPServer(("localhost", port),
+            make_handler(schedule, self.counts, latency, error_rate))
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+    def start(self):
+        self.thread.start()
+        return self
+
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    server = MockScheduleServer(SyntheticSchedule(), port=port)
+    print(f"Serving mock schedule of classes on {server.url}")
+    server.httpd.serve_forever()
@@ -0,0 +1,93 @@
+import tempfile
+import unittest
+import urllib.parse
+
+from scrapy.settings import Settings
+
+from scraper_schedule_of_classes.checkpoint import CrawlCheckpoint, load_resumable
+from scraper_schedule_of_classes.errors import CheckpointError
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+
+
+class CrawlCheckpointTest(unittest.TestCase):
+    """
+    A checkpoint should keep the pages done and pending of every subject,
+    and a spider resuming from it should only request the pending pages.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = f"{self.tmp_dir.name}/checkpoint.json"
+
+        self.checkpoint = CrawlCheckpoint(["WI21"], ["CSE", "MATH", "BENG"])
+        self.checkpoint.set_num_pages("WI21", "CSE", 3)
+        self.checkpoint.page_done("WI21", "CSE", 1)
+        self.checkpoint.page_done("WI21", "CSE", 3)
+        self.checkpoint.set_num_pages("WI21", "MATH", 0)
+        self.checkpoint.items_persisted = 42
+
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_pending_pages(self):
+        self.assertEqual(self.checkpoint.pending_pages("WI21", "CSE"), [2])
+        self.assertEqual(self.checkpoint.pending_pages("WI21", "MATH"), [])
+        self.assertIsNone(self.checkpoint.pending_pages("WI21", "BENG"))
+        self.assertEqual(self.checkpoint.num_pending(), (1, 1))
+        self.assertFalse(self.checkpoint.is_complete())
+
+
+    def test_round_trip(self):
+        self.checkpoint.save(self.path)
+        loaded = CrawlCheckpoint.load(self.path)
+
+        self.assertEqual(loaded.quarter_codes, ["WI21"])
+        self.assertEqual(loaded.subject_codes, ["CSE", "MATH", "BENG"])
+        self.assertEqual(loaded.items_persisted, 42)
+        self.assertEqual(loaded.num_pages, self.checkpoint.num_pages)
+        self.assertEqual(loaded.pages_done, self.checkpoint.pages_done)
+
+
+    def test_finished_not_resumable(self):
+        self.checkpoint.save(self.path)
+        self.assertIsNotNone(load_resumable(self.path))
+
+        self.checkpoint.finished = True
+        self.checkpoint.save(self.path)
+        self.assertIsNone(load_resumable(self.path))
+        self.assertIsNone(load_resumable(f"{self.tmp_dir.name}/missing.json"))
+
+
+    def test_bad_checkpoint(self):
+        with open(self.path, "w") as f:
+            f.write("not json")
+        with self.assertRaises(CheckpointError):
+            CrawlCheckpoint.load(self.path)
+
+
+    def test_spider_resumes(self):
+        self.checkpoint.save(self.path)
+
+        spider = SubjectCoursesSpider("WI21", subject_codes=["CSE", "MATH", "BENG"])
+        spider.settings = Settings({"CRAWL_CHECKPOINT_PATH": self.path})
+        requests = list(spider.start_requests())
+
+        pages = []
+        for request in requests:
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(request.url).query)
+            pages.append((query["selectedSubjects"][0], query.get("page", ["1"])[0]))
+        self.assertCountEqual(pages, [("CSE", "2"), ("BENG", "1")])
+        self.assertEqual(spider.checkpoint.items_persisted, 42)
+
+
+    def test_spider_ignores_other_crawl(self):
+        self.checkpoint.save(self.path)
+
+        spider = SubjectCoursesSpider("WI21", subject_codes=["CSE"])
+        spider.settings = Settings({"CRAWL_CHECKPOINT_PATH": self.path})
+        requests = list(spider.start_requests())
+
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(spider.checkpoint.items_persisted, 0)
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+
+from scrapy.exceptions import DropItem
+
+from scraper_schedule_of_classes.conflicts import ConflictIndex, write_conflict_index
+from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+from scraper_schedule_of_classes.snapshot import Snapshot, write_snapshot
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+
+from test.data import get_spider_parser_items
+
+
+def option_meetings(item, section_meeting):
+    return [section_meeting] + [
+        m for m in item.get("general_meetings") or [] if m.get("essential")
+    ]
+
+
+def meetings_conflict(first, second):
+    if first.get("days_mask") is None or second.get("days_mask") is None:
+        return False
+    return (
+        (first.get("days_mask") & second.get("days_mask")) != 0 and
+        first.get("start_minute") < second.get("end_minute") and
+        second.get("start_minute") < first.get("end_minute")
+    )
+
+
+class ConflictIndexTest(unittest.TestCase):
+    """
+    The vectorized conflict index should agree with checking every pair
+    of options meeting by meeting.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        pipeline = CourseCleanerPipeline()
+        spider = SubjectCoursesSpider("WI21")
+        cls.items = []
+        for subject_code, page_num in [("MATH", 1), ("ECE", 1), ("CSE", 1)]:
+            for item in get_spider_parser_items("WI21", subject_code, page_num):
+                try:
+                    cls.items.append(pipeline.process_item(item, spider))
+                except DropItem:
+                    continue
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/WI21.snapshot"
+            write_snapshot(cls.items, path)
+            with Snapshot(path) as snapshot:
+                # Small blocks so that several blocks are exercised.
+                cls.index = ConflictIndex.from_snapshot(snapshot, block_size=16)
+
+
+    def test_options(self):
+        num_options = sum(len(item.get("section_meetings")) for item in self.items)
+        self.assertEqual(self.index.num_options, num_options)
+
+
+    def test_conflicts_match_pairwise(self):
+        options = [
+            option_meetings(item, section_meeting)
+            for item in self.items
+            for section_meeting in item.get("section_meetings")
+        ]
+
+        for a, a_meetings in enumerate(options):
+            for b, b_meetings in enumerate(options):
+                exp = a != b and any(
+                    meetings_conflict(first, second)
+                    for first in a_meetings for second in b_meetings
+                )
+                self.assertEqual(self.index.conflicts(a, b), exp, (a, b))
+
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/WI21.conflicts.npz"
+            self.index.save(path)
+            loaded = ConflictIndex.load(path)
+        self.assertEqual(loaded.quarter_code, "WI21")
+        for a in range(self.index.num_options):
+            self.assertEqual(
+                list(loaded.conflicting_options(a)),
+                list(self.index.conflicting_options(a)))
+
+
+    def test_quarters(self):
+        # The same section groups in another quarter: no option of one
+        # quarter may conflict with the other's.
+        spring_items = []
+        for item in self.items[:10]:
+            spring_item = item.copy()
+            spring_item["quarter_code"] = "SP21"
+            spring_items.append(spring_item)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot_path = f"{tmp_dir}/quarters.snapshot"
+            write_snapshot(self.items + spring_items, snapshot_path)
+            with Snapshot(snapshot_path) as snapshot:
+                with self.assertRaises(ValueError):
+                    ConflictIndex.from_snapshot(snapshot)
+
+            indexes = write_conflict_index(snapshot_path, f"{tmp_dir}/quarters.conflicts.npz")
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["quarters.conflicts.SP21.npz",
+                "quarters.conflicts.WI21.npz", "quarters.snapshot"])
+            spring = ConflictIndex.load(f"{tmp_dir}/quarters.conflicts.SP21.npz")
+
+        self.assertEqual(sorted(indexes), ["SP21", "WI21"])
+        self.assertEqual(indexes["WI21"].num_options, self.index.num_options)
+        self.assertEqual(list(indexes["WI21"].option_section_group),
+            list(self.index.option_section_group))
+        num_spring_options = sum(len(item.get("section_meetings")) for item in spring_items)
+        self.assertEqual(spring.num_options, num_spring_options)
+        self.assertTrue(all(section_group >= len(self.items)
+            for section_group in spring.option_section_group))
+        for a in range(num_spring_options):
+            winter_conflicts = self.index.conflicting_options(a)
+            self.assertEqual(list(spring.conflicting_options(a)),
+                list(winter_conflicts[winter_conflicts < num_spring_options]))
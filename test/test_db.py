@@ -0,0 +1,485 @@
+import datetime
+import tempfile
+import unittest
+
+import psycopg2 as pg
+from bs4 import BeautifulSoup
+from scrapy.exceptions import DropItem
+
+from scraper_schedule_of_classes.db.cache import ScheduleCache
+from scraper_schedule_of_classes.db.db import DataAccess, INSERT_PREPARE_STATEMENTS
+from scraper_schedule_of_classes.db.seat_changes import SeatChange, SeatChangeTracker, \
+    ChangeLogPublisher, encode_batches, decode_batch, read_change_log
+from scraper_schedule_of_classes.db.seat_history import encode_points, decode_points, \
+    chunks_points, seat_history_writes
+from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+from scraper_schedule_of_classes import errors, utils
+import test.data
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def cleaned_items(items, spider):
+    cleaner = CourseCleanerPipeline()
+    for item in items:
+        try:
+            yield cleaner.process_item(item, spider)
+        except DropItem:
+            continue
+
+
+class FakeConn:
+    """
+    A connection the server may have dropped: it only finds out on its
+    next query, like psycopg2.
+    """
+
+    def __init__(self, dropped=False):
+        self.dropped = dropped
+        self.closed = 0
+        self.queries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, values=None):
+        if self.dropped:
+            self.closed = 2
+            raise pg.OperationalError("server closed the connection unexpectedly")
+        self.queries.append(query)
+
+
+class FakePool:
+
+    maxconn = 2
+
+    def __init__(self, conns):
+        self.conns = conns
+        self.closed_conns = []
+
+    def getconn(self):
+        return self.conns.pop(0) if self.conns else FakeConn()
+
+    def putconn(self, conn, close=False):
+        if close:
+            self.closed_conns.append(conn)
+
+
+class GetConnTest(unittest.TestCase):
+    """
+    get_conn should replace pooled connections the server dropped, even
+    though they don't look closed until they are used.
+    """
+
+    def setUp(self):
+        self.conn_pool = DataAccess.conn_pool
+
+    def tearDown(self):
+        DataAccess.conn_pool = self.conn_pool
+
+
+    def test_dropped_conns_replaced(self):
+        dropped = [FakeConn(dropped=True), FakeConn(dropped=True)]
+        alive = FakeConn()
+        for conn in dropped + [alive]:
+            DataAccess.prepared_conns.add(conn)
+        DataAccess.conn_pool = FakePool(dropped + [alive])
+
+        self.assertIs(DataAccess.get_conn(), alive)
+        self.assertEqual(DataAccess.conn_pool.closed_conns, dropped)
+        self.assertEqual(alive.queries, ["SELECT 1"])
+
+
+    def test_new_conn_prepared(self):
+        DataAccess.conn_pool = FakePool([FakeConn(dropped=True), FakeConn(dropped=True)])
+        conn = DataAccess.get_conn()
+        self.assertEqual(conn.queries, INSERT_PREPARE_STATEMENTS)
+        self.assertIn(conn, DataAccess.prepared_conns)
+
+
+class ScheduleCacheTest(unittest.TestCase):
+    """
+    Cached schedules should be returned until they expire, are evicted,
+    or the upload generation changes.
+    """
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ScheduleCache(max_size=2, ttl=60, generation_interval=10,
+            clock=self.clock)
+        self.generation = 1
+        self.loads = 0
+
+
+    def fetch_generation(self):
+        return self.generation
+
+
+    def get(self, key):
+        def load():
+            self.loads += 1
+            return (key, self.loads)
+        return self.cache.get(key, self.fetch_generation, load)
+
+
+    def test_hit(self):
+        self.assertEqual(self.get("WI21"), ("WI21", 1))
+        self.assertEqual(self.get("WI21"), ("WI21", 1))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+
+    def test_ttl(self):
+        self.get("WI21")
+        self.clock.now = 61
+        self.assertEqual(self.get("WI21"), ("WI21", 2))
+
+
+    def test_lru_eviction(self):
+        self.get("WI21")
+        self.get("SP21")
+        self.get("WI21")
+        self.get("FA21")
+        self.assertEqual(list(self.cache.entries), ["WI21", "FA21"])
+
+
+    def test_generation(self):
+        self.get("WI21")
+
+        # Not checked again before generation_interval.
+        self.generation = 2
+        self.clock.now = 5
+        self.assertEqual(self.get("WI21"), ("WI21", 1))
+
+        self.clock.now = 10
+        self.assertEqual(self.get("WI21"), ("WI21", 2))
+
+
+    def test_invalidate(self):
+        self.get("WI21")
+        self.generation = 2
+        self.cache.invalidate()
+        self.assertEqual(self.get("WI21"), ("WI21", 2))
+
+
+class ScheduleFromRowsTest(unittest.TestCase):
+    """
+    Meeting rows from DataAccess.select_schedule should be grouped into
+    section groups shaped like CourseMeetings items.
+    """
+
+    def test_schedule_from_rows(self):
+        common = ("WI21", "CSE", "8A", "Intro to Programming 1", "A00",
+            "Politz, Joseph Gibbs")
+        start, end = datetime.time(17, 0), datetime.time(17, 50)
+        rows = [
+            (1, *common, 10, "LE", "TuTh", start, end, "RCLAS", "R37", 10, 1020, 1070,
+                None, None, "A00", True, None),
+            (1, *common, 11, "LA", "W", start, end, "RCLAS", "R97", 4, 1020, 1070,
+                "A50", 0, None, None, None),
+            (1, *common, 12, "FI", "Th", start, end, "TBA", "TBA", 8, 1020, 1070,
+                None, None, None, None, "03/18/2021"),
+            (2, "WI21", "CSE", "8A", "Intro to Programming 1", "B00", None,
+                *(None, ) * 15),
+        ]
+
+        schedule = DataAccess.schedule_from_rows(rows)
+
+        self.assertEqual(len(schedule), 2)
+        a00, b00 = schedule
+        self.assertEqual(a00["section_group_code"], "A00")
+        self.assertEqual([m["number"] for m in a00["general_meetings"]], ["A00"])
+        self.assertTrue(a00["general_meetings"][0]["essential"])
+        self.assertEqual(a00["section_meetings"][0]["seats_avail"], 0)
+        self.assertEqual(a00["section_meetings"][0]["days_mask"], 4)
+        self.assertEqual(a00["dated_meetings"][0]["date"], "03/18/2021")
+
+        self.assertEqual(b00["section_group_code"], "B00")
+        self.assertEqual(b00["section_meetings"] + b00["general_meetings"]
+            + b00["dated_meetings"], [])
+
+
+class MeetingValuesTest(unittest.TestCase):
+    """
+    Meeting insert parameters should never have a null days mask, the
+    column is not null. Some fixture meetings have no days.
+    """
+
+    PAGES = [("BENG", 2), ("CSE", 1), ("ECE", 1), ("MATH", 1), ("PHYS", 8)]
+
+    def assert_days_masks(self, items):
+        num_meetings = 0
+        for item in items:
+            for values in DataAccess.meeting_values(1, item):
+                for meeting_values in values:
+                    num_meetings += 1
+                    # days mask is the third from last parameter of every insert.
+                    self.assertIsNotNone(meeting_values[-3], item)
+        self.assertGreater(num_meetings, 0)
+
+
+    def test_days_mask_not_null(self):
+        spider = SubjectCoursesSpider("WI21")
+        for subject_code, page_num in self.PAGES:
+            with self.subTest(subject_code=subject_code, page_num=page_num):
+                # Items pickled before every meeting had a days mask.
+                self.assert_days_masks(cleaned_items(
+                    test.data.get_spider_parser_items("WI21", subject_code, page_num), spider))
+
+                html = test.data.get_html_binary("WI21", subject_code, page_num)
+                tags = BeautifulSoup(html, "lxml").find_all(utils.tag_matches_any)
+                items = [spider.build_item_from_group(group, subject_code, "WI21")
+                    for group in spider.group_tags(tags)]
+                items = [item for item in items if item is not None]
+                # Fresh items carry a mask for every meeting themselves.
+                for item in items:
+                    for meeting in [item.get("first_meeting")] + item.get("sectxt_meetings", []) \
+                            + item.get("nonenrtxt_meetings", []):
+                        if meeting is not None:
+                            self.assertIsNotNone(meeting.get("days_mask"), item)
+                self.assert_days_masks(cleaned_items(items, spider))
+
+
+class SectionGroupRescrapeTest(unittest.TestCase):
+    """
+    Scraping a section group again should replace it whole, instructor
+    included, so the schedule and search agree. Runs against the
+    database, in a transaction that is rolled back.
+    """
+
+    QUARTER_CODE = "TE99"
+
+    def setUp(self):
+        self.conn = DataAccess.get_conn()
+
+    def tearDown(self):
+        self.conn.rollback()
+        DataAccess.put_conn(self.conn)
+
+
+    def test_instructor_change(self):
+        spider = SubjectCoursesSpider("WI21", subject_codes=[])
+        item = next(dict(item) for item in cleaned_items(
+            test.data.get_spider_parser_items("WI21", "CSE", 1), spider))
+        item["quarter_code"] = self.QUARTER_CODE
+        DataAccess.insert_quarter(self.conn, self.QUARTER_CODE, "Test quarter")
+        DataAccess.insert_subjects(self.conn, [{"code": item["subj_code"], "name": "Test"}])
+
+        DataAccess.replace_section_group_all_info(self.conn, item)
+        DataAccess.replace_section_group_all_info(self.conn,
+            dict(item, instructor="Rescraped, Instructor"))
+
+        schedule = DataAccess.select_schedule(self.conn, self.QUARTER_CODE,
+            item["subj_code"], item["number"])
+        self.assertEqual([(section_group["section_group_code"], section_group["instructor"])
+            for section_group in schedule],
+            [(item["section_group_code"], "Rescraped, Instructor")])
+        self.assertEqual(len(schedule[0]["section_meetings"]), len(item["section_meetings"]))
+
+        results = DataAccess.search_section_groups(self.conn, self.QUARTER_CODE, "Rescraped")
+        self.assertEqual([result["instructor"] for result in results], ["Rescraped, Instructor"])
+
+
+class ShardPlanTest(unittest.TestCase):
+    """
+    Workers should read their share of a shard plan saved in the
+    database as planned, whatever the page counts are by the time they
+    start. Runs against the database, in a transaction that is rolled
+    back.
+    """
+
+    QUARTER_CODE = "TE99"
+
+    def setUp(self):
+        self.conn = DataAccess.get_conn()
+
+    def tearDown(self):
+        self.conn.rollback()
+        DataAccess.put_conn(self.conn)
+
+
+    def test_read_shards(self):
+        with self.assertRaises(errors.ShardSpecError):
+            utils.read_shard_plan(self.conn, self.QUARTER_CODE, "0/3")
+
+        DataAccess.save_shard_plan(self.conn, self.QUARTER_CODE, [["MATH"], ["CSE"], ["ECE"]])
+        shards = [["MATH", "BENG"], ["PHYS", "BILD"], ["CSE", "ECE"]]
+        DataAccess.save_shard_plan(self.conn, self.QUARTER_CODE, shards)
+        self.assertEqual([utils.read_shard_plan(self.conn, self.QUARTER_CODE, f"{i}/3")
+            for i in range(3)], shards)
+        with self.assertRaises(errors.ShardSpecError):
+            utils.read_shard_plan(self.conn, self.QUARTER_CODE, "0/2")
+
+
+class SearchDocumentTest(unittest.TestCase):
+    """
+    Search documents and queries should be normalized the same way.
+    """
+
+    def test_search_document(self):
+        item = {
+            "subj_code": "CSE",
+            "number": "8A",
+            "title": "Intro to Programming 1",
+            "instructor": "Politz, Joseph Gibbs"
+        }
+        self.assertEqual(DataAccess.search_document(item),
+            "cse 8a intro to programming 1 politz joseph gibbs")
+
+
+    def test_normalize_query(self):
+        self.assertEqual(DataAccess.normalize_search_text("  CSE   1"), "cse 1")
+        self.assertEqual(DataAccess.normalize_search_text("Politz,"), "politz")
+        self.assertEqual(DataAccess.normalize_search_text(None), "")
+
+
+
+class SeatChangesTest(unittest.TestCase):
+    """
+    Only seats that changed since the last upload should be published,
+    in batches that decode back to the same changes.
+    """
+
+    def make_item(self, seats):
+        return {
+            "quarter_code": "WI21",
+            "subj_code": "CSE",
+            "number": "8A",
+            "section_group_code": "A00",
+            "section_meetings": [
+                {"number": number, "seats_avail": seats_avail}
+                for number, seats_avail in seats.items()
+            ]
+        }
+
+
+    def test_observe(self):
+        tracker = SeatChangeTracker(publisher=None)
+        tracker.previous = {
+            ("WI21", "CSE", "8A", "A50"): 0,
+            ("WI21", "CSE", "8A", "A51"): 3,
+        }
+        tracker.known_quarters = {"WI21"}
+
+        tracker.observe(self.make_item({"A50": 2, "A51": 3, "A52": 10}))
+
+        self.assertEqual(tracker.pending_changes, [
+            SeatChange("WI21", "CSE", "8A", "A00", "A50", 0, 2),
+            SeatChange("WI21", "CSE", "8A", "A00", "A52", None, 10),
+        ])
+        self.assertEqual(len(tracker.pending_seats), 2)
+
+
+    def test_first_upload_not_published(self):
+        tracker = SeatChangeTracker(publisher=None)
+        tracker.observe(self.make_item({"A50": 2}))
+
+        self.assertEqual(tracker.pending_changes, [])
+        self.assertEqual(tracker.pending_seats, [("WI21", "CSE", "8A", "A50", 2)])
+
+
+    def test_batches(self):
+        changes = [
+            SeatChange("WI21", "CSE", f"{i}", "A00", "A50", i, i + 1)
+            for i in range(1000)
+        ]
+        payloads = list(encode_batches(changes, max_bytes=1000))
+
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(payload) <= 1000 for payload in payloads))
+        decoded = [change for payload in payloads for change in decode_batch(payload)]
+        self.assertEqual(decoded, changes)
+
+
+    def test_change_log(self):
+        changes = [SeatChange("WI21", "CSE", "8A", "A00", "A50", 0, 2)]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/seat_changes.log"
+            publisher = ChangeLogPublisher(path)
+            publisher.publish(None, changes)
+
+            batches = list(read_change_log(path))
+            self.assertEqual([batch for (_, batch) in batches], [changes])
+
+            # Nothing new after the last offset, until more is published.
+            offset = batches[-1][0]
+            self.assertEqual(list(read_change_log(path, offset)), [])
+            publisher.publish(None, changes)
+            self.assertEqual([batch for (_, batch) in read_change_log(path, offset)], [changes])
+
+
+
+class SeatHistoryTest(unittest.TestCase):
+    """
+    Packed seat history points should decode to the points recorded, also
+    when appended to a chunk in several writes.
+    """
+
+    POINTS = [
+        (1610000000, 40),
+        (1610000300, 38),
+        (1610000300, 41),
+        (1610090000, 0),
+        (1610090060, None),
+        (1619000000, 250),
+    ]
+
+    def test_round_trip(self):
+        first_time = self.POINTS[0][0]
+        data = encode_points(self.POINTS, first_time, 0)
+
+        self.assertEqual(decode_points(first_time, data), self.POINTS)
+        self.assertLess(len(data), 4 * len(self.POINTS))
+
+
+    def test_append(self):
+        first_time = self.POINTS[0][0]
+        data = encode_points(self.POINTS[:2], first_time, 0)
+        for i in range(2, len(self.POINTS)):
+            (prev_time, prev_seats) = self.POINTS[i - 1]
+            data += encode_points(self.POINTS[i:i + 1], prev_time,
+                -1 if prev_seats is None else prev_seats)
+
+        self.assertEqual(decode_points(first_time, data), self.POINTS)
+
+
+    def test_range(self):
+        chunks = [
+            {"first_time": self.POINTS[3][0],
+             "points": encode_points(self.POINTS[3:], self.POINTS[3][0], 0)},
+            {"first_time": self.POINTS[0][0],
+             "points": encode_points(self.POINTS[:3], self.POINTS[0][0], 0)},
+        ]
+
+        self.assertEqual(chunks_points(chunks), self.POINTS)
+        self.assertEqual(chunks_points(chunks, start=1610000300, end=1610090000),
+            self.POINTS[1:4])
+
+
+    def test_clock_step_back(self):
+        key = ("WI21", "CSE", "11", "A01")
+        first_time = self.POINTS[0][0]
+        data = encode_points(self.POINTS[:3], first_time, 0)
+        last_chunks = {key: {"first_time": first_time, "last_time": self.POINTS[2][0],
+            "last_seats": self.POINTS[2][1], "num_points": 3}}
+
+        # A point timed before the chunk's last one is kept at its time.
+        appends, inserts = seat_history_writes({key: [(first_time, 39)]}, last_chunks)
+        self.assertEqual(inserts, [])
+        (append_data, last_time, last_seats, num_points, *_) = appends[0]
+        self.assertEqual((last_time, last_seats, num_points), (self.POINTS[2][0], 39, 1))
+        self.assertEqual(decode_points(first_time, data + append_data),
+            self.POINTS[:3] + [(self.POINTS[2][0], 39)])
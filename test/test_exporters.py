@@ -0,0 +1,63 @@
+import datetime
+import unittest
+
+from scrapy.exceptions import DropItem
+
+from scraper_schedule_of_classes.exporters import ColumnarQuarter
+from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+
+from test.data import get_spider_parser_items
+
+
+class ColumnarQuarterTest(unittest.TestCase):
+    """
+    ColumnarQuarter should split CourseMeetings items into a section
+    groups table and a meetings table that refers back to it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        pipeline = CourseCleanerPipeline()
+        spider = SubjectCoursesSpider("WI21")
+        cls.items = []
+        for item in get_spider_parser_items("WI21", "PHYS", 8):
+            try:
+                cls.items.append(pipeline.process_item(item, spider))
+            except DropItem:
+                continue
+
+        cls.quarter = ColumnarQuarter()
+        for item in cls.items:
+            cls.quarter.add_item(item)
+
+
+    def test_section_groups_table(self):
+        table = self.quarter.table("section_groups")
+        self.assertEqual(table.num_rows, len(self.items))
+        rows = table.to_pylist()
+        for i, item in enumerate(self.items):
+            self.assertEqual(rows[i]["section_group_id"], i)
+            self.assertEqual(rows[i]["subj_code"], item.get("subj_code"))
+            self.assertEqual(rows[i]["title"], item.get("title"))
+
+
+    def test_meetings_table(self):
+        table = self.quarter.table("meetings")
+        num_meetings = sum(
+            len(item.get(field) or [])
+            for item in self.items
+            for field in ("section_meetings", "general_meetings", "dated_meetings")
+        )
+        self.assertEqual(table.num_rows, num_meetings)
+
+        # PHYS 4D A00 final.
+        section_group_id = [item.get("number") for item in self.items].index("4D")
+        final = [
+            row for row in table.to_pylist()
+            if row["section_group_id"] == section_group_id and row["category"] == "dated"
+        ][0]
+        self.assertEqual(final["date"], datetime.date(2021, 3, 19))
+        self.assertEqual(final["type_"], "FI")
+        self.assertEqual(final["start_time"], datetime.time(11, 30))
+        self.assertEqual(final["end_time"], datetime.time(14, 29))
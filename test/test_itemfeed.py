@@ -0,0 +1,144 @@
+import os
+import tempfile
+import unittest
+
+from scrapy.exceptions import DropItem
+
+from scraper_schedule_of_classes import errors
+from scraper_schedule_of_classes.db.seat_changes import SeatChangeTracker
+from scraper_schedule_of_classes.itemfeed import ItemFeedWriter, write_item_feed, \
+    read_index, read_blocks, read_item_feed, subject_blocks, is_item_feed, index_path
+from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+
+from item_uploader import feed_work_units, seat_item, course_chunks, course_key
+from test.data import get_spider_parser_items
+
+
+class ItemFeedTest(unittest.TestCase):
+    """
+    An item feed should read back the items written to it, all of them or
+    one subject at a time, and reject a feed that doesn't match its index.
+    """
+
+    PAGES = [("BENG", 2), ("CSE", 1), ("ECE", 1), ("MATH", 1), ("PHYS", 8)]
+
+    @classmethod
+    def setUpClass(cls):
+        pipeline = CourseCleanerPipeline()
+        spider = SubjectCoursesSpider("WI21")
+        subject_items = []
+        for subject_code, page_num in cls.PAGES:
+            items = []
+            for item in get_spider_parser_items("WI21", subject_code, page_num):
+                try:
+                    items.append(dict(pipeline.process_item(item, spider)))
+                except DropItem:
+                    continue
+            subject_items.append(items)
+
+        # Subjects interleaved, like they are scraped.
+        cls.items = [item for items in zip(*subject_items) for item in items]
+
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "items.feed")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_round_trip(self):
+        # Small blocks: several per subject.
+        write_item_feed(self.items, self.path, block_size=4096)
+        self.assertTrue(is_item_feed(self.path))
+
+        blocks = read_index(self.path)
+        self.assertGreater(len(blocks), len(self.PAGES))
+        self.assertEqual(sum(block["num_items"] for block in blocks), len(self.items))
+
+        items = read_item_feed(self.path)
+        self.assertEqual(len(items), len(self.items))
+        for subject_code, _ in self.PAGES:
+            with self.subTest(subject_code=subject_code):
+                subject_items = [item for item in self.items if item["subj_code"] == subject_code]
+                self.assertEqual([item for item in items if item["subj_code"] == subject_code],
+                    subject_items)
+                self.assertEqual(read_item_feed(self.path, [subject_code], "WI21"),
+                    subject_items)
+
+
+    def test_split_blocks(self):
+        write_item_feed(self.items, self.path, block_size=4096)
+        blocks = read_index(self.path)
+        # Two readers, each with its own subjects.
+        first = subject_blocks(blocks, ["CSE", "MATH"])
+        second = subject_blocks(blocks, ["BENG", "ECE", "PHYS"])
+        items = read_blocks(self.path, first) + read_blocks(self.path, second)
+        key = lambda item: (item["subj_code"], item["number"], item["section_group_code"])
+        self.assertEqual(sorted(items, key=key), sorted(self.items, key=key))
+
+
+    def test_corrupt_feed(self):
+        write_item_feed(self.items, self.path)
+        block = read_index(self.path)[0]
+
+        with open(self.path, "r+b") as f:
+            f.seek(block["offset"] + block["length"] // 2)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xff]))
+        with self.assertRaises(errors.ItemFeedError):
+            read_blocks(self.path, [block])
+
+        with open(self.path, "ab") as f:
+            f.write(b"\0")
+        with self.assertRaises(errors.ItemFeedError):
+            read_index(self.path)
+
+        os.remove(index_path(self.path))
+        with self.assertRaises(errors.ItemFeedError):
+            read_index(self.path)
+
+
+    def test_empty_feed(self):
+        ItemFeedWriter(self.path).close()
+        self.assertEqual(read_index(self.path), [])
+        self.assertEqual(read_item_feed(self.path), [])
+
+
+    def test_work_units(self):
+        write_item_feed(self.items, self.path, block_size=4096)
+        blocks = read_index(self.path)
+        units = feed_work_units(blocks)
+
+        # One unit per subject, largest first, together all the blocks.
+        self.assertEqual(sorted(unit[0]["subj_code"] for unit in units),
+            sorted(subject_code for subject_code, _ in self.PAGES))
+        for unit in units:
+            self.assertEqual(len({block["subj_code"] for block in unit}), 1)
+        sizes = [sum(block["length"] for block in unit) for unit in units]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertEqual(sorted(block["offset"] for unit in units for block in unit),
+            sorted(block["offset"] for block in blocks))
+
+        # Workers only hand back what seat changes need of the items.
+        tracker = SeatChangeTracker(publisher=None)
+        seat_tracker = SeatChangeTracker(publisher=None)
+        for item in read_blocks(self.path, units[0]):
+            tracker.observe(item)
+            seat_tracker.observe(seat_item(item))
+        self.assertGreater(len(tracker.pending_seats), 0)
+        self.assertEqual(seat_tracker.pending_seats, tracker.pending_seats)
+
+
+    def test_course_chunks(self):
+        chunks = course_chunks(self.items, 20)
+
+        # About even chunks of whole courses: no two threads insert one.
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(self.items))
+        self.assertLessEqual(len(chunks), 20)
+        courses = [{course_key(item) for item in chunk} for chunk in chunks]
+        self.assertEqual(sum(len(chunk_courses) for chunk_courses in courses),
+            len(set.union(*courses)))
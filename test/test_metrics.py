@@ -0,0 +1,124 @@
+import time
+import unittest
+
+import scrapy
+from scrapy.exceptions import DropItem
+from scrapy.http import HtmlResponse
+
+from scraper_schedule_of_classes.errors import NoSectionMeetingsError
+from scraper_schedule_of_classes.metrics import Histogram, CrawlMetrics, \
+    CrawlMetricsExtension, COUNT_BUCKETS
+from scraper_schedule_of_classes.middlewares import ParseMetricsSpiderMiddleware
+
+
+class MetricsTestSpider(scrapy.Spider):
+    name = "metrics_test"
+
+    def parse_extra_page(self, response, subject_code, page_num):
+        pass
+
+
+class HistogramTest(unittest.TestCase):
+    """
+    Histogram buckets should be cumulative, like prometheus', with the
+    observations above the last bucket only in +Inf.
+    """
+
+    def test_buckets(self):
+        histogram = Histogram((1, 2, 5))
+        for value in (0, 1, 1.5, 5, 7):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.bucket_counts, [2, 3, 4])
+        self.assertEqual((histogram.count, histogram.sum), (5, 14.5))
+        self.assertEqual(histogram.to_prometheus("x", (("callback", "parse"), )), [
+            'x_bucket{callback="parse",le="1"} 2',
+            'x_bucket{callback="parse",le="2"} 3',
+            'x_bucket{callback="parse",le="5"} 4',
+            'x_bucket{callback="parse",le="+Inf"} 5',
+            'x_sum{callback="parse"} 14.5',
+            'x_count{callback="parse"} 5',
+        ])
+
+
+class CrawlMetricsTest(unittest.TestCase):
+    """
+    Crawl metrics should export in prometheus text format, with one TYPE
+    line per metric whatever its labels.
+    """
+
+    def test_to_prometheus(self):
+        metrics = CrawlMetrics()
+        metrics.observe("items_per_page", 3, COUNT_BUCKETS, callback="parse")
+        metrics.observe("items_per_page", 30, COUNT_BUCKETS, callback="parse_extra_page")
+        metrics.inc("items_total", 33)
+        metrics.inc("items_dropped_total", reason="DropItem")
+        metrics.inc("items_dropped_total", 2, reason="NoSectionMeetingsError")
+
+        lines = metrics.to_prometheus().splitlines()
+        self.assertEqual([line for line in lines if line.startswith("# TYPE")], [
+            "# TYPE scraper_items_per_page histogram",
+            "# TYPE scraper_items_dropped_total counter",
+            "# TYPE scraper_items_total counter",
+            "# TYPE scraper_items_per_second gauge",
+        ])
+        self.assertIn('scraper_items_per_page_bucket{callback="parse",le="5"} 1', lines)
+        self.assertIn('scraper_items_per_page_bucket{callback="parse_extra_page",le="20"} 0',
+            lines)
+        self.assertIn('scraper_items_per_page_count{callback="parse_extra_page"} 1', lines)
+        self.assertIn("scraper_items_total 33", lines)
+        self.assertIn('scraper_items_dropped_total{reason="DropItem"} 1', lines)
+        self.assertIn('scraper_items_dropped_total{reason="NoSectionMeetingsError"} 2', lines)
+        self.assertTrue(lines[-1].startswith("scraper_items_per_second "))
+
+
+class ParseMetricsTest(unittest.TestCase):
+    """
+    The parse metrics middleware should time every callback, count the
+    items (not the requests) of every page, and the extension should
+    count dropped items by reason.
+    """
+
+    def setUp(self):
+        self.metrics = CrawlMetrics()
+        self.spider = MetricsTestSpider()
+
+
+    def test_callback_timing(self):
+        request = scrapy.Request("https://act.ucsd.edu/", self.spider.parse_extra_page,
+            cb_kwargs=dict(subject_code="CSE", page_num=2))
+        response = HtmlResponse(request.url, body=b"<html></html>", request=request)
+
+        def result():
+            yield {"subj_code": "CSE"}
+            time.sleep(0.02)
+            yield scrapy.Request("https://act.ucsd.edu/?page=3")
+            yield {"subj_code": "CSE"}
+
+        middleware = ParseMetricsSpiderMiddleware(self.metrics)
+        outputs = list(middleware.process_spider_output(response, result(), self.spider))
+        self.assertEqual(len(outputs), 3)
+
+        labels = (("callback", "parse_extra_page"), )
+        parse_seconds = self.metrics.histograms[("parse_seconds", labels)]
+        self.assertEqual(parse_seconds.count, 1)
+        self.assertGreaterEqual(parse_seconds.sum, 0.02)
+        items_per_page = self.metrics.histograms[("items_per_page", labels)]
+        self.assertEqual(items_per_page.sum, 2)
+        self.assertEqual(self.metrics.subjects["CSE"]["parse_seconds"], parse_seconds.sum)
+
+
+    def test_drop_reasons(self):
+        extension = CrawlMetricsExtension(self.metrics, None, None)
+        response = HtmlResponse("https://act.ucsd.edu/", body=b"")
+        no_meetings = NoSectionMeetingsError("no section meetings")
+        extension.item_dropped({"subj_code": "CSE"}, response, DropItem("no title"), self.spider)
+        extension.item_dropped({"subj_code": "CSE"}, response, no_meetings, self.spider)
+        extension.item_dropped({"subj_code": "MATH"}, response, no_meetings, self.spider)
+
+        self.assertEqual(self.metrics.counters[("items_dropped_total",
+            (("reason", "DropItem"), ))], 1)
+        self.assertEqual(self.metrics.counters[("items_dropped_total",
+            (("reason", "NoSectionMeetingsError"), ))], 2)
+        self.assertEqual(self.metrics.subjects["CSE"]["dropped"], 2)
+        self.assertEqual(self.metrics.subjects["MATH"]["dropped"], 1)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from scraper_schedule_of_classes.profiling import StackSampler, AllocationTracker
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+class ProfilingTest(unittest.TestCase):
+    """
+    A short run of the stack sampler and the allocation tracker should
+    write a folded stack file of the busy threads only, and an allocation
+    report.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+
+    def test_stack_sampler(self):
+        stop_idle = threading.Event()
+        idle_thread = threading.Thread(target=stop_idle.wait)
+        idle_thread.start()
+
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        busy_loop(0.2)
+        sampler.stop()
+        stop_idle.set()
+        idle_thread.join()
+
+        path = os.path.join(self.tmp_dir.name, "crawl.folded")
+        sampler.write_folded(path)
+        with open(path) as f:
+            lines = f.read().splitlines()
+
+        self.assertGreater(sampler.num_samples, 0)
+        self.assertGreater(sampler.num_idle_samples, 0)
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            self.assertGreater(int(count), 0)
+            # Only the busy main thread, not the one waiting on its event.
+            self.assertNotIn("wait (threading.py", stack)
+        self.assertTrue(any("busy_loop (test_profiling.py" in line for line in lines))
+
+
+    def test_allocation_tracker(self):
+        tracker = AllocationTracker(num_frames=5, top=5)
+        tracker.start()
+        allocated = [bytearray(1000) for _ in range(1000)]
+        tracker.take_snapshot()
+        tracker.stop()
+
+        path = os.path.join(self.tmp_dir.name, "crawl-allocations.txt")
+        tracker.write_report(path)
+        with open(path) as f:
+            report = f.read()
+
+        self.assertEqual(len(tracker.peaks), 3)
+        self.assertTrue(report.startswith("time current_bytes peak_bytes\n"))
+        for section in ("Top 5 allocation sites:", "Top 5 growth since start:",
+                "Top 5 allocation tracebacks:"):
+            self.assertIn(section, report)
+        self.assertIn("test_profiling.py", report)
+        del allocated
@@ -0,0 +1,105 @@
+import tempfile
+import unittest
+
+from bs4 import BeautifulSoup
+
+from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+from scraper_schedule_of_classes.spiders.subject_courses_spider \
+    import SubjectCoursesSpider, IND_DAYS
+from scraper_schedule_of_classes.quarantine import QuarantineWriter, read_quarantine, \
+    write_quarantine, row_tags, raw_group, REASON_MEETING
+from scraper_schedule_of_classes import utils
+from reparse_quarantine import reparse_group
+import test.data
+
+
+class QuarantineCollector:
+
+    def __init__(self):
+        self.groups = []
+
+    def add(self, group, reason, error=None):
+        self.groups.append(dict(group, reason=reason, error=str(error)))
+
+
+class QuarantineTest(unittest.TestCase):
+    """
+    Quarantined row groups should parse again into the same items as the
+    page they were taken from, and groups with rows that fail to parse
+    should be quarantined.
+    """
+
+    PAGES = [("WI21", "BENG", 2), ("WI21", "CSE", 1), ("WI21", "ECE", 1),
+        ("WI21", "MATH", 1), ("WI21", "PHYS", 8)]
+
+    def setUp(self):
+        self.spider = SubjectCoursesSpider("WI21", subject_codes=[])
+
+
+    def tag_groups(self, quarter_code, subject_code, page_num):
+        html = test.data.get_html_binary(quarter_code, subject_code, page_num)
+        tags = BeautifulSoup(html, "lxml").find_all(utils.tag_matches_any)
+        return list(self.spider.group_tags(tags))
+
+
+    def test_round_trip(self):
+        for (quarter_code, subject_code, page_num) in self.PAGES:
+            for tag_group in self.tag_groups(quarter_code, subject_code, page_num):
+                group = raw_group(tag_group, quarter_code, subject_code, page_num)
+                with self.subTest(rows=group["rows"][0]):
+                    self.assertEqual(
+                        self.spider.build_item_from_group(row_tags(group["rows"]),
+                            subject_code, quarter_code),
+                        self.spider.build_item_from_group(tag_group, subject_code, quarter_code))
+
+
+    def test_quarantine_failed_meeting(self):
+        tag_group = next(group for group in self.tag_groups("WI21", "CSE", 1) if len(group) > 2)
+        group = raw_group(tag_group, "WI21", "CSE", 1)
+        # Unparseable days in the last meeting row.
+        group["rows"][-1][1][IND_DAYS] = "??"
+
+        self.spider.quarantine = QuarantineCollector()
+        item = self.spider.build_item_from_group(row_tags(group["rows"]), "CSE", "WI21", 1)
+
+        self.assertIsNotNone(item)
+        self.assertEqual(item["raw_group"]["rows"], group["rows"])
+        self.assertEqual(len(self.spider.quarantine.groups), 1)
+        quarantined = self.spider.quarantine.groups[0]
+        self.assertEqual(quarantined["reason"], REASON_MEETING)
+        self.assertEqual((quarantined["quarter_code"], quarantined["subject_code"],
+            quarantined["page_num"]), ("WI21", "CSE", 1))
+
+
+    def test_reparse(self):
+        cleaner = CourseCleanerPipeline()
+        tag_group = next(group for group in self.tag_groups("WI21", "CSE", 1) if len(group) > 2)
+        group = dict(raw_group(tag_group, "WI21", "CSE", 1), reason=REASON_MEETING, error="")
+
+        item, still_failing = reparse_group(self.spider, cleaner, group)
+        self.assertIsNone(still_failing)
+        self.assertEqual(item, cleaner.process_item(
+            self.spider.build_item_from_group(tag_group, "CSE", "WI21"), self.spider))
+
+        group["rows"][-1][1][IND_DAYS] = "??"
+        item, still_failing = reparse_group(self.spider, cleaner, group)
+        self.assertEqual(still_failing["reason"], REASON_MEETING)
+
+
+    def test_file(self):
+        tag_group = self.tag_groups("WI21", "ECE", 1)[1]
+        group = raw_group(tag_group, "WI21", "ECE", 1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = f"{tmp_dir}/quarantine.jsonl.gz"
+            for i in range(2):
+                writer = QuarantineWriter(path)
+                writer.add(group, REASON_MEETING, "bad days")
+                writer.close()
+
+            groups = read_quarantine(path)
+            self.assertEqual(len(groups), 2)
+            self.assertEqual(groups[0], dict(group, reason=REASON_MEETING, error="bad days"))
+
+            write_quarantine(path, groups[:1])
+            self.assertEqual(read_quarantine(path), groups[:1])
+
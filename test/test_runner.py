@@ -0,0 +1,63 @@
+import unittest
+
+import scrapy
+from scrapy.settings import Settings
+
+from scraper_schedule_of_classes.runner import ReusableCrawlRunner
+from test.mock_server import MockScheduleServer, SyntheticSchedule
+
+
+class StatusSpider(scrapy.Spider):
+    name = "status"
+    custom_settings = {"HTTPERROR_ALLOW_ALL": True}
+
+    def __init__(self, url=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = url
+
+    async def start(self):
+        yield scrapy.Request(self.url, callback=self.parse)
+
+    def parse(self, response):
+        yield {"status": response.status}
+
+
+class ReusableCrawlRunnerTest(unittest.TestCase):
+    """
+    One runner, with its reactor started once, should run crawl after crawl.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = MockScheduleServer(SyntheticSchedule(num_subjects=1)).start()
+        cls.runner = ReusableCrawlRunner(Settings({
+            "LOG_ENABLED": False,
+            "TELNETCONSOLE_ENABLED": False,
+        })).start()
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.runner.stop()
+        cls.server.stop()
+
+
+    def test_crawls(self):
+        for i in range(3):
+            items = []
+            crawler = self.runner.crawl(StatusSpider, url=f"{self.server.url}/missing",
+                item_scraped=lambda item, response, spider: items.append(item))
+
+            self.assertEqual(items, [{"status": 404}])
+            self.assertEqual(crawler.stats.get_value("finish_reason"), "finished")
+            self.assertTrue(self.runner.started)
+
+
+    def test_crawl_settings(self):
+        settings = Settings({"LOG_ENABLED": False, "TELNETCONSOLE_ENABLED": False,
+            "USER_AGENT": "warm"})
+        crawler = self.runner.crawl(StatusSpider, settings=settings,
+            url=f"{self.server.url}/missing")
+
+        self.assertEqual(crawler.settings.get("USER_AGENT"), "warm")
+        self.assertNotEqual(self.runner.runner.settings.get("USER_AGENT"), "warm")
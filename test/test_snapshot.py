@@ -0,0 +1,74 @@
+import tempfile
+import unittest
+
+from scrapy.exceptions import DropItem
+
+from scraper_schedule_of_classes import utils
+from scraper_schedule_of_classes.errors import SnapshotError
+from scraper_schedule_of_classes.pipelines import CourseCleanerPipeline
+from scraper_schedule_of_classes.snapshot import Snapshot, write_snapshot, NO_SEATS
+from scraper_schedule_of_classes.spiders.subject_courses_spider import SubjectCoursesSpider
+
+from test.data import get_spider_parser_items
+
+
+class SnapshotTest(unittest.TestCase):
+    """
+    A snapshot written from CourseMeetings items should read back the
+    same section groups and meetings.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        pipeline = CourseCleanerPipeline()
+        spider = SubjectCoursesSpider("WI21")
+        cls.items = []
+        for item in get_spider_parser_items("WI21", "MATH", 1):
+            try:
+                cls.items.append(pipeline.process_item(item, spider))
+            except DropItem:
+                continue
+
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.path = f"{cls.tmp_dir.name}/WI21.snapshot"
+        write_snapshot(cls.items, cls.path)
+
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+
+    def test_section_groups(self):
+        with Snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot.section_groups), len(self.items))
+            for record, item in zip(snapshot.section_groups, self.items):
+                self.assertEqual(snapshot.string(record["subj_code"]), item.get("subj_code"))
+                self.assertEqual(snapshot.string(record["number"]), item.get("number"))
+                self.assertEqual(snapshot.string(record["title"]), item.get("title"))
+                self.assertEqual(snapshot.string(record["instructor"]), item.get("instructor"))
+
+
+    def test_section_meetings(self):
+        # WI21 MATH 2, A01 discussion.
+        with Snapshot(self.path) as snapshot:
+            meeting = snapshot.section_group_meetings(0)[0]
+            self.assertEqual(utils.MEETING_TYPES[meeting["type_"]], "DI")
+            self.assertEqual(meeting["days"], utils.days_to_mask("Tu"))
+            self.assertEqual(meeting["start_time"], 14 * 60)
+            self.assertEqual(meeting["end_time"], 14 * 60 + 50)
+            self.assertEqual(meeting["sec_id"], 27080)
+            self.assertEqual(meeting["seats_avail"], 25)
+            self.assertEqual(snapshot.string(meeting["number"]), "A01")
+
+            general_meeting = snapshot.section_group_meetings(0)[1]
+            self.assertEqual(general_meeting["seats_avail"], NO_SEATS)
+            self.assertEqual(general_meeting["essential"], 1)
+
+
+    def test_not_a_snapshot(self):
+        path = f"{self.tmp_dir.name}/not_a_snapshot"
+        with open(path, "wb") as f:
+            f.write(b"\0" * 128)
+        with self.assertRaises(SnapshotError):
+            Snapshot(path)
@@ -1,9 +1,15 @@
 import datetime
+import re
 
+import scrapy
+from scraper_schedule_of_classes.db.db import DataAccess
 from scraper_schedule_of_classes.spiders.subject_courses_spider \
-    import SubjectCoursesSpider
+    import SubjectCoursesSpider, PAGE_NUM_REGEX
+from scraper_schedule_of_classes.fastparse import FastPageParser
 from scraper_schedule_of_classes import utils
 from bs4 import BeautifulSoup
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
 
 from test.meeting_comparator import MeetingComparator
 import test.data
@@ -142,4 +148,231 @@ class CoursesSpiderBuildItemTest(MeetingComparator):
             )
         ]
 
-        self.compare_meeting_item_lists(nonenrtxt_meetings_exp, item.get("nonenrtxt_meetings"))
\ No newline at end of file
+        self.compare_meeting_item_lists(nonenrtxt_meetings_exp, item.get("nonenrtxt_meetings"))
+
+class ParseComparator(MeetingComparator):
+    """
+    Compares what parse yields for a page with an opt in parse setting
+    to what it yields parsing the whole page with bs4.
+    """
+
+    PAGES = [("CSE", 1), ("PHYS", 8), ("ECE", 1), ("MATH", 1), ("BENG", 2)]
+
+    def parse_with(self, html, subject_code, settings):
+        response = HtmlResponse(test.data.SCHEDULE_OF_CLASSES_URL, body=html)
+        spider = SubjectCoursesSpider("WI21", subject_codes=[])
+        spider.settings = Settings(settings)
+        return list(spider.parse(response, subject_code, "WI21")), spider
+
+
+    def assert_same_outputs(self, outputs_exp, outputs):
+        self.assertEqual(len(outputs_exp), len(outputs))
+        for output_exp, output in zip(outputs_exp, outputs):
+            if isinstance(output_exp, scrapy.Request):
+                self.assertEqual(output_exp.url, output.url)
+            else:
+                self.assertEqual(output_exp, output)
+
+
+class CoursesSpiderStreamingParseTest(ParseComparator):
+    """
+    The streaming parse should produce exactly the same items and
+    requests as parsing the whole page with bs4, and record the same page
+    count, pages without rows or without a page count included.
+    """
+
+    def parse_both(self, html, subject_code):
+        outputs_exp, spider_exp = self.parse_with(html, subject_code, {"STREAMING_PARSE": False})
+        outputs, spider = self.parse_with(html, subject_code, {"STREAMING_PARSE": True})
+        self.assertEqual(spider_exp.subject_num_pages, spider.subject_num_pages)
+        self.assertEqual(spider_exp.checkpoint.num_pages, spider.checkpoint.num_pages)
+        self.assertEqual(spider_exp.checkpoint.pages_done, spider.checkpoint.pages_done)
+        return outputs_exp, outputs
+
+
+    def test_streaming_parse_first_page(self):
+        for subject_code, page_num in self.PAGES:
+            with self.subTest(subject_code = subject_code, page_num = page_num):
+                html = test.data.get_html_binary("WI21", subject_code, page_num)
+                outputs_exp, outputs = self.parse_both(html, subject_code)
+                self.assertGreater(len(outputs_exp), 0)
+                self.assert_same_outputs(outputs_exp, outputs)
+
+        # PHYS has pages 2 to 10 to request.
+        html = test.data.get_html_binary("WI21", "PHYS", 8)
+        outputs = self.parse_both(html, "PHYS")[1]
+        self.assertEqual([output.cb_kwargs["page_num"] for output in outputs
+            if isinstance(output, scrapy.Request)], list(range(2, 11)))
+
+
+    def test_streaming_parse_no_rows(self):
+        # The page up to its first course header.
+        html = test.data.get_html_binary("WI21", "PHYS", 8)
+        html = html[:html.rfind(b"<tr", 0, html.find(b"crsheader"))] + b"</table></body></html>"
+        self.assertEqual(BeautifulSoup(html, "lxml").find_all(utils.tag_matches_any), [])
+
+        outputs_exp, outputs = self.parse_both(html, "PHYS")
+        # Only the requests of the other pages.
+        self.assertEqual(len(outputs_exp), 9)
+        self.assert_same_outputs(outputs_exp, outputs)
+
+
+    def test_streaming_parse_no_pages(self):
+        html = test.data.get_html_binary("WI21", "CSE", 1)
+        no_page_count = re.sub(rb'Page \([0-9]+&nbsp;of&nbsp;[0-9]+\)', b'', html)
+        self.assertNotEqual(no_page_count, html)
+        no_results = b"<html><body><p>No Result Found.</p></body></html>"
+
+        for html in (no_page_count, no_results):
+            outputs_exp, outputs = self.parse_both(html, "CSE")
+            self.assertEqual((outputs_exp, outputs), ([], []))
+
+    def test_streaming_parse_same_items(self):
+        quarter_code = "WI21"
+        for subject_code, page_num in [("CSE", 1), ("PHYS", 8), ("ECE", 1), ("MATH", 1), ("BENG", 2)]:
+            with self.subTest(subject_code = subject_code, page_num = page_num):
+                html = test.data.get_html_binary(quarter_code, subject_code, page_num)
+                response = HtmlResponse(test.data.SCHEDULE_OF_CLASSES_URL, body=html)
+                spider = SubjectCoursesSpider(quarter_code)
+
+                items_exp = list(spider.parse_extra_page(response, subject_code))
+                spider.settings = Settings({"STREAMING_PARSE": True})
+                items = list(spider.parse_extra_page(response, subject_code))
+
+                self.assertEqual(len(items_exp), len(items))
+                for item_exp, item in zip(items_exp, items):
+                    self.assertEqual(item_exp.get("number"), item.get("number"))
+                    self.assertEqual(item_exp.get("title"), item.get("title"))
+                    self.compare_meeting_items(item_exp.get("first_meeting"), item.get("first_meeting"))
+                    self.compare_meeting_item_lists(item_exp.get("sectxt_meetings", []), item.get("sectxt_meetings", []))
+                    self.compare_meeting_item_lists(item_exp.get("nonenrtxt_meetings", []), item.get("nonenrtxt_meetings", []))
+
+
+class CoursesSpiderFastParseTest(ParseComparator):
+    """
+    The fast parse should produce exactly the same items and requests as
+    parsing the whole page with bs4, including for the rows it hands to
+    bs4.
+    """
+
+    def parse_both(self, html, subject_code):
+        outputs_exp = self.parse_with(html, subject_code, {"FAST_PARSE": False})[0]
+        outputs = self.parse_with(html, subject_code, {"FAST_PARSE": True})[0]
+        return outputs_exp, outputs
+
+
+    def test_fast_parse_same_items(self):
+        for subject_code, page_num in self.PAGES:
+            with self.subTest(subject_code = subject_code, page_num = page_num):
+                html = test.data.get_html_binary("WI21", subject_code, page_num)
+                outputs_exp, outputs = self.parse_both(html, subject_code)
+                self.assertGreater(len(outputs_exp), 0)
+                self.assert_same_outputs(outputs_exp, outputs)
+
+                page_parser = FastPageParser(html)
+                self.assertEqual(page_parser.num_fallback_rows, 0)
+                self.assertEqual(page_parser.get_num_pages(PAGE_NUM_REGEX),
+                    SubjectCoursesSpider("WI21").get_num_pages(BeautifulSoup(html, "lxml")))
+
+
+    def test_fast_parse_fallback_rows(self):
+        html = test.data.get_html_binary("WI21", "CSE", 1)
+        # A comment in a cell, an unclosed row and an unclosed cell.
+        html = html.replace(b'<td class="brdr">A00', b'<td class="brdr"><!-- x -->A00', 1)
+        html = re.sub(rb'(<tr class="sectxt">.*?)</tr>', rb'\1', html, count=1, flags=re.S)
+        html = re.sub(rb'</td>(\s*)</tr>', rb'\1</tr>', html, count=1)
+
+        page_parser = FastPageParser(html)
+        num_tags = len(list(page_parser.iter_tags()))
+        self.assertEqual(num_tags, len(BeautifulSoup(html, "lxml").find_all(utils.tag_matches_any)))
+        # Only the rows changed.
+        self.assertIn(page_parser.num_fallback_rows, (1, 2, 3))
+        self.assert_same_outputs(*self.parse_both(html, "CSE"))
+
+
+class CoursesSpiderSchedulingTest(MeetingComparator):
+    """
+    Subjects with the most pages in the previous crawl should be
+    requested first.
+    """
+
+    def test_num_pages_multiple_digits(self):
+        spider = SubjectCoursesSpider("WI21", subject_codes=[])
+        soup = BeautifulSoup(test.data.get_html_binary("WI21", "MATH", 1), "lxml")
+        self.assertEqual(spider.get_num_pages(soup), 11)
+
+
+    def test_largest_subjects_first(self):
+        spider = SubjectCoursesSpider("WI21", subject_codes=["CSE", "MATH", "NEW", "ECE"])
+        spider.prev_num_pages = {"CSE": 3, "MATH": 11, "ECE": 5}
+
+        requests = list(spider.start_requests())
+        subject_codes = [request.cb_kwargs["subject_code"] for request in requests]
+        # Unknown subjects first, then by page count.
+        self.assertEqual(subject_codes, ["NEW", "MATH", "ECE", "CSE"])
+        self.assertEqual([request.priority for request in requests], [12, 11, 5, 3])
+
+
+    def test_given_page_counts(self):
+        # Subjects and page counts handed over: no database needed.
+        get_conn = vars(DataAccess)["get_conn"]
+        def no_conn():
+            raise AssertionError("database read")
+        DataAccess.get_conn = no_conn
+        try:
+            spider = SubjectCoursesSpider("WI21", subject_codes=["CSE", "MATH"],
+                prev_num_pages={"CSE": 3, "MATH": 11})
+            requests = list(spider.start_requests())
+            single_requests = list(SubjectCoursesSpider("WI21", subject_codes=["CSE"]).start_requests())
+        finally:
+            DataAccess.get_conn = get_conn
+
+        self.assertEqual([request.cb_kwargs["subject_code"] for request in requests],
+            ["MATH", "CSE"])
+        self.assertEqual([request.priority for request in single_requests], [1])
+
+
+    def test_shard_from_plan(self):
+        # The spider reads the plan on a connection of its own.
+        conn = DataAccess.get_conn()
+        with conn:
+            DataAccess.save_shard_plan(conn, "TE99", [["MATH"], ["CSE", "ECE"]])
+        try:
+            spider = SubjectCoursesSpider("TE99", shard="1/2")
+        finally:
+            with conn:
+                DataAccess.execute_str(conn, "DELETE FROM shard_plan WHERE quarter_code = %s;",
+                    ("TE99", ))
+            DataAccess.put_conn(conn)
+        self.assertEqual(spider.subject_codes, ["CSE", "ECE"])
+
+
+    def test_multiple_quarters(self):
+        spider = SubjectCoursesSpider("WI21,SP21", subject_codes=["CSE", "MATH"])
+        spider.prev_num_pages = {"CSE": 3, "MATH": 11}
+
+        requests = list(spider.start_requests())
+        self.assertEqual(
+            [(r.cb_kwargs["subject_code"], r.cb_kwargs["quarter_code"]) for r in requests],
+            [("MATH", "WI21"), ("MATH", "SP21"), ("CSE", "WI21"), ("CSE", "SP21")])
+        self.assertIn("selectedTerm=SP21", requests[1].url)
+
+        html = test.data.get_html_binary("WI21", "ECE", 1)
+        response = HtmlResponse(test.data.SCHEDULE_OF_CLASSES_URL, body=html)
+        items = list(spider.parse_extra_page(response, "ECE", "SP21"))
+        self.assertTrue(items)
+        self.assertTrue(all(item.get("quarter_code") == "SP21" for item in items))
+
+
+    def test_quarter_download_slots(self):
+        spider = SubjectCoursesSpider("WI21,SP21", subject_codes=["CSE"])
+        spider.prev_num_pages = {}
+        # Shared by default.
+        spider.settings = Settings({})
+        self.assertTrue(all("download_slot" not in r.meta for r in spider.start_requests()))
+
+        spider.settings = Settings({"QUARTER_DOWNLOAD_SLOTS": True})
+        requests = list(spider.start_requests()) + \
+            list(spider.extra_page_requests(2, "CSE", "SP21"))
+        self.assertEqual([r.meta["download_slot"] for r in requests],
+            ["act.ucsd.edu:WI21", "act.ucsd.edu:SP21", "act.ucsd.edu:SP21"])
@@ -0,0 +1,59 @@
+import datetime
+import unittest
+
+from scraper_schedule_of_classes import errors, utils
+
+
+class EncodedDaysTimesTest(unittest.TestCase):
+    """
+    Day masks and minute offsets used for conflict checks.
+    """
+
+    def test_days_to_mask(self):
+        self.assertEqual(utils.days_to_mask("M"), 0b1)
+        self.assertEqual(utils.days_to_mask("TuTh"), 0b1010)
+        self.assertEqual(utils.days_to_mask("MWF"), 0b10101)
+        self.assertEqual(utils.days_to_mask("S"), 0b100000)
+        self.assertEqual(utils.days_to_mask("Su"), 0b1000000)
+        self.assertEqual(utils.days_to_mask(None), 0)
+
+
+    def test_time_to_minutes(self):
+        self.assertEqual(utils.time_to_minutes(datetime.time(0, 0)), 0)
+        self.assertEqual(utils.time_to_minutes(datetime.time(15, 30)), 930)
+        self.assertIsNone(utils.time_to_minutes(None))
+
+
+class ShardSubjectsTest(unittest.TestCase):
+    """
+    Subjects should be split into disjoint, size-balanced shards, the same
+    way for every worker.
+    """
+
+    page_counts = {"MATH": 11, "PHYS": 8, "CSE": 6, "ECE": 5, "BENG": 2, "BILD": 3}
+    subject_codes = ["BENG", "BILD", "CSE", "ECE", "MATH", "PHYS", "NEW"]
+
+    def test_disjoint_and_complete(self):
+        shards = utils.shard_subjects(self.subject_codes, self.page_counts, 3)
+        all_codes = [code for shard in shards for code in shard]
+        self.assertEqual(sorted(all_codes), sorted(self.subject_codes))
+
+
+    def test_balanced(self):
+        shards = utils.shard_subjects(self.subject_codes, self.page_counts, 3)
+        loads = [sum(self.page_counts.get(code, 1) for code in shard) for shard in shards]
+        self.assertEqual(sorted(loads), [11, 12, 13])
+
+
+    def test_deterministic(self):
+        shards = utils.shard_subjects(self.subject_codes, self.page_counts, 3)
+        shuffled = utils.shard_subjects(list(reversed(self.subject_codes)), self.page_counts, 3)
+        self.assertEqual(shards, shuffled)
+
+
+    def test_parse_shard_spec(self):
+        self.assertEqual(utils.parse_shard_spec("1/4"), (1, 4))
+        with self.assertRaises(errors.ShardSpecError):
+            utils.parse_shard_spec("4/4")
+        with self.assertRaises(errors.ShardSpecError):
+            utils.parse_shard_spec("MATH")